@@ -170,3 +170,19 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL')
 # MEDIA_ROOT and MEDIA_URL for file uploads
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
+
+# Cache for pre-rendered analytics responses (weddings/analytics_cache.py).
+# File-based so every worker process sees the same per-wedding versions.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+ANALYTICS_CACHE_TIMEOUT = 60 * 60
+
+# Keep a running PledgeTotals row per wedding for the live contribution board
+PLEDGE_TOTALS_DENORMALIZED = True
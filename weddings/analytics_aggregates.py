@@ -0,0 +1,163 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import (
+    Avg, Count, DecimalField, DurationField, ExpressionWrapper, F, Q, Sum, Value,
+)
+from django.db.models.functions import Coalesce, NullIf
+
+from .models import Budget, Guest, Task, Timeline, Vendor
+
+ZERO = Decimal('0.00')
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+CENTS = Decimal('0.01')
+
+OPEN_TASK_STATUSES = ['todo', 'in_progress']
+
+# Zero quotes are treated as "no quote yet" and left out of the average
+AVERAGE_QUOTE = Avg('quote', filter=Q(quote__isnull=False) & ~Q(quote=0))
+
+
+def _money(value):
+    """Normalise an aggregate result to a 2dp Decimal"""
+    if value is None:
+        return ZERO
+    return Decimal(value).quantize(CENTS)
+
+
+class WeddingAggregates:
+    """One aggregate query per related table.
+
+    Every method returns plain values (money stays Decimal) so the caller
+    can fill a WeddingAnalytics row without loading model instances.
+    """
+
+    @staticmethod
+    def budget(wedding_id):
+        """Estimated/actual totals and the per-category breakdown (GROUP BY category)"""
+        rows = (
+            Budget.objects.filter(wedding_id=wedding_id)
+            .values('category')
+            .annotate(
+                estimated=Coalesce(Sum('estimated_cost'), Value(ZERO), output_field=MONEY),
+                actual=Coalesce(Sum('actual_cost'), Value(ZERO), output_field=MONEY),
+                count=Count('id'),
+            )
+            .order_by('category')
+        )
+        categories = {
+            row['category']: {
+                'estimated': _money(row['estimated']),
+                'actual': _money(row['actual']),
+                'count': row['count'],
+            }
+            for row in rows
+        }
+        return {
+            'estimated': sum((c['estimated'] for c in categories.values()), ZERO),
+            'actual': sum((c['actual'] for c in categories.values()), ZERO),
+            'categories': categories,
+        }
+
+    @staticmethod
+    def tasks(wedding_id, today=None):
+        """Task counts by status, including open tasks past their due date"""
+        today = today or date.today()
+        return Task.objects.filter(wedding_id=wedding_id).aggregate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(status='done')),
+            pending=Count('id', filter=Q(status__in=OPEN_TASK_STATUSES)),
+            overdue=Count('id', filter=Q(status__in=OPEN_TASK_STATUSES, due_date__lt=today)),
+        )
+
+    @staticmethod
+    def vendors(wedding_id):
+        """Vendor counts, average non-zero quote and committed cost"""
+        totals = Vendor.objects.filter(wedding_id=wedding_id).aggregate(
+            total=Count('id'),
+            booked=Count('id', filter=Q(status='booked')),
+            average_quote=AVERAGE_QUOTE,
+            # final_amount wins over quote; zero amounts count as "not set"
+            total_cost=Coalesce(
+                Sum(Coalesce(NullIf('final_amount', Value(ZERO)), NullIf('quote', Value(ZERO)))),
+                Value(ZERO),
+                output_field=MONEY,
+            ),
+        )
+        totals['average_quote'] = _money(totals['average_quote'])
+        totals['total_cost'] = _money(totals['total_cost'])
+        return totals
+
+    @staticmethod
+    def average_vendor_quote(wedding_id):
+        """Average non-zero vendor quote on its own"""
+        average = Vendor.objects.filter(wedding_id=wedding_id).aggregate(
+            average=AVERAGE_QUOTE
+        )['average']
+        return _money(average)
+
+    @staticmethod
+    def timeline(wedding_id, today=None):
+        """Milestone completion keyed by event type label, in date order"""
+        today = today or date.today()
+        labels = dict(Timeline.EVENT_TYPES)
+        events = (
+            Timeline.objects.filter(wedding_id=wedding_id)
+            .order_by('date')
+            .values_list('event_type', 'is_completed', 'date')
+        )
+        milestones = {}
+        for event_type, is_completed, event_date in events:
+            milestones[labels.get(event_type, event_type)] = {
+                'completed': is_completed,
+                'date': event_date.isoformat(),
+                'days_until': (event_date - today).days,
+            }
+        return milestones
+
+    @staticmethod
+    def average_response_days(wedding_id):
+        """Average days from invitation to first RSVP response, over guests who responded"""
+        average = Guest.objects.filter(
+            wedding_id=wedding_id, rsvp_responded_at__isnull=False
+        ).aggregate(
+            average=Avg(
+                ExpressionWrapper(F('rsvp_responded_at') - F('created_at'), output_field=DurationField())
+            )
+        )['average']
+        if average is None:
+            return 0
+        return round(average.total_seconds() / 86400)
+
+    @staticmethod
+    def snapshot_counts(wedding_ids):
+        """Weekly snapshot values for many weddings, one GROUP BY wedding query per table"""
+        counts = {
+            wedding_id: {
+                'confirmed_count': 0,
+                'pending_count': 0,
+                'spending_to_date': ZERO,
+                'tasks_completed': 0,
+                'tasks_pending': 0,
+            }
+            for wedding_id in wedding_ids
+        }
+        grouped = [
+            Guest.objects.filter(wedding_id__in=wedding_ids).values('wedding_id').annotate(
+                confirmed_count=Count('id', filter=Q(rsvp_status='confirmed')),
+                pending_count=Count('id', filter=Q(rsvp_status='pending')),
+            ),
+            Budget.objects.filter(wedding_id__in=wedding_ids).values('wedding_id').annotate(
+                spending_to_date=Coalesce(Sum('actual_cost'), Value(ZERO), output_field=MONEY),
+            ),
+            Task.objects.filter(wedding_id__in=wedding_ids).values('wedding_id').annotate(
+                tasks_completed=Count('id', filter=Q(status='done')),
+                tasks_pending=Count('id', filter=Q(status__in=OPEN_TASK_STATUSES)),
+            ),
+        ]
+        for rows in grouped:
+            for row in rows.order_by():
+                counts[row.pop('wedding_id')].update(row)
+        for values in counts.values():
+            values['spending_to_date'] = _money(values['spending_to_date'])
+        return counts
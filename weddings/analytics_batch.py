@@ -0,0 +1,102 @@
+"""Fleet-wide analytics recompute used by the recompute_analytics command.
+
+Worker processes are started with the "spawn" method so each one opens its
+own database connections instead of sharing the parent's sockets. Model
+imports therefore happen inside the functions: a spawned worker imports
+this module before django.setup() has run in it.
+"""
+import time
+from datetime import date
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def analytics_fields():
+    from .models import WeddingAnalytics
+    return [
+        field.name for field in WeddingAnalytics._meta.concrete_fields
+        if not field.primary_key and field.name != 'wedding'
+    ]
+
+
+def compute_chunk(wedding_ids, today=None):
+    """Compute analytics and engagement values for a chunk of weddings.
+
+    Nothing is written here; the parent process saves the returned plain
+    values with bulk_update.
+    """
+    from .analytics_pipeline import AnalyticsPipeline
+    from .models import Wedding, WeddingAnalytics
+
+    today = today or date.today()
+    fields = analytics_fields()
+    results = []
+    for wedding in Wedding.objects.filter(pk__in=wedding_ids).order_by('pk'):
+        started = time.perf_counter()
+        pipeline = AnalyticsPipeline(wedding, today)
+        analytics = pipeline.populate(WeddingAnalytics(wedding=wedding))
+        engagement = pipeline.engagement_values()
+        results.append({
+            'wedding_id': wedding.pk,
+            'analytics': {field: getattr(analytics, field) for field in fields},
+            'engagement': engagement,
+            'seconds': time.perf_counter() - started,
+        })
+    return results
+
+
+def write_results(results, started_at):
+    """Save one chunk of computed values with bulk writes"""
+    from django.db import transaction
+    from django.utils import timezone
+
+    from .analytics_cache import AnalyticsCache
+    from .models import AnalyticsDirtyMark, GuestEngagementMetrics, WeddingAnalytics
+
+    if not results:
+        return
+    now = timezone.now()
+    wedding_ids = [result['wedding_id'] for result in results]
+    fields = analytics_fields()
+
+    with transaction.atomic():
+        WeddingAnalytics.objects.bulk_create(
+            [WeddingAnalytics(wedding_id=wedding_id) for wedding_id in wedding_ids],
+            ignore_conflicts=True,
+        )
+        rows = WeddingAnalytics.objects.in_bulk(wedding_ids, field_name='wedding_id')
+        for result in results:
+            row = rows[result['wedding_id']]
+            for field, value in result['analytics'].items():
+                setattr(row, field, value)
+            row.last_updated = now
+        WeddingAnalytics.objects.bulk_update(rows.values(), fields)
+
+        # Engagement rows are not unique per wedding; keep using the first one
+        metrics = {}
+        for row in GuestEngagementMetrics.objects.filter(wedding_id__in=wedding_ids).order_by('-pk'):
+            metrics[row.wedding_id] = row
+        missing = []
+        for result in results:
+            row = metrics.get(result['wedding_id'])
+            if row is None:
+                row = GuestEngagementMetrics(wedding_id=result['wedding_id'], created_at=now)
+                missing.append(row)
+            for field, value in result['engagement'].items():
+                setattr(row, field, value)
+            row.updated_at = now
+        GuestEngagementMetrics.objects.bulk_create(missing)
+        GuestEngagementMetrics.objects.bulk_update(
+            list(metrics.values()), list(results[0]['engagement']) + ['updated_at']
+        )
+
+        # Marks set after this run started stay queued for the worker
+        AnalyticsDirtyMark.objects.filter(
+            wedding_id__in=wedding_ids, last_marked_at__lt=started_at
+        ).delete()
+
+    for wedding_id in wedding_ids:
+        AnalyticsCache.bump(wedding_id)
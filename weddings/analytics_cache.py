@@ -0,0 +1,130 @@
+import time
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+STAT_NAMES = ['hits', 'misses', 'evictions', 'invalidations']
+VALIDATOR_HEADERS = ['ETag', 'Last-Modified']
+
+
+def _cache():
+    return caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 60 * 60)
+
+
+def _incr(key, delta=1):
+    cache = _cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+class AnalyticsCache:
+    """Versioned cache of rendered analytics responses.
+
+    Every entry key embeds the wedding's current version number, so bumping
+    the version on a write makes all of that wedding's entries unreachable
+    at once; they are left to expire instead of being deleted one by one.
+    """
+
+    @staticmethod
+    def version(wedding_id):
+        cache = _cache()
+        key = f'analytics:version:{wedding_id}'
+        version = cache.get(key)
+        if version is None:
+            # Start from the clock so a version lost from the cache can never
+            # be reissued and resurrect entries stored under it
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def bump(wedding_id):
+        """Invalidate every cached response for a wedding"""
+        AnalyticsCache.version(wedding_id)
+        _incr(f'analytics:version:{wedding_id}')
+        _incr('analytics:stats:invalidations')
+
+    @staticmethod
+    def key(name, wedding_id, user_id):
+        # The date is part of the key because days-until changes at midnight
+        version = AnalyticsCache.version(wedding_id)
+        return f'analytics:response:{name}:{wedding_id}:{user_id}:{version}:{date.today().isoformat()}'
+
+    @staticmethod
+    def get(key):
+        cache = _cache()
+        body = cache.get(key)
+        if body is not None:
+            _incr('analytics:stats:hits')
+            return body
+
+        _incr('analytics:stats:misses')
+        if cache.get(f'{key}:stored'):
+            # Stored under the current version but gone: culled or expired
+            _incr('analytics:stats:evictions')
+            cache.delete(f'{key}:stored')
+        return None
+
+    @staticmethod
+    def set(key, body):
+        cache = _cache()
+        cache.set(key, body, timeout=_timeout())
+        cache.set(f'{key}:stored', True, timeout=None)
+
+    @staticmethod
+    def stats():
+        cache = _cache()
+        values = cache.get_many([f'analytics:stats:{name}' for name in STAT_NAMES])
+        stats = {name: values.get(f'analytics:stats:{name}', 0) for name in STAT_NAMES}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / lookups * 100) if lookups else 0
+        return stats
+
+    @staticmethod
+    def reset_stats():
+        _cache().delete_many([f'analytics:stats:{name}' for name in STAT_NAMES])
+
+
+def cached_analytics(name):
+    """Serve a wedding analytics view from the cache as pre-rendered JSON.
+
+    Apply below @api_view so the request is already authenticated; entries
+    are per user, so a hit never skips the ownership check of the view.
+    Validators set by the view are stored with the body, so a hit can still
+    answer 304 Not Modified.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, wedding_id, *args, **kwargs):
+            key = AnalyticsCache.key(name, wedding_id, request.user.pk)
+            entry = AnalyticsCache.get(key)
+            if entry is not None:
+                body, validators = entry
+                response = HttpResponse(body, content_type='application/json')
+                for header, value in validators.items():
+                    response[header] = value
+                if 'ETag' in validators:
+                    return get_conditional_response(request, etag=validators['ETag'], response=response)
+                return response
+
+            response = view(request, wedding_id, *args, **kwargs)
+            if response.status_code == 200:
+                validators = {
+                    header: response[header] for header in VALIDATOR_HEADERS if header in response
+                }
+                AnalyticsCache.set(key, (JSONRenderer().render(response.data), validators))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,230 @@
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics_aggregates import OPEN_TASK_STATUSES, ZERO, WeddingAggregates
+from .analytics_service import WeddingAnalyticsService
+from .models import Budget, Guest, Task, Timeline, Vendor, WeddingAnalytics
+
+
+def _guest_counters(values, today):
+    return {
+        'total_invitations_sent': 1,
+        f"total_{values['rsvp_status']}": 1,
+        'total_guest_count': values['number_of_guests'],
+    }, None
+
+
+def _task_counters(values, today):
+    is_open = values['status'] in OPEN_TASK_STATUSES
+    is_overdue = is_open and values['due_date'] is not None and values['due_date'] < today
+    return {
+        'total_tasks': 1,
+        'completed_tasks': int(values['status'] == 'done'),
+        'pending_tasks': int(is_open),
+        'overdue_tasks': int(is_overdue),
+    }, None
+
+
+def _budget_counters(values, today):
+    estimated = values['estimated_cost'] or ZERO
+    actual = values['actual_cost'] or ZERO
+    counters = {
+        'total_estimated_budget': estimated,
+        'total_actual_spending': actual,
+    }
+    breakdown = {
+        values['category']: {'estimated': estimated, 'actual': actual, 'count': 1},
+    }
+    return counters, breakdown
+
+
+def _vendor_counters(values, today):
+    return {
+        'total_vendors': 1,
+        'vendors_booked': int(values['status'] == 'booked'),
+        'total_vendor_cost': values['final_amount'] or values['quote'] or ZERO,
+    }, None
+
+
+def _timeline_counters(values, today):
+    # Milestones are keyed by label, so they are re-read rather than adjusted
+    return {}, None
+
+
+# model -> (tracked fields, contribution function, sections re-read on change)
+TRACKED_MODELS = {
+    Guest: (('rsvp_status', 'number_of_guests'), _guest_counters, ()),
+    Task: (('status', 'due_date'), _task_counters, ()),
+    Budget: (('category', 'estimated_cost', 'actual_cost'), _budget_counters, ()),
+    Vendor: (('status', 'quote', 'final_amount'), _vendor_counters, ('vendor_quotes',)),
+    Timeline: (('event_type', 'is_completed', 'date'), _timeline_counters, ('milestones',)),
+}
+
+# Rows that also feed values without counters (the guest engagement metrics);
+# their writes still queue a full recompute for the analytics worker
+RECOMPUTED_MODELS = (Guest,)
+
+
+def _subtract(new, old):
+    keys = set(new) | set(old)
+    return {key: new.get(key, 0) - old.get(key, 0) for key in keys}
+
+
+def _subtract_breakdown(new, old):
+    new, old = new or {}, old or {}
+    return {
+        category: _subtract(new.get(category, {}), old.get(category, {}))
+        for category in set(new) | set(old)
+    }
+
+
+class AnalyticsCounters:
+    """Keep WeddingAnalytics counters current as rows change.
+
+    Each tracked row contributes fixed amounts to the counters of its
+    wedding (one invitation, one confirmed, N seats...). A save applies
+    contribution(new) - contribution(old) with atomic F() updates, a delete
+    applies -contribution(old).
+    """
+
+    @staticmethod
+    def tracked_models():
+        return list(TRACKED_MODELS)
+
+    @staticmethod
+    def needs_recompute(model):
+        """Whether writes to `model` change values the counters do not cover"""
+        return model in RECOMPUTED_MODELS
+
+    @staticmethod
+    def values_of(instance):
+        """The tracked field values of an in-memory instance, as Python types"""
+        fields, _, _ = TRACKED_MODELS[type(instance)]
+        values = {'wedding_id': instance.wedding_id}
+        for name in fields:
+            field = instance._meta.get_field(name)
+            values[name] = field.to_python(getattr(instance, name))
+        return values
+
+    @staticmethod
+    def stored_values(instance):
+        """The tracked field values currently in the database, or None for new rows"""
+        if instance.pk is None:
+            return None
+        fields, _, _ = TRACKED_MODELS[type(instance)]
+        return type(instance).objects.filter(pk=instance.pk).values('wedding_id', *fields).first()
+
+    @staticmethod
+    def record_save(instance, previous):
+        """Apply the change between the stored values and the saved instance.
+        
+        Returns False when no tracked field changed.
+        """
+        current = AnalyticsCounters.values_of(instance)
+        if current == previous:
+            return False
+        AnalyticsCounters.record_change(type(instance), previous, current)
+        return True
+
+    @staticmethod
+    def record_delete(instance):
+        AnalyticsCounters.record_change(type(instance), AnalyticsCounters.values_of(instance), None)
+
+    @staticmethod
+    def record_change(model, previous, current):
+        """Apply contribution(current) - contribution(previous); either may be None"""
+        _, contribution, sections = TRACKED_MODELS[model]
+        today = date.today()
+        old_counters, old_breakdown = contribution(previous, today) if previous else ({}, None)
+        new_counters, new_breakdown = contribution(current, today) if current else ({}, None)
+
+        if previous and current and previous['wedding_id'] != current['wedding_id']:
+            AnalyticsCounters.apply(
+                previous['wedding_id'],
+                _subtract({}, old_counters),
+                _subtract_breakdown(None, old_breakdown),
+                sections,
+            )
+            previous, old_counters, old_breakdown = None, {}, None
+
+        wedding_id = (current or previous)['wedding_id']
+        AnalyticsCounters.apply(
+            wedding_id,
+            _subtract(new_counters, old_counters),
+            _subtract_breakdown(new_breakdown, old_breakdown),
+            sections,
+        )
+
+    @staticmethod
+    def record_changes(model, changes):
+        """Apply many (previous, current) changes of one model with one adjustment per wedding"""
+        _, contribution, sections = TRACKED_MODELS[model]
+        today = date.today()
+        counters = defaultdict(lambda: defaultdict(int))
+        breakdowns = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        for previous, current in changes:
+            for values, sign in ((previous, -1), (current, 1)):
+                if not values:
+                    continue
+                row_counters, row_breakdown = contribution(values, today)
+                for field, amount in row_counters.items():
+                    counters[values['wedding_id']][field] += sign * amount
+                for category, amounts in (row_breakdown or {}).items():
+                    for field, amount in amounts.items():
+                        breakdowns[values['wedding_id']][category][field] += sign * amount
+        for wedding_id in set(counters) | set(breakdowns):
+            AnalyticsCounters.apply(wedding_id, counters[wedding_id], breakdowns[wedding_id], sections)
+
+    @staticmethod
+    def apply(wedding_id, counters, breakdown=None, sections=()):
+        """Adjust one wedding's analytics row by the given deltas"""
+        counters = {field: delta for field, delta in counters.items() if delta}
+        breakdown = {
+            category: delta for category, delta in (breakdown or {}).items()
+            if any(delta.values())
+        }
+        if not (counters or breakdown or sections):
+            return
+
+        with transaction.atomic():
+            updated = WeddingAnalytics.objects.filter(wedding_id=wedding_id).update(
+                last_updated=timezone.now(),
+                **{field: F(field) + delta for field, delta in counters.items()},
+            )
+            if not updated:
+                # No row yet; the analytics worker builds it with a full recompute
+                return
+
+            # Lock the row to fold in the JSON breakdown and the derived fields
+            analytics = (
+                WeddingAnalytics.objects.select_for_update()
+                .select_related('wedding')
+                .get(wedding_id=wedding_id)
+            )
+            AnalyticsCounters._apply_breakdown(analytics, breakdown)
+
+            today = date.today()
+            if 'vendor_quotes' in sections:
+                analytics.average_vendor_quote = WeddingAggregates.average_vendor_quote(wedding_id)
+            if 'milestones' in sections:
+                analytics.completion_by_milestone = WeddingAggregates.timeline(wedding_id, today)
+            if analytics.computed_for != today:
+                WeddingAnalyticsService.refresh_time_dependent(analytics.wedding, analytics, today)
+
+            WeddingAnalyticsService.calculate_derived_metrics(analytics)
+            analytics.save()
+
+    @staticmethod
+    def _apply_breakdown(analytics, breakdown):
+        categories = analytics.budget_category_breakdown
+        for category, delta in breakdown.items():
+            entry = categories.setdefault(category, {'estimated': 0, 'actual': 0, 'count': 0})
+            entry['estimated'] = round(entry['estimated'] + float(delta.get('estimated', 0)), 2)
+            entry['actual'] = round(entry['actual'] + float(delta.get('actual', 0)), 2)
+            entry['count'] += delta.get('count', 0)
+            if entry['count'] <= 0:
+                del categories[category]
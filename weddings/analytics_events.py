@@ -0,0 +1,147 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Case, Count, DateField, Sum, Value, When
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .analytics_aggregates import MONEY, ZERO
+from .models import AnalyticsEvent, Guest
+
+GRANULARITIES = ['day', 'week', 'month']
+RSVP_STATUSES = [status for status, _ in Guest.RSVP_CHOICES]
+
+
+def _bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(weeks=1)
+    if granularity == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class AnalyticsEvents:
+    """Record and read the append-only AnalyticsEvent log"""
+
+    @staticmethod
+    def record_rsvp(wedding_id, status, previous_status=''):
+        """A guest entered `status` (blank when deleted) from `previous_status` (blank when new)"""
+        if status == previous_status:
+            return
+        AnalyticsEvent.objects.create(
+            wedding_id=wedding_id, kind='rsvp', label=status or '',
+            previous_label=previous_status or '', occurred_at=timezone.now(),
+        )
+
+    @staticmethod
+    def record_rsvps(wedding_id, transitions):
+        """Many (status, previous_status) transitions of one wedding's guests in one insert"""
+        now = timezone.now()
+        AnalyticsEvent.objects.bulk_create([
+            AnalyticsEvent(
+                wedding_id=wedding_id, kind='rsvp', label=status or '',
+                previous_label=previous_status or '', occurred_at=now,
+            )
+            for status, previous_status in transitions if status != previous_status
+        ])
+
+    @staticmethod
+    def record_spend(wedding_id, delta):
+        if delta:
+            AnalyticsEvent.objects.create(
+                wedding_id=wedding_id, kind='spend', amount=delta, occurred_at=timezone.now(),
+            )
+
+    @staticmethod
+    def record_payment(wedding_id, delta, payment_date):
+        """Payments are dated by payment_date so corrections land in the same bucket"""
+        if delta:
+            AnalyticsEvent.objects.create(
+                wedding_id=wedding_id, kind='payment', amount=delta,
+                occurred_at=_start_of(payment_date),
+            )
+
+    @staticmethod
+    def record_payments(wedding_id, totals_by_date):
+        """One payment event per day for payments saved in bulk (no signals fire)"""
+        AnalyticsEvent.objects.bulk_create([
+            AnalyticsEvent(
+                wedding_id=wedding_id, kind='payment', amount=total,
+                occurred_at=_start_of(payment_date),
+            )
+            for payment_date, total in totals_by_date.items() if total
+        ])
+
+    @staticmethod
+    def series(wedding_id, start, end, granularity='week'):
+        """Bucketed RSVP, spend and payment series between two dates (inclusive).
+
+        One GROUP BY query: events before `start` fall in a NULL bucket that
+        seeds the running totals.
+        """
+        start = _bucket_start(start, granularity)
+        bucket = Case(
+            When(occurred_at__lt=_start_of(start), then=Value(None)),
+            default=Trunc('occurred_at', granularity, output_field=DateField()),
+            output_field=DateField(),
+        )
+        rows = (
+            AnalyticsEvent.objects
+            .filter(wedding_id=wedding_id, occurred_at__lt=_start_of(end + timedelta(days=1)))
+            .annotate(period=bucket)
+            .values('period', 'kind', 'label', 'previous_label')
+            .annotate(count=Count('id'), total=Sum('amount', output_field=MONEY))
+            .order_by()
+        )
+
+        changes = {}
+        for row in rows:
+            entry = changes.setdefault(row['period'], {
+                'rsvp': dict.fromkeys(RSVP_STATUSES, 0), 'spend': ZERO, 'payments': ZERO,
+            })
+            if row['kind'] == 'rsvp':
+                if row['label']:
+                    entry['rsvp'][row['label']] += row['count']
+                if row['previous_label']:
+                    entry['rsvp'][row['previous_label']] -= row['count']
+            elif row['kind'] == 'spend':
+                entry['spend'] += row['total'] or ZERO
+            else:
+                entry['payments'] += row['total'] or ZERO
+
+        empty = {'rsvp': dict.fromkeys(RSVP_STATUSES, 0), 'spend': ZERO, 'payments': ZERO}
+        baseline = changes.get(None, empty)
+        rsvp_totals = dict(baseline['rsvp'])
+        spend_to_date = baseline['spend']
+        payments_to_date = baseline['payments']
+
+        series = []
+        period = start
+        while period <= end:
+            entry = changes.get(period, empty)
+            for status, delta in entry['rsvp'].items():
+                rsvp_totals[status] += delta
+            spend_to_date += entry['spend']
+            payments_to_date += entry['payments']
+            series.append({
+                'period': period.isoformat(),
+                'rsvp': dict(rsvp_totals),
+                'rsvp_changes': dict(entry['rsvp']),
+                'spend': float(entry['spend']),
+                'spend_to_date': float(spend_to_date),
+                'payments': float(entry['payments']),
+                'payments_to_date': float(payments_to_date),
+            })
+            period = _next_bucket(period, granularity)
+        return series
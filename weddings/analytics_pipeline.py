@@ -0,0 +1,199 @@
+from datetime import date
+from functools import cached_property
+
+from django.db.models import OuterRef, Subquery
+
+from .analytics_aggregates import WeddingAggregates
+from .analytics_service import WeddingAnalyticsService
+from .headcount import GuestHeadcount
+from .models import GuestEngagementMetrics, WeddingAnalytics
+
+ENGAGEMENT_VALUE_FIELDS = [
+    'rsvp_response_rate', 'average_response_time', 'relationship_breakdown',
+    'dietary_requirements_percentage', 'group_size_distribution',
+]
+ENGAGEMENT_ROW_FIELDS = ['id'] + ENGAGEMENT_VALUE_FIELDS + ['created_at', 'updated_at']
+
+
+class AnalyticsPipeline:
+    """Every analytics view of one wedding, built from one set of base aggregates.
+
+    Each base aggregate (guest groups, response latency, budget, tasks,
+    vendors, milestones) is fetched at most once per pipeline and shared by
+    the analytics row, the engagement metrics, the comparison and the health
+    report. Views of the stored rows read a wedding from detail_queryset(),
+    which carries the analytics and engagement rows in the same query.
+    """
+
+    def __init__(self, wedding, today=None):
+        self.wedding = wedding
+        self.today = today or date.today()
+
+    @staticmethod
+    def detail_queryset():
+        """wedding_queryset() plus the wedding's first engagement row, still one query"""
+        engagement = GuestEngagementMetrics.objects.filter(wedding=OuterRef('pk')).order_by('pk')
+        return WeddingAnalyticsService.wedding_queryset().annotate(**{
+            f'engagement_{field}': Subquery(engagement.values(field)[:1])
+            for field in ENGAGEMENT_ROW_FIELDS
+        })
+
+    # Base aggregates
+
+    @cached_property
+    def headcount(self):
+        return GuestHeadcount.for_wedding(self.wedding.id)
+
+    @cached_property
+    def average_response_days(self):
+        return WeddingAggregates.average_response_days(self.wedding.id)
+
+    @cached_property
+    def budget(self):
+        return WeddingAggregates.budget(self.wedding.id)
+
+    @cached_property
+    def tasks(self):
+        return WeddingAggregates.tasks(self.wedding.id, self.today)
+
+    @cached_property
+    def vendors(self):
+        return WeddingAggregates.vendors(self.wedding.id)
+
+    @cached_property
+    def milestones(self):
+        return WeddingAggregates.timeline(self.wedding.id, self.today)
+
+    # Computed views
+
+    def populate(self, analytics):
+        """Fill an analytics instance from the base aggregates without saving it"""
+        by_status = self.headcount['by_status']
+        analytics.total_invitations_sent = self.headcount['invitations']
+        analytics.total_confirmed = by_status['confirmed']['invitations']
+        analytics.total_pending = by_status['pending']['invitations']
+        analytics.total_declined = by_status['declined']['invitations']
+        analytics.total_guest_count = self.headcount['seats']
+
+        analytics.total_estimated_budget = self.budget['estimated']
+        analytics.total_actual_spending = self.budget['actual']
+        # Category breakdown (JSON, so amounts are stored as floats)
+        analytics.budget_category_breakdown = {
+            category: {
+                'estimated': float(data['estimated']),
+                'actual': float(data['actual']),
+                'count': data['count'],
+            }
+            for category, data in self.budget['categories'].items()
+        }
+
+        analytics.total_vendors = self.vendors['total']
+        analytics.vendors_booked = self.vendors['booked']
+        analytics.average_vendor_quote = self.vendors['average_quote']
+        analytics.total_vendor_cost = self.vendors['total_cost']
+
+        analytics.completion_by_milestone = self.milestones
+        self.apply_time_dependent(analytics)
+
+        WeddingAnalyticsService.calculate_derived_metrics(analytics)
+        return analytics
+
+    def apply_time_dependent(self, analytics):
+        """Set the fields that change with the date rather than with writes"""
+        analytics.total_tasks = self.tasks['total']
+        analytics.completed_tasks = self.tasks['completed']
+        analytics.pending_tasks = self.tasks['pending']
+        analytics.overdue_tasks = self.tasks['overdue']
+
+        days_until = (self.wedding.wedding_date - self.today).days
+        analytics.days_until_wedding = max(days_until, 0)
+        analytics.weeks_until_wedding = analytics.days_until_wedding // 7
+
+        for milestone in analytics.completion_by_milestone.values():
+            milestone['days_until'] = (date.fromisoformat(milestone['date']) - self.today).days
+
+        analytics.computed_for = self.today
+        return analytics
+
+    def engagement_values(self):
+        """Guest engagement metric values without saving them"""
+        invitations = self.headcount['invitations']
+        responded = invitations - self.headcount['by_status']['pending']['invitations']
+        return {
+            'rsvp_response_rate': (responded / invitations * 100) if invitations > 0 else 0,
+            'average_response_time': self.average_response_days,
+            'relationship_breakdown': {
+                relationship: tally['invitations']
+                for relationship, tally in self.headcount['by_relationship'].items()
+            },
+            'dietary_requirements_percentage': (
+                (self.headcount['dietary']['invitations'] / invitations * 100) if invitations > 0 else 0
+            ),
+            'group_size_distribution': dict(sorted(self.headcount['group_sizes'].items())),
+        }
+
+    def save_analytics(self):
+        analytics, created = WeddingAnalytics.objects.get_or_create(wedding=self.wedding)
+        self.populate(analytics)
+        analytics.save()
+        return analytics
+
+    def save_engagement(self):
+        metrics = GuestEngagementMetrics.objects.filter(wedding=self.wedding).order_by('pk').first()
+        if metrics is None:
+            metrics = GuestEngagementMetrics(wedding=self.wedding)
+        for field, value in self.engagement_values().items():
+            setattr(metrics, field, value)
+        metrics.save()
+        return metrics
+
+    # Views of the stored rows
+
+    @cached_property
+    def analytics(self):
+        return WeddingAnalyticsService.get_analytics(self.wedding)
+
+    @cached_property
+    def engagement(self):
+        """The stored engagement row, computed and saved if the wedding has none"""
+        if hasattr(self.wedding, 'engagement_id'):
+            if self.wedding.engagement_id is None:
+                return self.save_engagement()
+            return GuestEngagementMetrics(wedding=self.wedding, **{
+                field: getattr(self.wedding, f'engagement_{field}') for field in ENGAGEMENT_ROW_FIELDS
+            })
+        return self.wedding.engagement_metrics.order_by('pk').first() or self.save_engagement()
+
+    def comparison(self):
+        """Actual vs estimated figures"""
+        analytics = self.analytics
+        return {
+            'budget': {
+                'estimated': float(analytics.total_estimated_budget),
+                'actual': float(analytics.total_actual_spending),
+                'variance': float(analytics.budget_variance)
+            },
+            'guests': {
+                'invited': analytics.total_invitations_sent,
+                'confirmed': analytics.total_confirmed,
+                'pending': analytics.total_pending,
+                'declined': analytics.total_declined
+            },
+            'tasks': {
+                'total': analytics.total_tasks,
+                'completed': analytics.completed_tasks,
+                'pending': analytics.pending_tasks,
+                'overdue': analytics.overdue_tasks,
+                'completion_percentage': analytics.completion_percentage
+            }
+        }
+
+    def health_report(self):
+        analytics = self.analytics
+        return {
+            'budget_health': analytics.budget_health_score,
+            'task_health': analytics.task_health_score,
+            'guest_health': analytics.guest_health_score,
+            'planning_health': analytics.planning_health_score,
+            'overall_health': analytics.overall_health_score
+        }
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics_cache import AnalyticsCache
+from .analytics_pipeline import AnalyticsPipeline
+from .db_utils import upsert_kwargs
+from .models import AnalyticsDirtyMark, Wedding
+
+
+class AnalyticsQueue:
+    """DB-backed queue of weddings whose analytics need a full recompute.
+
+    AnalyticsCounters keeps the analytics row current on every write, so
+    only writes that change values without counters (guest engagement, the
+    wedding date) and the daily sweep queue a wedding. Each upserts one mark per wedding,
+    so a burst of edits collapses into a single entry; the analytics_worker
+    command recomputes a wedding once its marks have been quiet for the
+    debounce window.
+    """
+
+    @staticmethod
+    def mark_dirty(wedding_id):
+        AnalyticsQueue.mark_many([wedding_id])
+
+    @staticmethod
+    def mark_many(wedding_ids, batch_size=500):
+        now = timezone.now()
+        marks = [
+            AnalyticsDirtyMark(wedding_id=wedding_id, first_marked_at=now, last_marked_at=now)
+            for wedding_id in set(wedding_ids)
+        ]
+        AnalyticsDirtyMark.objects.bulk_create(
+            marks,
+            batch_size=batch_size,
+            **upsert_kwargs(AnalyticsDirtyMark, ['wedding'], ['last_marked_at']),
+        )
+
+    @staticmethod
+    def enqueue_outdated(today=None):
+        """Mark upcoming weddings whose row is missing or from an earlier day"""
+        today = today or date.today()
+        wedding_ids = list(
+            Wedding.objects.filter(
+                Q(analytics__isnull=True)
+                | Q(wedding_date__gte=today) & (
+                    Q(analytics__computed_for__isnull=True) | Q(analytics__computed_for__lt=today)
+                ),
+                analytics_dirty_mark__isnull=True,
+            ).values_list('id', flat=True)
+        )
+        AnalyticsQueue.mark_many(wedding_ids)
+        return len(wedding_ids)
+
+    @staticmethod
+    def ready_marks(debounce, max_wait, limit):
+        """Marks quiet for `debounce`, or waiting longer than `max_wait`, oldest first"""
+        now = timezone.now()
+        return list(
+            AnalyticsDirtyMark.objects.filter(
+                Q(last_marked_at__lte=now - timedelta(seconds=debounce))
+                | Q(first_marked_at__lte=now - timedelta(seconds=max_wait))
+            )
+            .order_by('first_marked_at')
+            .values('wedding_id', 'last_marked_at')[:limit]
+        )
+
+    @staticmethod
+    def process_ready(debounce=30, max_wait=300, limit=50):
+        """Recompute every ready wedding once; returns the processed wedding ids"""
+        marks = AnalyticsQueue.ready_marks(debounce, max_wait, limit)
+        weddings = Wedding.objects.in_bulk([mark['wedding_id'] for mark in marks])
+
+        processed = []
+        for mark in marks:
+            wedding = weddings.get(mark['wedding_id'])
+            if wedding is not None:
+                pipeline = AnalyticsPipeline(wedding)
+                pipeline.save_analytics()
+                pipeline.save_engagement()
+                AnalyticsCache.bump(wedding.id)
+                processed.append(wedding.id)
+
+            # A write during the recompute moved last_marked_at, which keeps
+            # the mark queued for another pass
+            AnalyticsDirtyMark.objects.filter(
+                wedding_id=mark['wedding_id'], last_marked_at=mark['last_marked_at']
+            ).delete()
+        return processed
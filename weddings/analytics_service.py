@@ -1,145 +1,140 @@
 from datetime import datetime, date, timedelta
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from decimal import Decimal
-from django.db.models import Avg
 from .models import (
     Wedding, Guest, Task, Vendor, Budget, 
-    WeddingAnalytics, WeeklyAnalyticsSnapshot, GuestEngagementMetrics
+    WeddingAnalytics, WeeklyAnalyticsSnapshot, GuestEngagementMetrics,
+    AnalyticsDirtyMark,
 )
+from .analytics_aggregates import WeddingAggregates
+from .db_utils import upsert_kwargs
+
+# Stored fields that a full recompute must reproduce exactly
+VERIFIED_FIELDS = [
+    'total_invitations_sent', 'total_confirmed', 'total_pending', 'total_declined',
+    'total_guest_count', 'total_estimated_budget', 'total_actual_spending',
+    'budget_category_breakdown', 'total_tasks', 'completed_tasks', 'pending_tasks',
+    'overdue_tasks', 'total_vendors', 'vendors_booked', 'average_vendor_quote',
+    'total_vendor_cost', 'completion_by_milestone',
+]
+
+SNAPSHOT_FIELDS = [
+    'confirmed_count', 'pending_count', 'spending_to_date', 'tasks_completed', 'tasks_pending',
+]
+
+
+def _rounded_breakdown(breakdown):
+    """Budget breakdown with float amounts rounded to cents for comparison"""
+    return {
+        category: {key: round(value, 2) for key, value in data.items()}
+        for category, data in (breakdown or {}).items()
+    }
+
 
 class WeddingAnalyticsService:
     
     @staticmethod
     def calculate_analytics(wedding):
-        """Calculate all analytics for a wedding"""
-        analytics, created = WeddingAnalytics.objects.get_or_create(wedding=wedding)
-        
-        # Calculate guest analytics
-        WeddingAnalyticsService._calculate_guest_analytics(wedding, analytics)
-        
-        # Calculate budget analytics
-        WeddingAnalyticsService._calculate_budget_analytics(wedding, analytics)
-        
-        # Calculate task analytics
-        WeddingAnalyticsService._calculate_task_analytics(wedding, analytics)
+        """Recalculate all analytics for a wedding from scratch.
         
-        # Calculate vendor analytics
-        WeddingAnalyticsService._calculate_vendor_analytics(wedding, analytics)
-        
-        # Calculate timeline analytics
-        WeddingAnalyticsService._calculate_timeline_analytics(wedding, analytics)
-        
-        # Calculate health scores
-        WeddingAnalyticsService._calculate_health_scores(analytics)
-        
-        analytics.save()
+        Counters are kept current by AnalyticsCounters between runs; this
+        full recompute is what the analytics worker runs for queued weddings.
+        """
+        from .analytics_pipeline import AnalyticsPipeline
+        return AnalyticsPipeline(wedding).save_analytics()
+    
+    @staticmethod
+    def populate_analytics(wedding, analytics, today=None):
+        """Fill an analytics instance from the base tables without saving it"""
+        from .analytics_pipeline import AnalyticsPipeline
+        return AnalyticsPipeline(wedding, today).populate(analytics)
+    
+    @staticmethod
+    def wedding_queryset():
+        """Weddings with their analytics row and stale flag, in one query"""
+        return Wedding.objects.select_related('analytics').annotate(
+            analytics_stale=Exists(AnalyticsDirtyMark.objects.filter(wedding=OuterRef('pk')))
+        )
+    
+    @staticmethod
+    def get_analytics(wedding):
+        """Return the last computed analytics row without recomputing anything.
+        
+        The returned row carries a `stale` attribute: True while a full
+        recompute is queued, or when the row was computed on an earlier day.
+        A wedding without a row gets an unsaved, zeroed row and is queued.
+        """
+        from .analytics_queue import AnalyticsQueue
+        
+        try:
+            analytics = wedding.analytics
+        except WeddingAnalytics.DoesNotExist:
+            AnalyticsQueue.mark_dirty(wedding.id)
+            analytics = WeddingAnalytics(wedding=wedding)
+            analytics.stale = True
+            return analytics
+        
+        queued = getattr(wedding, 'analytics_stale', None)
+        if queued is None:
+            queued = AnalyticsDirtyMark.objects.filter(wedding=wedding).exists()
+        analytics.stale = queued or analytics.computed_for != date.today()
         return analytics
     
     @staticmethod
-    def _calculate_guest_analytics(wedding, analytics):
-        """Calculate guest-related metrics"""
-        guests = wedding.guests.all()
-        
-        analytics.total_invitations_sent = guests.count()
-        analytics.total_confirmed = guests.filter(rsvp_status='confirmed').count()
-        analytics.total_pending = guests.filter(rsvp_status='pending').count()
-        analytics.total_declined = guests.filter(rsvp_status='declined').count()
-        
-        if guests.count() > 0:
-            analytics.average_guests_per_invitation = guests.aggregate(
-            avg=Avg('number_of_guests')
-            )['avg'] or 1.0
+    def refresh_time_dependent(wedding, analytics, today=None):
+        """Recompute the fields that change with the date rather than with writes"""
+        from .analytics_pipeline import AnalyticsPipeline
+        AnalyticsPipeline(wedding, today).apply_time_dependent(analytics)
     
     @staticmethod
-    def _calculate_budget_analytics(wedding, analytics):
-        """Calculate budget-related metrics"""
-        budget_items = wedding.budget_items.all()
-        
-        analytics.total_estimated_budget = sum([
-            Decimal(item.estimated_cost) for item in budget_items
-        ]) or Decimal(0)
-        
-        analytics.total_actual_spending = sum([
-            Decimal(item.actual_cost or 0) for item in budget_items
-        ]) or Decimal(0)
-        
+    def calculate_derived_metrics(analytics):
+        """Calculate ratios and health scores from the stored counters"""
         analytics.budget_variance = (
             analytics.total_actual_spending - analytics.total_estimated_budget
         )
         
-        # Category breakdown
-        category_breakdown = {}
-        for item in budget_items:
-            if item.category not in category_breakdown:
-                category_breakdown[item.category] = {
-                    'estimated': 0,
-                    'actual': 0,
-                    'count': 0
-                }
-            category_breakdown[item.category]['estimated'] += float(item.estimated_cost)
-            category_breakdown[item.category]['actual'] += float(item.actual_cost or 0)
-            category_breakdown[item.category]['count'] += 1
-        
-        analytics.budget_category_breakdown = category_breakdown
-    
-    @staticmethod
-    def _calculate_task_analytics(wedding, analytics):
-        """Calculate task-related metrics"""
-        tasks = wedding.tasks.all()
-        
-        analytics.total_tasks = tasks.count()
-        analytics.completed_tasks = tasks.filter(status='done').count()
-        analytics.pending_tasks = tasks.filter(status__in=['todo', 'in_progress']).count()
-        
-        # Calculate overdue tasks
-        today = date.today()
-        overdue_tasks = tasks.filter(
-            due_date__lt=today,
-            status__in=['todo', 'in_progress']
-        ).count()
-        analytics.overdue_tasks = overdue_tasks
+        if analytics.total_invitations_sent > 0:
+            analytics.average_guests_per_invitation = (
+                analytics.total_guest_count / analytics.total_invitations_sent
+            )
+        else:
+            analytics.average_guests_per_invitation = 1.0
         
         if analytics.total_tasks > 0:
             analytics.completion_percentage = (
                 analytics.completed_tasks / analytics.total_tasks * 100
             )
-    
-    @staticmethod
-    def _calculate_vendor_analytics(wedding, analytics):
-        """Calculate vendor-related metrics"""
-        vendors = wedding.vendors.all()
-        
-        analytics.total_vendors = vendors.count()
-        analytics.vendors_booked = vendors.filter(status='booked').count()
-        
-        quotes = [float(v.quote) for v in vendors if v.quote]
-        if quotes:
-            analytics.average_vendor_quote = Decimal(sum(quotes) / len(quotes))
+        else:
+            analytics.completion_percentage = 0
         
-        analytics.total_vendor_cost = sum([
-            Decimal(v.final_amount or v.quote or 0) for v in vendors
-        ]) or Decimal(0)
+        WeddingAnalyticsService._calculate_health_scores(analytics)
     
     @staticmethod
-    def _calculate_timeline_analytics(wedding, analytics):
-        """Calculate timeline-related metrics"""
-        today = date.today()
-        wedding_date = wedding.wedding_date
-        
-        days_until = (wedding_date - today).days
-        analytics.days_until_wedding = max(days_until, 0)
-        analytics.weeks_until_wedding = analytics.days_until_wedding // 7
+    def verify_analytics(wedding):
+        """Compare the stored counters with a full recompute.
+        
+        Returns a dict of {field: (stored, expected)} for every field that
+        drifted; an empty dict means the row is accurate.
+        """
+        try:
+            stored = WeddingAnalytics.objects.get(wedding=wedding)
+        except WeddingAnalytics.DoesNotExist:
+            stored = WeddingAnalytics(wedding=wedding)
+        expected = WeddingAnalyticsService.populate_analytics(
+            wedding, WeddingAnalytics(wedding=wedding), stored.computed_for
+        )
         
-        # Calculate completion by milestone
-        events = wedding.timeline_events.all().order_by('date')
-        milestone_completion = {}
-        for event in events:
-            milestone_completion[event.get_event_type_display()] = {
-                'completed': event.is_completed,
-                'date': event.date.isoformat(),
-                'days_until': (event.date - today).days
-            }
-        analytics.completion_by_milestone = milestone_completion
+        drift = {}
+        for field in VERIFIED_FIELDS:
+            stored_value = getattr(stored, field)
+            expected_value = getattr(expected, field)
+            if field == 'budget_category_breakdown':
+                stored_value = _rounded_breakdown(stored_value)
+                expected_value = _rounded_breakdown(expected_value)
+            if stored_value != expected_value:
+                drift[field] = (stored_value, expected_value)
+        return drift
     
     @staticmethod
     def _calculate_health_scores(analytics):
@@ -183,90 +178,55 @@ class WeddingAnalyticsService:
         ) / 4
     
     @staticmethod
-    def create_weekly_snapshot(wedding):
-        """Create a weekly analytics snapshot"""
-        from datetime import datetime
-        week_number = datetime.now().isocalendar()[1]
-        
-        confirmed = wedding.guests.filter(rsvp_status='confirmed').count()
-        pending = wedding.guests.filter(rsvp_status='pending').count()
-        
-        spending = sum([
-            float(item.actual_cost or 0) 
-            for item in wedding.budget_items.all()
-        ])
-        
-        tasks_completed = wedding.tasks.filter(status='done').count()
-        tasks_pending = wedding.tasks.filter(status__in=['todo', 'in_progress']).count()
-        
-        snapshot = WeeklyAnalyticsSnapshot.objects.create(
-            wedding=wedding,
-            week_number=week_number,
-            confirmed_count=confirmed,
-            pending_count=pending,
-            spending_to_date=Decimal(str(spending)),
-            tasks_completed=tasks_completed,
-            tasks_pending=tasks_pending
+    def create_weekly_snapshot(wedding, today=None):
+        """Create or refresh this week's analytics snapshot"""
+        today = today or date.today()
+        WeddingAnalyticsService.create_weekly_snapshots([wedding.id], today)
+        iso_year, week_number, _ = today.isocalendar()
+        return WeeklyAnalyticsSnapshot.objects.get(
+            wedding=wedding, iso_year=iso_year, week_number=week_number
         )
-        
-        return snapshot
+    
+    @staticmethod
+    def create_weekly_snapshots(wedding_ids, today=None):
+        """Upsert this week's snapshot for every given wedding.
+        
+        Safe to re-run: a second call in the same ISO week overwrites the
+        counts instead of adding a row.
+        """
+        today = today or date.today()
+        iso_year, week_number, _ = today.isocalendar()
+        counts = WeddingAggregates.snapshot_counts(wedding_ids)
+        snapshots = [
+            WeeklyAnalyticsSnapshot(
+                wedding_id=wedding_id, iso_year=iso_year, week_number=week_number, **values
+            )
+            for wedding_id, values in counts.items()
+        ]
+        WeeklyAnalyticsSnapshot.objects.bulk_create(
+            snapshots,
+            **upsert_kwargs(
+                WeeklyAnalyticsSnapshot,
+                ['wedding', 'iso_year', 'week_number'],
+                SNAPSHOT_FIELDS,
+            ),
+        )
+        return len(snapshots)
     
     @staticmethod
     def calculate_engagement_metrics(wedding):
-        """Calculate guest engagement metrics"""
-        guests = wedding.guests.all()
-        
-        # RSVP Response rate
-        responded = guests.exclude(rsvp_status='pending').count()
-        response_rate = (responded / guests.count() * 100) if guests.count() > 0 else 0
-        
-        # Relationship breakdown
-        relationship_breakdown = {}
-        for rel in ['family', 'friend', 'colleague', 'other']:
-            count = guests.filter(relationship=rel).count()
-            relationship_breakdown[rel] = count
-        
-        # Dietary requirements
-        dietary_count = guests.exclude(dietary_restrictions='').count()
-        dietary_percentage = (dietary_count / guests.count() * 100) if guests.count() > 0 else 0
-        
-        # Group size distribution
-        group_distribution = {}
-        for guest in guests:
-            size = guest.number_of_guests
-            if size not in group_distribution:
-                group_distribution[size] = 0
-            group_distribution[size] += 1
-        
-        metrics, created = GuestEngagementMetrics.objects.get_or_create(wedding=wedding)
-        metrics.rsvp_response_rate = response_rate
-        metrics.relationship_breakdown = relationship_breakdown
-        metrics.dietary_requirements_percentage = dietary_percentage
-        metrics.group_size_distribution = group_distribution
-        metrics.save()
-        
-        return metrics
+        """Calculate and store guest engagement metrics"""
+        from .analytics_pipeline import AnalyticsPipeline
+        return AnalyticsPipeline(wedding).save_engagement()
+    
+    @staticmethod
+    def build_engagement_metrics(wedding):
+        """Calculate guest engagement metric values without saving them"""
+        from .analytics_pipeline import AnalyticsPipeline
+        return AnalyticsPipeline(wedding).engagement_values()
     
     @staticmethod
     def get_comparison_data(wedding):
         """Get data comparing actual vs estimated"""
-        return {
-            'budget': {
-                'estimated': float(wedding.analytics.total_estimated_budget),
-                'actual': float(wedding.analytics.total_actual_spending),
-                'variance': float(wedding.analytics.budget_variance)
-            },
-            'guests': {
-                'invited': wedding.analytics.total_invitations_sent,
-                'confirmed': wedding.analytics.total_confirmed,
-                'pending': wedding.analytics.total_pending,
-                'declined': wedding.analytics.total_declined
-            },
-            'tasks': {
-                'total': wedding.analytics.total_tasks,
-                'completed': wedding.analytics.completed_tasks,
-                'pending': wedding.analytics.pending_tasks,
-                'overdue': wedding.analytics.overdue_tasks,
-                'completion_percentage': wedding.analytics.completion_percentage
-            }
-        }
\ No newline at end of file
+        from .analytics_pipeline import AnalyticsPipeline
+        return AnalyticsPipeline(wedding).comparison()
@@ -1,6 +1,8 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework import status
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from .models import Wedding, GuestPledge
 from .models import (
@@ -11,19 +13,39 @@ from .analytics_serializers import (
     GuestEngagementMetricsSerializer
 )
 from .analytics_service import WeddingAnalyticsService
+from .analytics_pipeline import AnalyticsPipeline
+from .analytics_cache import cached_analytics
+from .analytics_events import GRANULARITIES, AnalyticsEvents
+from .conditional import not_modified, set_validators, weak_etag
+from .headcount import GuestHeadcount
+from .health_cohorts import HealthCohorts
+from .pledge_service import PledgeSummary
+from django.utils import timezone
+from datetime import date, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+MAX_DAILY_POINTS = 731
+
 # ============================================
 # MAIN ENDPOINT - This is what Flutter calls
 # ============================================
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_analytics('summary')
 def wedding_analytics(request, wedding_id):
     try:
-        wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
-        analytics = WeddingAnalyticsService.calculate_analytics(wedding)
+        wedding = get_object_or_404(WeddingAnalyticsService.wedding_queryset(), id=wedding_id, user=request.user)
+        analytics = WeddingAnalyticsService.get_analytics(wedding)
+        
+        etag = weak_etag(
+            'summary', request.user.pk, wedding.id, analytics.last_updated,
+            analytics.computed_for, analytics.stale, date.today(),
+        )
+        not_modified_response = not_modified(request, etag, analytics.last_updated)
+        if not_modified_response is not None:
+            return not_modified_response
         
         # USE THIS DICTIONARY STRUCTURE
         response_data = {
@@ -52,8 +74,10 @@ def wedding_analytics(request, wedding_id):
             'task_health_score': float(analytics.task_health_score or 0),
             'guest_health_score': float(analytics.guest_health_score or 0),
             'overall_health_score': float(analytics.overall_health_score or 0),
+            'last_updated': analytics.last_updated,
+            'stale': analytics.stale,
         }
-        return Response(response_data)
+        return set_validators(Response(response_data), etag, analytics.last_updated)
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         raise
@@ -68,27 +92,20 @@ def pledge_summary(request, wedding_id):
     Endpoint: /api/weddings/<id>/pledges/summary/
     """
     try:
-        wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
-        pledges = wedding.pledges.all()
-        
-        logger.info(f"Pledge summary for wedding {wedding_id}, pledges count: {pledges.count()}")
-        
-        from decimal import Decimal
-        total_pledged = sum(p.pledged_amount for p in pledges) or Decimal(0)
-        total_paid = sum(p.paid_amount for p in pledges) or Decimal(0)
-        total_balance = sum(p.balance for p in pledges) or Decimal(0)
+        summary = PledgeSummary.for_wedding(wedding_id, user=request.user)
+        if summary is None:
+            raise Http404('No Wedding matches the given query.')
         
         response_data = {
-            'total_pledged': str(total_pledged),
-            'total_paid': str(total_paid),
-            'total_balance': str(total_balance),
-            'total_pledgers': pledges.count(),
-            'fully_paid_count': pledges.filter(payment_status='paid').count(),
-            'partially_paid_count': pledges.filter(payment_status='partial').count(),
-            'unpaid_count': pledges.filter(payment_status='pledged').count(),
+            'total_pledged': str(summary['total_pledged']),
+            'total_paid': str(summary['total_paid']),
+            'total_balance': str(summary['total_balance']),
+            'total_pledgers': summary['pledge_count'],
+            'fully_paid_count': summary['paid_count'],
+            'partially_paid_count': summary['partial_count'],
+            'unpaid_count': summary['pledged_count'],
         }
         
-        logger.info(f"Pledge summary response: {response_data}")
         return Response(response_data)
         
     except Exception as e:
@@ -101,28 +118,21 @@ def pledge_summary(request, wedding_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_analytics('detailed')
 def get_analytics(request, wedding_id):
     """Get comprehensive analytics for a wedding"""
-    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
-    
-    analytics = WeddingAnalyticsService.calculate_analytics(wedding)
-    engagement = WeddingAnalyticsService.calculate_engagement_metrics(wedding)
-    comparison = WeddingAnalyticsService.get_comparison_data(wedding)
+    wedding = get_object_or_404(AnalyticsPipeline.detail_queryset(), id=wedding_id, user=request.user)
+    pipeline = AnalyticsPipeline(wedding)
     
-    serializer = WeddingAnalyticsSerializer(analytics)
-    engagement_serializer = GuestEngagementMetricsSerializer(engagement)
+    serializer = WeddingAnalyticsSerializer(pipeline.analytics)
+    engagement_serializer = GuestEngagementMetricsSerializer(pipeline.engagement)
     
     return Response({
         'analytics': serializer.data,
         'engagement': engagement_serializer.data,
-        'comparison': comparison,
-        'health_report': {
-            'budget_health': analytics.budget_health_score,
-            'task_health': analytics.task_health_score,
-            'guest_health': analytics.guest_health_score,
-            'planning_health': analytics.planning_health_score,
-            'overall_health': analytics.overall_health_score
-        }
+        'comparison': pipeline.comparison(),
+        'health_report': pipeline.health_report(),
+        'stale': pipeline.analytics.stale,
     })
 
 @api_view(['GET'])
@@ -131,12 +141,68 @@ def get_trend_data(request, wedding_id):
     """Get trend data from weekly snapshots"""
     wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
     
-    snapshots = WeeklyAnalyticsSnapshot.objects.filter(wedding=wedding).order_by('week_number')
-    serializer = WeeklyAnalyticsSnapshotSerializer(snapshots, many=True)
+    snapshots = WeeklyAnalyticsSnapshot.objects.filter(wedding=wedding).order_by('iso_year', 'week_number')
+    series = _fill_missing_weeks(WeeklyAnalyticsSnapshotSerializer(snapshots, many=True).data)
+    
+    return Response({
+        'snapshots': series,
+        'total_weeks': len(series)
+    })
+
+
+def _fill_missing_weeks(snapshots):
+    """Insert a copy of the previous week for every week without a snapshot"""
+    series = []
+    for snapshot in snapshots:
+        if series:
+            previous = series[-1]
+            week = date.fromisocalendar(previous['iso_year'], previous['week_number'], 1)
+            current = date.fromisocalendar(snapshot['iso_year'], snapshot['week_number'], 1)
+            week += timedelta(weeks=1)
+            while week < current:
+                iso_year, week_number, _ = week.isocalendar()
+                series.append({
+                    **previous, 'id': None, 'iso_year': iso_year, 'week_number': week_number,
+                    'carried_forward': True,
+                })
+                week += timedelta(weeks=1)
+        series.append({**snapshot, 'carried_forward': False})
+    return series
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_event_trends(request, wedding_id):
+    """Get day, week or month series of RSVPs, spending and pledge payments"""
+    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+    
+    granularity = request.query_params.get('granularity', 'week')
+    if granularity not in GRANULARITIES:
+        return Response(
+            {'error': f"granularity must be one of {', '.join(GRANULARITIES)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        end = date.fromisoformat(request.query_params['end']) if 'end' in request.query_params else date.today()
+        start = (
+            date.fromisoformat(request.query_params['start']) if 'start' in request.query_params
+            else timezone.localdate(wedding.created_at)
+        )
+    except ValueError:
+        return Response({'error': 'start and end must be YYYY-MM-DD dates'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end:
+        return Response({'error': 'start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+    if granularity == 'day' and (end - start).days >= MAX_DAILY_POINTS:
+        return Response(
+            {'error': f'Daily series are limited to {MAX_DAILY_POINTS} days'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     return Response({
-        'snapshots': serializer.data,
-        'total_weeks': snapshots.count()
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': AnalyticsEvents.series(wedding.id, start, end, granularity),
     })
 
 
@@ -154,11 +220,12 @@ def create_snapshot(request, wedding_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_analytics('budget_breakdown')
 def get_category_breakdown(request, wedding_id):
     """Get detailed budget category breakdown"""
-    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+    wedding = get_object_or_404(WeddingAnalyticsService.wedding_queryset(), id=wedding_id, user=request.user)
     
-    analytics = wedding.analytics
+    analytics = WeddingAnalyticsService.get_analytics(wedding)
     categories = analytics.budget_category_breakdown
     
     # Add percentage calculations
@@ -174,16 +241,16 @@ def get_category_breakdown(request, wedding_id):
             'item_count': data['count']
         })
     
-    return Response({'breakdown': breakdown})
+    return Response({'breakdown': breakdown, 'stale': analytics.stale})
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_timeline_status(request, wedding_id):
     """Get timeline event completion status"""
-    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+    wedding = get_object_or_404(WeddingAnalyticsService.wedding_queryset(), id=wedding_id, user=request.user)
     
-    analytics = wedding.analytics
+    analytics = WeddingAnalyticsService.get_analytics(wedding)
     timeline_status = analytics.completion_by_milestone
     
     total_events = len(timeline_status)
@@ -196,21 +263,22 @@ def get_timeline_status(request, wedding_id):
         'completed_events': completed_events,
         'completion_rate': completion_rate,
         'days_until_wedding': analytics.days_until_wedding,
-        'weeks_until_wedding': analytics.weeks_until_wedding
+        'weeks_until_wedding': analytics.weeks_until_wedding,
+        'stale': analytics.stale,
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_analytics('guests')
 def get_guest_analytics(request, wedding_id):
     """Get detailed guest analytics"""
-    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+    wedding = get_object_or_404(WeddingAnalyticsService.wedding_queryset(), id=wedding_id, user=request.user)
     
-    analytics = wedding.analytics
+    analytics = WeddingAnalyticsService.get_analytics(wedding)
     engagement = wedding.engagement_metrics.first() or WeddingAnalyticsService.calculate_engagement_metrics(wedding)
     
-    total_guests = sum(guest.number_of_guests for guest in wedding.guests.all())
-    confirmed_guests = sum(guest.number_of_guests for guest in wedding.guests.filter(rsvp_status='confirmed'))
+    headcount = GuestHeadcount.for_wedding(wedding.id)
     
     return Response({
         'invitations_sent': analytics.total_invitations_sent,
@@ -218,32 +286,39 @@ def get_guest_analytics(request, wedding_id):
         'pending': analytics.total_pending,
         'declined': analytics.total_declined,
         'average_per_invitation': analytics.average_guests_per_invitation,
-        'total_guest_count': total_guests,
-        'confirmed_guest_count': confirmed_guests,
+        'total_guest_count': headcount['seats'],
+        'confirmed_guest_count': headcount['by_status']['confirmed']['seats'],
         'response_rate': engagement.rsvp_response_rate,
+        'average_response_days': engagement.average_response_time,
         'relationship_breakdown': engagement.relationship_breakdown,
         'dietary_requirements': engagement.dietary_requirements_percentage,
-        'group_size_distribution': engagement.group_size_distribution
+        'group_size_distribution': engagement.group_size_distribution,
+        'stale': analytics.stale,
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_analytics('health')
 def get_health_scores(request, wedding_id):
     """Get individual health scores"""
-    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+    wedding = get_object_or_404(WeddingAnalyticsService.wedding_queryset(), id=wedding_id, user=request.user)
     
-    analytics = wedding.analytics
+    analytics = WeddingAnalyticsService.get_analytics(wedding)
+    ranks = HealthCohorts.rank(wedding, analytics)
+    percentiles = ranks['percentiles']
     
     return Response({
         'budget_health': {
             'score': analytics.budget_health_score,
+            'percentile': percentiles['budget_health'],
             'message': 'On track' if analytics.budget_health_score >= 80 else 'Watch spending',
             'variance': float(analytics.budget_variance),
             'percentage_spent': (float(analytics.total_actual_spending) / float(analytics.total_estimated_budget) * 100) if analytics.total_estimated_budget > 0 else 0
         },
         'task_health': {
             'score': analytics.task_health_score,
+            'percentile': percentiles['task_health'],
             'message': 'On track' if analytics.task_health_score >= 80 else 'Behind schedule',
             'completion': analytics.completion_percentage,
             'overdue': analytics.overdue_tasks,
@@ -251,18 +326,24 @@ def get_health_scores(request, wedding_id):
         },
         'guest_health': {
             'score': analytics.guest_health_score,
+            'percentile': percentiles['guest_health'],
             'message': 'Good response' if analytics.guest_health_score >= 70 else 'Follow up needed',
             'response_rate': (analytics.total_confirmed + analytics.total_declined) / analytics.total_invitations_sent * 100 if analytics.total_invitations_sent > 0 else 0,
+            'response_rate_percentile': percentiles['rsvp_response'],
             'pending_responses': analytics.total_pending
         },
         'planning_health': {
             'score': analytics.planning_health_score,
+            'percentile': percentiles['planning_health'],
             'message': 'Good progress' if analytics.planning_health_score >= 70 else 'Catch up on milestones',
             'days_until_wedding': analytics.days_until_wedding,
             'weeks_until_wedding': analytics.weeks_until_wedding
         },
         'overall_health': {
             'score': analytics.overall_health_score,
+            'percentile': percentiles['overall_health'],
             'status': 'Excellent' if analytics.overall_health_score >= 85 else 'Good' if analytics.overall_health_score >= 70 else 'Needs Attention'
-        }
+        },
+        'cohort': ranks['cohort'],
+        'stale': analytics.stale,
     })
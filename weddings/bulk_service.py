@@ -0,0 +1,137 @@
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .analytics_cache import AnalyticsCache
+from .analytics_counters import TRACKED_MODELS, AnalyticsCounters
+from .analytics_events import AnalyticsEvents
+from .analytics_queue import AnalyticsQueue
+from .change_log import RESOURCE_BY_MODEL, ChangeLog
+from .models import Budget, Guest, GuestPledge, Wedding
+
+MAX_BULK_ROWS = 1000
+BATCH_SIZE = 500
+
+
+class BulkWrite:
+    """Create, partially update and delete many rows of one wedding in one transaction.
+
+    Rows are written with bulk_create and bulk_update and removed with a
+    single DELETE, so the per-row signals do not fire. Their work (the
+    analytics counters and events, the dirty mark and the sync change log)
+    is applied once for the whole batch instead.
+    """
+
+    def __init__(self, wedding, model):
+        self.wedding = wedding
+        self.model = model
+        self.changes = []
+
+    def run(self, creates=(), updates=None, deletes=()):
+        """Write validated rows: creates is a list of field dicts, updates maps pk -> changed fields.
+
+        Returns the created instances, the updated instances and the deleted
+        pks, each in request order.
+        """
+        with transaction.atomic():
+            # Holding the wedding row keeps other inserts for it out until the commit
+            Wedding.objects.select_for_update().filter(pk=self.wedding.pk).values_list('pk', flat=True).get()
+            deleted = self.delete(deletes)
+            updated = self.update(updates or {})
+            created = self.create(creates)
+            self.record_changes(created + updated, deleted)
+        return created, updated, deleted
+
+    def rows(self):
+        return self.model.objects.filter(wedding=self.wedding)
+
+    def create(self, creates):
+        instances = [self.model(wedding=self.wedding, **fields) for fields in creates]
+        if not instances:
+            return []
+        for instance in instances:
+            if hasattr(instance, 'fill_derived_fields'):
+                instance.fill_derived_fields()
+
+        connection = connections[router.db_for_write(self.model)]
+        if connection.features.can_return_rows_from_bulk_insert:
+            self.model.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+        else:
+            # MySQL does not return the new ids. The wedding row is locked, so
+            # every row of this wedding above the previous maximum is ours.
+            last_pk = self.rows().aggregate(last=Max('pk'))['last'] or 0
+            self.model.objects.bulk_create(instances, batch_size=BATCH_SIZE)
+            new_pks = self.rows().filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)
+            for instance, pk in zip(instances, new_pks):
+                instance.pk = pk
+                instance._state.adding = False
+
+        self.changes.extend((None, AnalyticsCounters.values_of(instance)) for instance in instances)
+        return instances
+
+    def update(self, updates):
+        if not updates:
+            return []
+        instances = {
+            instance.pk: instance
+            for instance in self.rows().select_for_update().filter(pk__in=updates).order_by('pk')
+        }
+        now = timezone.now()
+        fields = {'updated_at'}
+        for pk, changed in updates.items():
+            instance = instances.get(pk)
+            if instance is None:
+                continue
+            previous = AnalyticsCounters.values_of(instance)
+            for field, value in changed.items():
+                setattr(instance, field, value)
+            fields.update(changed)
+            if hasattr(instance, 'fill_derived_fields'):
+                instance.fill_derived_fields()
+                fields.update(instance.DERIVED_FIELDS)
+            instance.updated_at = now
+            self.changes.append((previous, AnalyticsCounters.values_of(instance)))
+
+        updated = [instances[pk] for pk in updates if pk in instances]
+        self.model.objects.bulk_update(updated, sorted(fields), batch_size=BATCH_SIZE)
+        return updated
+
+    def delete(self, deletes):
+        if not deletes:
+            return []
+        fields, _, _ = TRACKED_MODELS[self.model]
+        doomed = self.rows().select_for_update().filter(pk__in=deletes).order_by('pk')
+        stored = {row.pop('pk'): row for row in doomed.values('pk', 'wedding_id', *fields)}
+        if self.model is Guest:
+            # Pledges go through the ORM so their signals keep the pledge totals
+            # and the payment events right
+            GuestPledge.objects.filter(guest_id__in=stored).delete()
+        # Nothing else references these rows, so one DELETE without the collector's per-row signals
+        self.rows().filter(pk__in=stored)._raw_delete(self.rows().db)
+
+        self.changes.extend((values, None) for values in stored.values())
+        return [pk for pk in deletes if pk in stored]
+
+    def record_changes(self, written, deleted):
+        if not self.changes:
+            return
+        wedding_id = self.wedding.pk
+        AnalyticsCounters.record_changes(self.model, self.changes)
+        if self.model is Guest:
+            AnalyticsEvents.record_rsvps(wedding_id, [
+                (current['rsvp_status'] if current else '', previous['rsvp_status'] if previous else '')
+                for previous, current in self.changes
+            ])
+        elif self.model is Budget:
+            AnalyticsEvents.record_spend(wedding_id, sum(
+                ((current or {}).get('actual_cost') or 0) - ((previous or {}).get('actual_cost') or 0)
+                for previous, current in self.changes
+            ))
+        if AnalyticsCounters.needs_recompute(self.model):
+            AnalyticsQueue.mark_dirty(wedding_id)
+        # No save signals fire, and callers outside a view get no invalidation from the mixin
+        AnalyticsCache.bump(wedding_id)
+
+        resource = RESOURCE_BY_MODEL[self.model]
+        ChangeLog.record(resource, [instance.pk for instance in written], wedding_id=wedding_id)
+        ChangeLog.record(resource, deleted, wedding_id=wedding_id, deleted=True)
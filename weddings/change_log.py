@@ -0,0 +1,186 @@
+"""Per-wedding change log behind the mobile delta sync.
+
+Every write to a synced row records (resource, object id) in WeddingChange
+under a sequence number taken from the wedding's WeddingChangeCounter.
+The entry is written once the data has committed, in its own short
+transaction that holds the counter row until it commits, so sequence
+numbers become visible in order and a client that has seen seq N has
+seen every change numbered up to N. Syncing with ?since=N then returns
+the rows changed after N and tombstones for the rows deleted after N.
+"""
+from collections import defaultdict, namedtuple
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework.serializers import BaseSerializer
+
+from .db_utils import upsert_kwargs
+from .models import (
+    Budget, Guest, GuestPledge, InvitationTemplate, Photo, PhotoGallery, PledgePayment,
+    Task, Timeline, Vendor, VendorNote, Wedding, WeddingChange, WeddingChangeCounter,
+)
+from .serializers import (
+    BudgetSerializer, GuestPledgeSerializer, GuestSerializer, InvitationTemplateSerializer,
+    PhotoGallerySerializer, PhotoSerializer, PledgePaymentSerializer, TaskSerializer,
+    TimelineSerializer, VendorNoteSerializer, VendorSerializer, WeddingSerializer,
+)
+
+# Entries returned per sync; a client with more to fetch gets has_more and syncs again
+SYNC_BATCH_SIZE = 1000
+
+SyncResource = namedtuple('SyncResource', ['model', 'wedding_path', 'serializer_class', 'select_related'])
+
+# Resource name -> model, lookup from a row to its wedding id, and how rows are sent
+SYNC_RESOURCES = {
+    'weddings': SyncResource(Wedding, 'pk', WeddingSerializer, ()),
+    'guests': SyncResource(Guest, 'wedding_id', GuestSerializer, ()),
+    'tasks': SyncResource(Task, 'wedding_id', TaskSerializer, ()),
+    'budget_items': SyncResource(Budget, 'wedding_id', BudgetSerializer, ()),
+    'timeline_events': SyncResource(Timeline, 'wedding_id', TimelineSerializer, ()),
+    'vendors': SyncResource(Vendor, 'wedding_id', VendorSerializer, ()),
+    'vendor_notes': SyncResource(VendorNote, 'vendor__wedding_id', VendorNoteSerializer, ('created_by',)),
+    'galleries': SyncResource(PhotoGallery, 'wedding_id', PhotoGallerySerializer, ()),
+    'photos': SyncResource(Photo, 'album__wedding_id', PhotoSerializer, ()),
+    'invitation_templates': SyncResource(InvitationTemplate, 'wedding_id', InvitationTemplateSerializer, ()),
+    'pledges': SyncResource(GuestPledge, 'wedding_id', GuestPledgeSerializer, ('guest',)),
+    'pledge_payments': SyncResource(PledgePayment, 'pledge__wedding_id', PledgePaymentSerializer, ('recorded_by',)),
+}
+RESOURCE_BY_MODEL = {resource.model: name for name, resource in SYNC_RESOURCES.items()}
+
+
+class ChangeLog:
+    """Record changes to synced rows and read them back for a sync"""
+
+    @staticmethod
+    def wedding_of(instance):
+        """The wedding id of a synced row, following its wedding path"""
+        path = SYNC_RESOURCES[RESOURCE_BY_MODEL[type(instance)]].wedding_path
+        return reduce(getattr, path.split('__'), instance)
+
+    @staticmethod
+    def record_instance(instance, deleted=False):
+        ChangeLog.record(
+            RESOURCE_BY_MODEL[type(instance)], [instance.pk],
+            wedding_id=ChangeLog.wedding_of(instance), deleted=deleted,
+        )
+
+    @staticmethod
+    def record(resource, object_ids, wedding_id=None, deleted=False):
+        """Log changed (or deleted) rows once the current transaction commits.
+
+        Without a wedding_id the rows' weddings are looked up when the
+        entries are written, so deleted rows must pass it.
+        """
+        object_ids = [pk for pk in object_ids if pk is not None]
+        if object_ids:
+            transaction.on_commit(
+                lambda: ChangeLog.write(resource, object_ids, wedding_id, deleted), robust=True,
+            )
+
+    @staticmethod
+    def write(resource, object_ids, wedding_id=None, deleted=False):
+        if wedding_id is not None:
+            ids_by_wedding = {wedding_id: object_ids}
+        else:
+            ids_by_wedding = defaultdict(list)
+            rows = SYNC_RESOURCES[resource].model.objects.filter(pk__in=object_ids)
+            for pk, row_wedding_id in rows.values_list('pk', SYNC_RESOURCES[resource].wedding_path):
+                ids_by_wedding[row_wedding_id].append(pk)
+
+        # A wedding deleted by the same transaction takes its log with it
+        existing = set(Wedding.objects.filter(pk__in=list(ids_by_wedding)).values_list('pk', flat=True))
+        for row_wedding_id, ids in ids_by_wedding.items():
+            if row_wedding_id not in existing:
+                continue
+            with transaction.atomic():
+                seq = ChangeLog.next_seq(row_wedding_id)
+                WeddingChange.objects.bulk_create(
+                    [
+                        WeddingChange(wedding_id=row_wedding_id, resource=resource, object_id=pk, seq=seq, deleted=deleted)
+                        for pk in ids
+                    ],
+                    **upsert_kwargs(WeddingChange, ['wedding', 'resource', 'object_id'], ['seq', 'deleted', 'changed_at']),
+                )
+
+    @staticmethod
+    def next_seq(wedding_id):
+        """Take the wedding's next sequence number; the counter stays locked until the commit"""
+        counters = WeddingChangeCounter.objects.filter(wedding_id=wedding_id)
+        if not counters.update(last_seq=F('last_seq') + 1):
+            WeddingChangeCounter.objects.bulk_create([WeddingChangeCounter(wedding_id=wedding_id)], ignore_conflicts=True)
+            counters.update(last_seq=F('last_seq') + 1)
+        return counters.values_list('last_seq', flat=True).get()
+
+    @staticmethod
+    def latest_seq(wedding_id):
+        return (
+            WeddingChangeCounter.objects.filter(wedding_id=wedding_id)
+            .values_list('last_seq', flat=True).first()
+        ) or 0
+
+    @staticmethod
+    def serialize(resource, rows, context):
+        """Flat rows: nested collections travel as resources of their own"""
+        serializer = SYNC_RESOURCES[resource].serializer_class(rows, many=True, context={**context, 'collections': []})
+        fields = serializer.child.fields
+        for name in [name for name, field in fields.items() if isinstance(field, BaseSerializer)]:
+            fields.pop(name)
+        return serializer.data
+
+    @staticmethod
+    def rows(resource, wedding_id, object_ids=None):
+        sync_resource = SYNC_RESOURCES[resource]
+        rows = sync_resource.model.objects.filter(**{sync_resource.wedding_path: wedding_id})
+        if object_ids is not None:
+            rows = rows.filter(pk__in=object_ids)
+        return rows.select_related(*sync_resource.select_related).order_by('pk')
+
+    @staticmethod
+    def changes_since(wedding_id, since=0, context=None):
+        """Rows changed and deleted after the cursor `since`.
+
+        Without a cursor (or with one this wedding never handed out) every
+        row is sent and the client should replace its local copy. The
+        counter is read first, so anything committed meanwhile comes back
+        in the next sync.
+        """
+        context = context or {}
+        latest = ChangeLog.latest_seq(wedding_id)
+        if since <= 0 or since > latest:
+            return {
+                'cursor': latest,
+                'full': True,
+                'has_more': False,
+                'changes': {
+                    resource: ChangeLog.serialize(resource, ChangeLog.rows(resource, wedding_id), context)
+                    for resource in SYNC_RESOURCES
+                },
+                'deleted': {},
+            }
+
+        entries = (
+            WeddingChange.objects.filter(wedding_id=wedding_id, seq__gt=since, seq__lte=latest)
+            .order_by('seq').values_list('seq', 'resource', 'object_id', 'deleted')
+        )
+        page = list(entries[:SYNC_BATCH_SIZE])
+        cursor = latest
+        if len(page) == SYNC_BATCH_SIZE:
+            # Never split one commit's entries across two syncs
+            cursor = page[-1][0]
+            page = list(entries.filter(seq__lte=cursor))
+
+        changed, deleted = defaultdict(list), defaultdict(list)
+        for _, resource, object_id, is_deleted in page:
+            if resource in SYNC_RESOURCES:
+                (deleted if is_deleted else changed)[resource].append(object_id)
+        return {
+            'cursor': cursor,
+            'full': False,
+            'has_more': cursor < latest,
+            'changes': {
+                resource: ChangeLog.serialize(resource, ChangeLog.rows(resource, wedding_id, ids), context)
+                for resource, ids in changed.items()
+            },
+            'deleted': dict(deleted),
+        }
@@ -0,0 +1,30 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def weak_etag(*parts):
+    """A weak ETag built from cheap change markers rather than the response body"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response when the request's validators still match, otherwise None.
+
+    Only the ETag decides: a change marker built from max(updated_at)
+    does not move when a row is deleted, so If-Modified-Since alone could
+    hide deletions. Last-Modified is still sent for caches.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
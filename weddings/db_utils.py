@@ -0,0 +1,14 @@
+from django.db import connections, router
+
+
+def upsert_kwargs(model, unique_fields, update_fields):
+    """bulk_create() arguments for an insert-or-update on the unique fields.
+
+    MySQL resolves the conflict from the table's unique keys and rejects an
+    explicit conflict target, so unique_fields is only passed where supported.
+    """
+    kwargs = {'update_conflicts': True, 'update_fields': update_fields}
+    connection = connections[router.db_for_write(model)]
+    if connection.features.supports_update_conflicts_with_target:
+        kwargs['unique_fields'] = unique_fields
+    return kwargs
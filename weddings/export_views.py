@@ -0,0 +1,27 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from .exports import EXPORT_FORMATS, EXPORTS, stream_export
+from .models import Wedding
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def download_export(request, wedding_id, name, file_format):
+    """Stream guests, pledges, payments, budget or vendors as .csv or .jsonl"""
+    wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+    if name not in EXPORTS or file_format not in EXPORT_FORMATS:
+        return Response(
+            {'error': f"Export one of {', '.join(EXPORTS)} as {' or '.join(EXPORT_FORMATS)}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    response = StreamingHttpResponse(
+        stream_export(name, file_format, wedding.id),
+        content_type=EXPORT_FORMATS[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}_{wedding.id}.{file_format}"'
+    # Let a buffering proxy pass the rows on as they are written
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,152 @@
+"""Streaming CSV and JSON Lines exports of a wedding's lists.
+
+Rows are read as tuples with values_list() one page at a time and encoded
+as they are read, so the response starts after the first page and memory
+stays flat however big the wedding. Pages are taken by primary key rather
+than with iterator(): the MySQL driver buffers a whole result set on the
+client, which a keyset page per query avoids on every backend.
+"""
+import csv
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+from .models import Budget, Guest, GuestPledge, PledgePayment, Vendor
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+Export = namedtuple('Export', ['model', 'wedding_path', 'columns'])
+
+# Export name -> model, lookup from a row to its wedding id, and (column, lookup)
+# pairs; the id comes first, since the pages are keyed on it
+EXPORTS = {
+    'guests': Export(Guest, 'wedding_id', (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('phone', 'phone'),
+        ('email', 'email'),
+        ('relationship', 'relationship'),
+        ('rsvp_status', 'rsvp_status'),
+        ('number_of_guests', 'number_of_guests'),
+        ('dietary_restrictions', 'dietary_restrictions'),
+        ('rsvp_responded_at', 'rsvp_responded_at'),
+        ('created_at', 'created_at'),
+    )),
+    'pledges': Export(GuestPledge, 'wedding_id', (
+        ('id', 'id'),
+        ('guest_id', 'guest_id'),
+        ('guest_name', 'guest__name'),
+        ('guest_phone', 'guest__phone'),
+        ('pledged_amount', 'pledged_amount'),
+        ('paid_amount', 'paid_amount'),
+        ('balance', 'balance'),
+        ('payment_status', 'payment_status'),
+        ('payment_method', 'payment_method'),
+        ('pledge_date', 'pledge_date'),
+        ('payment_deadline', 'payment_deadline'),
+        ('notes', 'notes'),
+    )),
+    'payments': Export(PledgePayment, 'pledge__wedding_id', (
+        ('id', 'id'),
+        ('pledge_id', 'pledge_id'),
+        ('guest_name', 'pledge__guest__name'),
+        ('amount', 'amount'),
+        ('payment_date', 'payment_date'),
+        ('payment_method', 'payment_method'),
+        ('reference_number', 'reference_number'),
+        ('notes', 'notes'),
+        ('created_at', 'created_at'),
+    )),
+    'budget': Export(Budget, 'wedding_id', (
+        ('id', 'id'),
+        ('category', 'category'),
+        ('item_name', 'item_name'),
+        ('estimated_cost', 'estimated_cost'),
+        ('actual_cost', 'actual_cost'),
+        ('notes', 'notes'),
+        ('created_at', 'created_at'),
+    )),
+    'vendors': Export(Vendor, 'wedding_id', (
+        ('id', 'id'),
+        ('vendor_type', 'vendor_type'),
+        ('business_name', 'business_name'),
+        ('contact_person', 'contact_person'),
+        ('phone', 'phone'),
+        ('email', 'email'),
+        ('website', 'website'),
+        ('status', 'status'),
+        ('quote', 'quote'),
+        ('deposit_paid', 'deposit_paid'),
+        ('final_amount', 'final_amount'),
+    )),
+}
+
+
+def _plain(value):
+    """A cell value as a JSON-ready scalar: decimals and dates become strings"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class _Line:
+    """A file-like target that hands back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(name, wedding_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """The rows of one export as value tuples, read a page at a time in id order"""
+    export = EXPORTS[name]
+    lookups = [lookup for _, lookup in export.columns]
+    rows = export.model.objects.filter(**{export.wedding_path: wedding_id}).order_by('pk')
+    last_pk = 0
+    while True:
+        page = list(rows.filter(pk__gt=last_pk).values_list(*lookups)[:chunk_size])
+        yield from page
+        if len(page) < chunk_size:
+            return
+        last_pk = page[-1][0]
+
+
+def stream_csv(name, wedding_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """CSV text: the header, then one string per page of rows"""
+    writer = csv.writer(_Line())
+    # The byte order mark lets Excel open UTF-8 names correctly
+    yield '\ufeff' + writer.writerow([column for column, _ in EXPORTS[name].columns])
+    page = []
+    for row in export_rows(name, wedding_id, chunk_size):
+        page.append(writer.writerow(['' if value is None else _plain(value) for value in row]))
+        if len(page) == chunk_size:
+            yield ''.join(page)
+            page = []
+    if page:
+        yield ''.join(page)
+
+
+def stream_jsonl(name, wedding_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """JSON Lines text: one object per row, one string per page of rows"""
+    columns = [column for column, _ in EXPORTS[name].columns]
+    page = []
+    for row in export_rows(name, wedding_id, chunk_size):
+        page.append(json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + '\n')
+        if len(page) == chunk_size:
+            yield ''.join(page)
+            page = []
+    if page:
+        yield ''.join(page)
+
+
+def stream_export(name, file_format, wedding_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encoded chunks of one export, ready for a StreamingHttpResponse"""
+    streams = {'csv': stream_csv, 'jsonl': stream_jsonl}
+    for text in streams[file_format](name, wedding_id, chunk_size):
+        yield text.encode('utf-8')
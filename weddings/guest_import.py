@@ -0,0 +1,225 @@
+"""Import guest lists from CSV or XLSX spreadsheets and vCard contact exports.
+
+Every reader is a generator of (line, fields) pairs, so a file is parsed
+one row at a time. GuestImport validates the rows with GuestSerializer a
+chunk at a time, skips phone numbers the wedding already has, and saves
+each chunk through BulkWrite, so memory stays flat however long the file.
+"""
+import csv
+import os
+import re
+
+from rest_framework.exceptions import ValidationError
+
+from .bulk_service import BulkWrite
+from .models import Guest
+from .phones import normalize_phone
+from .serializers import GuestSerializer
+
+CHUNK_SIZE = 500
+PREVIEW_ROWS = 20
+MAX_REPORTED_ERRORS = 500
+FORMATS = ['csv', 'xlsx', 'vcf']
+
+# Lower-cased spreadsheet headers per guest field, in order of preference
+GUEST_COLUMNS = {
+    'name': ['name', 'full name', 'guest', 'guest name', 'jina'],
+    'phone': ['phone', 'phone number', 'mobile', 'tel', 'telephone', 'simu', 'namba ya simu'],
+    'email': ['email', 'e-mail', 'email address', 'barua pepe'],
+    'relationship': ['relationship', 'relation', 'uhusiano'],
+    'rsvp_status': ['rsvp', 'rsvp status', 'rsvp_status', 'status'],
+    'number_of_guests': ['number of guests', 'number_of_guests', 'guests', 'party size', 'seats', 'idadi'],
+    'dietary_restrictions': ['dietary restrictions', 'dietary_restrictions', 'diet', 'chakula'],
+}
+CHOICE_FIELDS = ['relationship', 'rsvp_status']
+
+VCARD_PROPERTY = re.compile(r'^(?:[\w-]+\.)?([A-Za-z-]+)((?:;[^:]*)?):(.*)$')
+
+
+def guess_format(filename):
+    """'csv', 'xlsx' or 'vcf' from a file name, else None"""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    extension = {'vcard': 'vcf', 'txt': 'csv'}.get(extension, extension)
+    return extension if extension in FORMATS else None
+
+
+def _cell_text(value):
+    # Spreadsheets store phone numbers as numbers: 712345678.0 -> '712345678'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '' if value is None else str(value).strip()
+
+
+def _guest_fields(columns, row):
+    """Guest fields from one row given {field: column position}; blank cells are left out"""
+    fields = {}
+    for field, column in columns.items():
+        value = _cell_text(row[column] if column < len(row) else None)
+        if value:
+            fields[field] = value.lower() if field in CHOICE_FIELDS else value
+    return fields
+
+
+def _header_columns(headers):
+    """{field: position} for the recognised headers"""
+    positions = {_cell_text(header).lower(): index for index, header in enumerate(headers)}
+    columns = {}
+    for field, aliases in GUEST_COLUMNS.items():
+        for alias in aliases:
+            if alias in positions:
+                columns[field] = positions[alias]
+                break
+    if 'name' not in columns:
+        raise ValueError('The file needs a name column')
+    return columns
+
+
+def read_csv(lines):
+    """Guests from CSV text lines, with a header row"""
+    reader = csv.reader(lines)
+    columns = _header_columns(next(reader, []))
+    for row in reader:
+        if any(cell.strip() for cell in row):
+            yield reader.line_num, _guest_fields(columns, row)
+
+
+def read_xlsx(file):
+    """Guests from the first sheet of an XLSX workbook, with a header row"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import needs openpyxl; export the sheet as CSV instead')
+
+    # read_only streams the sheet XML instead of building every cell in memory
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = _header_columns(next(rows, ()))
+        for line, row in enumerate(rows, start=2):
+            if any(_cell_text(cell) for cell in row):
+                yield line, _guest_fields(columns, row)
+    finally:
+        workbook.close()
+
+
+def _unfolded(lines):
+    """vCard lines with folded continuations (leading space or tab) joined back"""
+    current, start = None, 0
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield start, current
+        current, start = line, line_number
+    if current is not None:
+        yield start, current
+
+
+def read_vcards(lines):
+    """Guests from a vCard (.vcf) contacts export, one per card"""
+    card, start = None, 0
+    for line_number, line in _unfolded(lines):
+        upper = line.strip().upper()
+        if upper == 'BEGIN:VCARD':
+            card, start = {}, line_number
+        elif upper == 'END:VCARD' and card is not None:
+            yield start, card
+            card = None
+        elif card is not None:
+            match = VCARD_PROPERTY.match(line.strip())
+            if not match:
+                continue
+            name, parameters, value = match.group(1).upper(), match.group(2).upper(), match.group(3).strip()
+            if name == 'FN' and value:
+                card['name'] = value.replace('\\,', ',')
+            elif name == 'N' and value and 'name' not in card:
+                # N:Family;Given;Middle;Prefix;Suffix
+                parts = [part for part in value.split(';') if part]
+                card['name'] = ' '.join(parts[1:2] + parts[:1])
+            elif name == 'TEL' and value and ('phone' not in card or 'CELL' in parameters):
+                card['phone'] = value.replace('tel:', '')
+            elif name == 'EMAIL' and value and 'email' not in card:
+                card['email'] = value
+
+
+def read_guests(file_format, file):
+    """Rows of an uploaded file: XLSX from a binary file, CSV and vCard from text lines"""
+    if file_format == 'xlsx':
+        return read_xlsx(file)
+    if file_format == 'vcf':
+        return read_vcards(file)
+    return read_csv(file)
+
+
+class GuestImport:
+    """Validate guest rows in chunks and save the new ones"""
+
+    def __init__(self, wedding, dry_run=False, context=None):
+        self.wedding = wedding
+        self.dry_run = dry_run
+        self.context = context or {}
+        self.seen_phones = set()
+        self.result = {
+            'dry_run': dry_run,
+            'rows': 0,
+            'imported': 0,
+            'valid': 0,
+            'duplicate_count': 0,
+            'duplicates': [],
+            'error_count': 0,
+            'errors': [],
+            'preview': [],
+        }
+
+    def run(self, rows, chunk_size=CHUNK_SIZE):
+        chunk = []
+        for line, fields in rows:
+            self.result['rows'] += 1
+            chunk.append((line, fields))
+            if len(chunk) >= chunk_size:
+                self.save_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.save_chunk(chunk)
+        return self.result
+
+    def report(self, kind, entry):
+        # Counted in full but listed only up to a limit, so a bad file cannot fill memory
+        self.result[f'{kind[:-1]}_count'] += 1
+        if len(self.result[kind]) < MAX_REPORTED_ERRORS:
+            self.result[kind].append(entry)
+
+    def save_chunk(self, chunk):
+        for _, fields in chunk:
+            if 'phone' in fields:
+                # Stored in E.164 when readable, so the list matches mobile money payers
+                fields['phone'] = normalize_phone(fields['phone']) or fields['phone']
+        phones = {fields['phone'] for _, fields in chunk if fields.get('phone', '').startswith('+')}
+        existing = set(
+            Guest.objects.filter(wedding=self.wedding, phone_normalized__in=phones)
+            .values_list('phone_normalized', flat=True)
+        )
+
+        validator = GuestSerializer(context=self.context)
+        creates = []
+        for line, fields in chunk:
+            try:
+                validated = validator.run_validation(fields)
+            except ValidationError as e:
+                self.report('errors', {'line': line, 'errors': e.detail})
+                continue
+            phone = fields['phone']
+            if phone.startswith('+') and (phone in existing or phone in self.seen_phones):
+                self.report('duplicates', {'line': line, 'name': fields['name'], 'phone': phone})
+                continue
+            self.seen_phones.add(phone)
+            creates.append(validated)
+            if len(self.result['preview']) < PREVIEW_ROWS:
+                self.result['preview'].append({'line': line, **fields})
+
+        self.result['valid'] += len(creates)
+        if creates and not self.dry_run:
+            created, _, _ = BulkWrite(self.wedding, Guest).run(creates=creates)
+            self.result['imported'] += len(created)
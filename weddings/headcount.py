@@ -0,0 +1,67 @@
+from django.db.models import BooleanField, Case, Count, Q, Value, When
+
+from .models import Guest
+
+RSVP_STATUSES = [status for status, _ in Guest.RSVP_CHOICES]
+RELATIONSHIPS = [relationship for relationship, _ in Guest.RELATIONSHIP_CHOICES]
+
+HAS_DIETARY = Case(
+    When(Q(dietary_restrictions__isnull=False) & ~Q(dietary_restrictions=''), then=Value(True)),
+    default=Value(False),
+    output_field=BooleanField(),
+)
+
+
+def _tally():
+    return {'invitations': 0, 'seats': 0}
+
+
+class GuestHeadcount:
+    """Invitation and seat counts for a wedding from one grouped query.
+
+    Guests are grouped by (rsvp_status, relationship, number_of_guests,
+    has dietary needs); a wedding has at most a few dozen such groups no
+    matter how many guests it has, and every total is folded from them.
+    """
+
+    @staticmethod
+    def rows(wedding_id):
+        return list(
+            Guest.objects.filter(wedding_id=wedding_id)
+            .annotate(has_dietary=HAS_DIETARY)
+            .values('rsvp_status', 'relationship', 'number_of_guests', 'has_dietary')
+            .annotate(invitations=Count('id'))
+            .order_by()
+        )
+
+    @staticmethod
+    def for_wedding(wedding_id):
+        return GuestHeadcount.summarize(GuestHeadcount.rows(wedding_id))
+
+    @staticmethod
+    def summarize(rows):
+        """Fold grouped rows into totals per RSVP status, relationship and dietary flag"""
+        headcount = _tally()
+        headcount['by_status'] = {status: _tally() for status in RSVP_STATUSES}
+        headcount['by_relationship'] = {relationship: _tally() for relationship in RELATIONSHIPS}
+        headcount['dietary'] = _tally()
+        headcount['group_sizes'] = {}
+
+        for row in rows:
+            invitations = row['invitations']
+            seats = row['number_of_guests'] * invitations
+            tallies = [
+                headcount,
+                headcount['by_status'].setdefault(row['rsvp_status'], _tally()),
+            ]
+            if row['relationship']:
+                tallies.append(headcount['by_relationship'].setdefault(row['relationship'], _tally()))
+            if row['has_dietary']:
+                tallies.append(headcount['dietary'])
+            for tally in tallies:
+                tally['invitations'] += invitations
+                tally['seats'] += seats
+
+            size = row['number_of_guests']
+            headcount['group_sizes'][size] = headcount['group_sizes'].get(size, 0) + invitations
+        return headcount
@@ -0,0 +1,101 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from django.db.models import Q
+
+from .models import HealthCohortPercentile
+
+# Wedding budgets in TZS; a wedding falls in the band of the last edge it reaches
+BUDGET_BAND_EDGES = [5_000_000, 15_000_000, 40_000_000]
+BUDGET_BANDS = ['under_5m', '5m_to_15m', '15m_to_40m', 'over_40m']
+
+MONTHS_BAND_EDGES = [0, 1, 3, 6, 12]
+MONTHS_BANDS = ['past', 'under_1', '1_to_3', '3_to_6', '6_to_12', 'over_12']
+DAYS_PER_MONTH = 30.44
+
+# Cohort covering every wedding, used when a wedding's own cohort is too small
+ALL = 'all'
+MIN_COHORT_SIZE = 20
+
+METRICS = [
+    'budget_health', 'task_health', 'guest_health', 'planning_health', 'overall_health',
+    'rsvp_response',
+]
+
+
+class HealthCohorts:
+    """Rank a wedding's health scores against the stored cohort cutoffs"""
+
+    @staticmethod
+    def budget_band(budget):
+        return BUDGET_BANDS[bisect_right(BUDGET_BAND_EDGES, float(budget or 0))]
+
+    @staticmethod
+    def months_band(days_until_wedding):
+        return MONTHS_BANDS[bisect_right(MONTHS_BAND_EDGES, days_until_wedding / DAYS_PER_MONTH)]
+
+    @staticmethod
+    def metric_values(analytics):
+        """The ranked value of every metric; rsvp_response is None before any invitation"""
+        values = {
+            'budget_health': analytics.budget_health_score,
+            'task_health': analytics.task_health_score,
+            'guest_health': analytics.guest_health_score,
+            'planning_health': analytics.planning_health_score,
+            'overall_health': analytics.overall_health_score,
+            'rsvp_response': None,
+        }
+        if analytics.total_invitations_sent > 0:
+            values['rsvp_response'] = (
+                (analytics.total_confirmed + analytics.total_declined)
+                / analytics.total_invitations_sent * 100
+            )
+        return values
+
+    @staticmethod
+    def percentile_rank(cutoffs, value):
+        """Percentile (0-100) of value among the scores described by 101 cutoffs"""
+        # Ties take the middle of their range so a common score is not ranked last
+        position = (bisect_left(cutoffs, value) + bisect_right(cutoffs, value)) / 2
+        return round(min(100, position * 100 / (len(cutoffs) - 1)))
+
+    @staticmethod
+    def rank(wedding, analytics, today=None):
+        """Percentile ranks of every metric within the wedding's cohort.
+
+        Returns {'cohort': {...}, 'percentiles': {metric: rank or None}} with a
+        single query over the lookup table. The months band is taken from the
+        wedding date, as HealthScoreEngine does: the stored days_until_wedding
+        stops at zero and would never place a wedding in the past band.
+        """
+        today = today or date.today()
+        budget_band = HealthCohorts.budget_band(wedding.budget)
+        months_band = HealthCohorts.months_band((wedding.wedding_date - today).days)
+        rows = HealthCohortPercentile.objects.filter(
+            Q(budget_band=budget_band, months_band=months_band) | Q(budget_band=ALL, months_band=ALL)
+        )
+        own, overall = {}, {}
+        for row in rows:
+            (overall if row.budget_band == ALL else own)[row.metric] = row
+
+        percentiles = {}
+        used = None
+        for metric, value in HealthCohorts.metric_values(analytics).items():
+            row = own.get(metric)
+            if row is None or row.sample_size < MIN_COHORT_SIZE:
+                row = overall.get(metric)
+            if row is None or value is None:
+                percentiles[metric] = None
+                continue
+            percentiles[metric] = HealthCohorts.percentile_rank(row.cutoffs, value)
+            if metric == 'overall_health':
+                used = row
+
+        return {
+            'cohort': {
+                'budget_band': used.budget_band if used else budget_band,
+                'months_band': used.months_band if used else months_band,
+                'size': used.sample_size if used else 0,
+            },
+            'percentiles': percentiles,
+        }
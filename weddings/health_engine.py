@@ -0,0 +1,178 @@
+"""Vectorized health scoring across all weddings.
+
+The per-wedding counters are loaded from WeddingAnalytics into NumPy
+columns and the five health scores are computed for every wedding in one
+pass, with the same formulas as WeddingAnalyticsService._calculate_health_scores.
+The scores then feed the cohort percentile cutoffs read by HealthCohorts.
+"""
+from datetime import date
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .analytics_cache import AnalyticsCache
+from .db_utils import upsert_kwargs
+from .health_cohorts import (
+    ALL, BUDGET_BAND_EDGES, BUDGET_BANDS, DAYS_PER_MONTH, METRICS, MONTHS_BAND_EDGES, MONTHS_BANDS,
+)
+from .models import HealthCohortPercentile, WeddingAnalytics
+
+SCORE_FIELDS = [
+    'budget_health_score', 'task_health_score', 'guest_health_score',
+    'planning_health_score', 'overall_health_score',
+]
+NUMERIC_FIELDS = [
+    'wedding__budget', 'total_estimated_budget', 'total_actual_spending', 'total_tasks',
+    'completion_percentage', 'overdue_tasks', 'total_invitations_sent', 'total_confirmed',
+    'total_declined',
+] + SCORE_FIELDS
+PERCENTILES = np.arange(101)
+
+
+def _ratio(numerator, denominator, default):
+    """numerator / denominator, with `default` where the denominator is zero"""
+    out = np.full(numerator.shape, default, dtype=float)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+class HealthScoreEngine:
+
+    @staticmethod
+    def load(queryset=None, today=None):
+        """Per-wedding columns as arrays, one row per WeddingAnalytics"""
+        today = today or date.today()
+        queryset = queryset if queryset is not None else WeddingAnalytics.objects.all()
+        rows = list(
+            queryset.order_by('pk').values_list(
+                'pk', 'wedding_id', 'wedding__wedding_date', 'completion_by_milestone', *NUMERIC_FIELDS
+            )
+        )
+        columns = {
+            'pk': np.array([row[0] for row in rows], dtype=np.int64),
+            'wedding_id': np.array([row[1] for row in rows], dtype=np.int64),
+        }
+        wedding_dates = np.array([row[2] for row in rows], dtype='datetime64[D]')
+        columns['days_until_wedding'] = (wedding_dates - np.datetime64(today)).astype(np.int64)
+
+        milestones = [row[3] or {} for row in rows]
+        columns['milestones'] = np.array([len(m) for m in milestones], dtype=float)
+        columns['milestones_completed'] = np.array(
+            [sum(1 for entry in m.values() if entry.get('completed')) for m in milestones],
+            dtype=float,
+        )
+
+        numeric = np.array([row[4:] for row in rows], dtype=float).reshape(len(rows), len(NUMERIC_FIELDS))
+        for index, field in enumerate(NUMERIC_FIELDS):
+            columns[field] = numeric[:, index]
+        return columns
+
+    @staticmethod
+    def scores(columns):
+        """All five health scores, plus the RSVP response rate (NaN before any invitation)"""
+        budget_ratio = _ratio(columns['total_actual_spending'], columns['total_estimated_budget'], np.nan)
+        budget = np.where(
+            columns['total_estimated_budget'] > 0, np.maximum(0, 100 - (budget_ratio - 1) * 100), 100
+        )
+
+        overdue_penalty = _ratio(columns['overdue_tasks'], columns['total_tasks'], 0) * 20
+        task = np.where(
+            columns['total_tasks'] > 0,
+            np.maximum(0, columns['completion_percentage'] - overdue_penalty),
+            100,
+        )
+
+        responded = columns['total_confirmed'] + columns['total_declined']
+        response_rate = _ratio(responded, columns['total_invitations_sent'], np.nan) * 100
+        guest = np.where(columns['total_invitations_sent'] > 0, response_rate, 100)
+
+        planning = _ratio(columns['milestones_completed'], columns['milestones'], 1) * 100
+
+        return {
+            'budget_health': budget,
+            'task_health': task,
+            'guest_health': guest,
+            'planning_health': planning,
+            'overall_health': (budget + task + guest + planning) / 4,
+            'rsvp_response': response_rate,
+        }
+
+    @staticmethod
+    def write_scores(columns, scores, batch_size=500):
+        """Save the scores of rows whose stored values differ; returns the number saved"""
+        computed = np.column_stack([scores[field[:-len('_score')]] for field in SCORE_FIELDS])
+        stored = np.column_stack([columns[field] for field in SCORE_FIELDS])
+        changed = np.flatnonzero(~np.isclose(computed, stored).all(axis=1))
+        if not changed.size:
+            return 0
+
+        now = timezone.now()
+        rows = WeddingAnalytics.objects.in_bulk(columns['pk'][changed].tolist())
+        for index in changed:
+            row = rows.get(int(columns['pk'][index]))
+            if row is None:
+                continue
+            for position, field in enumerate(SCORE_FIELDS):
+                setattr(row, field, float(computed[index, position]))
+            row.last_updated = now
+        WeddingAnalytics.objects.bulk_update(
+            rows.values(), SCORE_FIELDS + ['last_updated'], batch_size=batch_size
+        )
+        for row in rows.values():
+            AnalyticsCache.bump(row.wedding_id)
+        return len(rows)
+
+    @staticmethod
+    def cohort_percentiles(columns, scores):
+        """Percentile cutoffs of every metric for each (budget band, months band) and overall"""
+        budget_band = np.searchsorted(BUDGET_BAND_EDGES, columns['wedding__budget'], side='right')
+        months = columns['days_until_wedding'] / DAYS_PER_MONTH
+        months_band = np.searchsorted(MONTHS_BAND_EDGES, months, side='right')
+
+        cohorts = [(ALL, ALL, np.ones(budget_band.shape, dtype=bool))]
+        for b, m in sorted(set(zip(budget_band.tolist(), months_band.tolist()))):
+            cohorts.append((BUDGET_BANDS[b], MONTHS_BANDS[m], (budget_band == b) & (months_band == m)))
+
+        now = timezone.now()
+        entries = []
+        for budget_label, months_label, mask in cohorts:
+            for metric in METRICS:
+                values = scores[metric][mask]
+                values = values[~np.isnan(values)]
+                if not values.size:
+                    continue
+                entries.append(HealthCohortPercentile(
+                    budget_band=budget_label,
+                    months_band=months_label,
+                    metric=metric,
+                    sample_size=int(values.size),
+                    cutoffs=np.percentile(values, PERCENTILES).round(2).tolist(),
+                    computed_at=now,
+                ))
+        return entries
+
+    @staticmethod
+    def save_cohorts(entries, wedding_ids=()):
+        """Replace the lookup table with the given cutoffs.
+
+        Every wedding's cached health response carries its percentile ranks,
+        so the weddings ranked against the table (all of them, on a full
+        rebuild) are invalidated once the new cutoffs are saved.
+        """
+        with transaction.atomic():
+            HealthCohortPercentile.objects.bulk_create(
+                entries,
+                **upsert_kwargs(
+                    HealthCohortPercentile,
+                    ['budget_band', 'months_band', 'metric'],
+                    ['sample_size', 'cutoffs', 'computed_at'],
+                ),
+            )
+            if entries:
+                # Cohorts that no longer have any wedding
+                HealthCohortPercentile.objects.filter(computed_at__lt=entries[0].computed_at).delete()
+            else:
+                HealthCohortPercentile.objects.all().delete()
+        for wedding_id in wedding_ids:
+            AnalyticsCache.bump(wedding_id)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from weddings.analytics_cache import AnalyticsCache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss/eviction counters of the analytics response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = AnalyticsCache.stats()
+        for name in ['hits', 'misses', 'evictions', 'invalidations']:
+            self.stdout.write(f'{name:>14}: {stats[name]}')
+        self.stdout.write(f"{'hit rate':>14}: {stats['hit_rate']:.1f}%")
+
+        if options['reset']:
+            AnalyticsCache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
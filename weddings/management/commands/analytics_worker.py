@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from weddings.analytics_queue import AnalyticsQueue
+
+
+class Command(BaseCommand):
+    help = 'Recompute queued wedding analytics, once per wedding per debounce window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debounce', type=int, default=30,
+                            help='Seconds a wedding must go without writes before it is recomputed')
+        parser.add_argument('--max-wait', type=int, default=300,
+                            help='Recompute anyway once a wedding has been queued this many seconds')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep when nothing is ready')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sweep-every', type=int, default=600,
+                            help='Seconds between sweeps for missing or out-of-date rows')
+        parser.add_argument('--once', action='store_true', help='Process what is ready and exit')
+
+    def handle(self, *args, **options):
+        last_sweep = None
+        while True:
+            now = time.monotonic()
+            if last_sweep is None or now - last_sweep >= options['sweep_every']:
+                queued = AnalyticsQueue.enqueue_outdated()
+                if queued:
+                    self.stdout.write(f'Queued {queued} out-of-date wedding(s)')
+                last_sweep = now
+
+            started = time.monotonic()
+            processed = AnalyticsQueue.process_ready(
+                debounce=options['debounce'],
+                max_wait=options['max_wait'],
+                limit=options['batch_size'],
+            )
+            if processed:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'Recomputed {len(processed)} wedding(s) in {elapsed:.2f}s')
+
+            if options['once']:
+                break
+            if len(processed) < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from weddings.analytics_service import WeddingAnalyticsService
+from weddings.models import Wedding
+
+
+class Command(BaseCommand):
+    help = 'Compare the incrementally maintained analytics counters with a full recompute'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wedding_ids', nargs='*', type=int, help='Only check these weddings')
+        parser.add_argument('--repair', action='store_true', help='Rebuild rows that have drifted')
+
+    def handle(self, *args, **options):
+        weddings = Wedding.objects.order_by('pk')
+        if options['wedding_ids']:
+            weddings = weddings.filter(pk__in=options['wedding_ids'])
+
+        checked = drifted = 0
+        for wedding in weddings.iterator():
+            checked += 1
+            drift = WeddingAnalyticsService.verify_analytics(wedding)
+            if not drift:
+                continue
+
+            drifted += 1
+            self.stdout.write(self.style.WARNING(f'Wedding {wedding.pk}: {len(drift)} field(s) drifted'))
+            for field, (stored, expected) in drift.items():
+                self.stdout.write(f'  {field}: stored={stored!r} expected={expected!r}')
+            if options['repair']:
+                WeddingAnalyticsService.calculate_analytics(wedding)
+                self.stdout.write(self.style.SUCCESS('  repaired'))
+
+        self.stdout.write(f'Checked {checked} wedding(s), {drifted} drifted')
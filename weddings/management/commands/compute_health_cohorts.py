@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Rescore every wedding in one vectorized pass and rebuild the cohort percentile table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-scores', action='store_true',
+                            help='Only rebuild the percentiles; leave the stored scores alone')
+
+    def handle(self, *args, **options):
+        try:
+            from weddings.health_engine import HealthScoreEngine
+        except ImportError as e:
+            raise CommandError(f'The health engine needs NumPy: {e}')
+
+        started = time.perf_counter()
+        columns = HealthScoreEngine.load()
+        scores = HealthScoreEngine.scores(columns)
+        self.stdout.write(f"Scored {len(columns['pk'])} wedding(s) in {time.perf_counter() - started:.2f}s")
+
+        if not options['skip_scores']:
+            updated = HealthScoreEngine.write_scores(columns, scores)
+            self.stdout.write(f'Updated {updated} stored score row(s)')
+
+        entries = HealthScoreEngine.cohort_percentiles(columns, scores)
+        HealthScoreEngine.save_cohorts(entries, columns['wedding_id'].tolist())
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {len(entries)} cohort percentile row(s) in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weddings.analytics_service import WeddingAnalyticsService
+from weddings.models import Wedding
+
+
+class Command(BaseCommand):
+    help = "Create or refresh this week's analytics snapshot for every active wedding (safe to re-run)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--include-past', action='store_true',
+                            help='Also snapshot weddings whose date has passed')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        today = date.today()
+        weddings = Wedding.objects.exclude(status__in=['completed', 'cancelled'])
+        if not options['include_past']:
+            weddings = weddings.filter(wedding_date__gte=today)
+        wedding_ids = list(weddings.order_by('pk').values_list('pk', flat=True))
+
+        written = 0
+        for start in range(0, len(wedding_ids), options['chunk_size']):
+            chunk = wedding_ids[start:start + options['chunk_size']]
+            written += WeddingAnalyticsService.create_weekly_snapshots(chunk, today)
+
+        iso_year, week_number, _ = today.isocalendar()
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {written} snapshot(s) for week {week_number} of {iso_year}'
+        ))
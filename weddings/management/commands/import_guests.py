@@ -0,0 +1,54 @@
+import csv
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weddings.guest_import import CHUNK_SIZE, FORMATS, GuestImport, guess_format, read_guests
+from weddings.models import Wedding
+
+
+class Command(BaseCommand):
+    help = 'Import a guest list from a CSV or XLSX spreadsheet or a vCard contacts export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wedding_id', type=int)
+        parser.add_argument('path', help='Guest list file')
+        parser.add_argument('--format', choices=FORMATS, help='File type, when the extension does not tell')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without saving')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        try:
+            wedding = Wedding.objects.get(pk=options['wedding_id'])
+        except Wedding.DoesNotExist:
+            raise CommandError(f"Wedding {options['wedding_id']} does not exist")
+        file_format = options['format'] or guess_format(options['path'])
+        if file_format is None:
+            raise CommandError(f"Cannot tell the type of {options['path']}; pass --format")
+
+        started = time.perf_counter()
+        importer = GuestImport(wedding, dry_run=options['dry_run'])
+        try:
+            if file_format == 'xlsx':
+                with open(options['path'], 'rb') as handle:
+                    result = importer.run(read_guests(file_format, handle), chunk_size=options['chunk_size'])
+            else:
+                with open(options['path'], encoding='utf-8-sig', newline='') as handle:
+                    result = importer.run(read_guests(file_format, handle), chunk_size=options['chunk_size'])
+        except (OSError, ValueError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+
+        for entry in result['errors']:
+            problems = '; '.join(f'{field}: {" ".join(map(str, messages))}' for field, messages in entry['errors'].items())
+            self.stdout.write(f"Line {entry['line']}: {problems}")
+        for entry in result['duplicates']:
+            self.stdout.write(f"Line {entry['line']}: {entry['name']} ({entry['phone']}) is already on the list")
+        action = 'Would import' if options['dry_run'] else 'Imported'
+        count = result['valid'] if options['dry_run'] else result['imported']
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {count} of {result['rows']} guest(s) in {time.perf_counter() - started:.2f}s; "
+            f"{result['duplicate_count']} duplicate(s), {result['error_count']} invalid"
+        ))
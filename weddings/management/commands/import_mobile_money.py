@@ -0,0 +1,60 @@
+import csv
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from weddings.mobile_money import CHUNK_SIZE, MobileMoneyImport, read_messages, read_statement, split_messages
+from weddings.models import Wedding
+
+
+class Command(BaseCommand):
+    help = 'Import a mobile money statement CSV (or a file of transaction SMS texts) as pledge payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wedding_id', type=int)
+        parser.add_argument('path', help='Statement CSV, or a text file of SMS messages with --sms')
+        parser.add_argument('--sms', action='store_true',
+                            help='The file holds transaction SMS texts separated by blank lines')
+        parser.add_argument('--recorded-by', help='Username to record the payments under')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        try:
+            wedding = Wedding.objects.get(pk=options['wedding_id'])
+        except Wedding.DoesNotExist:
+            raise CommandError(f"Wedding {options['wedding_id']} does not exist")
+        recorded_by = None
+        if options['recorded_by']:
+            try:
+                recorded_by = User.objects.get(username=options['recorded_by'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['recorded_by']} does not exist")
+
+        started = time.perf_counter()
+        importer = MobileMoneyImport(wedding, recorded_by=recorded_by)
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as handle:
+                if options['sms']:
+                    transactions = read_messages(split_messages(handle.read()))
+                else:
+                    transactions = read_statement(handle)
+                result = importer.run(transactions, chunk_size=options['chunk_size'])
+        except (OSError, ValueError, UnicodeDecodeError, csv.Error) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+
+        for entry in result['unmatched']:
+            self.stdout.write(
+                f"Line {entry['line']}: {entry['reference']} TZS {entry['amount']:,.2f} "
+                f"from {entry['phone'] or 'unknown'} not imported: {entry['reason']}"
+            )
+        for entry in result['errors']:
+            self.stdout.write(f"Line {entry['line']}: {entry['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} payment(s) totalling TZS {result['amount']:,.2f} "
+            f"in {time.perf_counter() - started:.2f}s; {len(result['duplicates'])} duplicate(s), "
+            f"{len(result['unmatched'])} unmatched, {len(result['errors'])} unreadable, "
+            f"{result['skipped']} non-incoming row(s) skipped"
+        ))
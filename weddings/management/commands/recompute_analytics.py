@@ -0,0 +1,103 @@
+import heapq
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from weddings.analytics_batch import compute_chunk, init_worker, write_results
+from weddings.models import Wedding
+
+
+class Command(BaseCommand):
+    help = 'Recompute analytics, engagement metrics and health scores for many weddings at once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wedding_ids', nargs='*', type=int)
+        parser.add_argument('--days-ahead', type=int,
+                            help='Only weddings taking place within this many days from today')
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 0 computes in this process')
+        parser.add_argument('--slowest', type=int, default=10,
+                            help='Number of slowest weddings to report')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        weddings = Wedding.objects.order_by('pk')
+        if options['wedding_ids']:
+            weddings = weddings.filter(pk__in=options['wedding_ids'])
+        if options['days_ahead'] is not None:
+            today = date.today()
+            weddings = weddings.filter(
+                wedding_date__gte=today,
+                wedding_date__lte=today + timedelta(days=options['days_ahead']),
+            )
+
+        self.total = 0
+        self.slowest = []
+        self.keep = options['slowest']
+        self.started_at = timezone.now()
+        started = time.perf_counter()
+
+        chunks = self.chunks(weddings, options['chunk_size'])
+        if options['workers'] > 0:
+            self.run_pool(chunks, options['workers'])
+        else:
+            for chunk in chunks:
+                self.save(compute_chunk(chunk))
+
+        elapsed = time.perf_counter() - started
+        rate = self.total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {self.total} wedding(s) in {elapsed:.2f}s ({rate:.1f} weddings/sec)'
+        ))
+        slowest = sorted(self.slowest, reverse=True)
+        if slowest:
+            self.stdout.write('Slowest weddings:')
+            for seconds, wedding_id in slowest:
+                self.stdout.write(f'  {wedding_id}: {seconds * 1000:.0f}ms')
+
+    def chunks(self, weddings, size):
+        chunk = []
+        for wedding_id in weddings.values_list('pk', flat=True).iterator(chunk_size=size):
+            chunk.append(wedding_id)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run_pool(self, chunks, workers):
+        # Children must not inherit the parent's sockets; spawn gives each
+        # worker its own connections once init_worker has set Django up
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context('spawn'), initializer=init_worker
+        ) as pool:
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(compute_chunk, chunk))
+                # Bound the in-flight chunks so the id iterator isn't drained up front
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.save(future.result())
+            for future in pending:
+                self.save(future.result())
+
+    def save(self, results):
+        write_results(results, self.started_at)
+        self.total += len(results)
+        for result in results:
+            # Min-heap of the slowest weddings seen so far
+            heapq.heappush(self.slowest, (result['seconds'], result['wedding_id']))
+            if len(self.slowest) > self.keep:
+                heapq.heappop(self.slowest)
+        self.stdout.write(f'Saved {self.total} wedding(s)')
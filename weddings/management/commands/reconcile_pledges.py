@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weddings.models import GuestPledge
+from weddings.pledge_service import PledgeReconciliation
+
+
+class Command(BaseCommand):
+    help = 'Compare every pledge with the sum of its payments and optionally repair the drifted ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('wedding_ids', nargs='*', type=int, help='Only check these weddings')
+        parser.add_argument('--repair', action='store_true', help='Rewrite drifted pledges from their payments')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--quiet', action='store_true', help='Only print the totals')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        started = time.perf_counter()
+        pledges = GuestPledge.objects.all()
+        if options['wedding_ids']:
+            pledges = pledges.filter(wedding_id__in=options['wedding_ids'])
+
+        drifted = []
+        for row in PledgeReconciliation.drifted(pledges).iterator(chunk_size=2000):
+            drifted.append(row['pk'])
+            if not options['quiet']:
+                self.stdout.write(self.style.WARNING(
+                    f"Pledge {row['pk']} (wedding {row['wedding_id']}): "
+                    f"paid {row['paid_amount']} -> {row['true_paid']}, "
+                    f"balance {row['balance']} -> {row['expected_balance']}, "
+                    f"status {row['payment_status']} -> {row['expected_status']}"
+                ))
+        self.stdout.write(f'{len(drifted)} drifted pledge(s) found in {time.perf_counter() - started:.2f}s')
+
+        if options['repair'] and drifted:
+            repaired = PledgeReconciliation.repair(drifted, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Repaired {repaired} pledge(s) in {time.perf_counter() - started:.2f}s'
+            ))
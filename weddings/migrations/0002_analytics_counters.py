@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+def drop_stale_analytics(apps, schema_editor):
+    # Rows computed before counters were maintained incrementally have no
+    # seat totals; drop them so the first read rebuilds them from scratch.
+    WeddingAnalytics = apps.get_model('weddings', 'WeddingAnalytics')
+    WeddingAnalytics.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weddinganalytics',
+            name='computed_for',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='weddinganalytics',
+            name='total_guest_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(drop_stale_analytics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0002_analytics_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsDirtyMark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_marked_at', models.DateTimeField()),
+                ('last_marked_at', models.DateTimeField()),
+                ('wedding', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_dirty_mark', to='weddings.wedding')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_marked_at'], name='weddings_an_last_ma_77e453_idx'), models.Index(fields=['first_marked_at'], name='weddings_an_first_m_d73e49_idx')],
+            },
+        ),
+    ]
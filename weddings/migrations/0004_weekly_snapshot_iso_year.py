@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:05
+
+from datetime import date
+
+from django.db import migrations, models
+
+
+def snapshot_iso_year(created_at, week_number):
+    # The stored week is normally created_at's own ISO week, but a snapshot
+    # written late or by a clock in another zone can name a neighbouring one.
+    # Take the Monday of that week closest to created_at, so the first days of
+    # January can still belong to the last week of the previous ISO year and
+    # the last days of December to week 1 of the next.
+    day = created_at.date()
+    week_starts = []
+    for year in (day.year - 1, day.year, day.year + 1):
+        try:
+            week_starts.append(date.fromisocalendar(year, week_number, 1))
+        except ValueError:
+            continue
+    week_start = min(week_starts, key=lambda monday: abs((monday - day).days))
+    return week_start.isocalendar()[0]
+
+
+def fill_iso_year(apps, schema_editor):
+    # Repeated calls left several rows per week; keep the most recent one.
+    WeeklyAnalyticsSnapshot = apps.get_model('weddings', 'WeeklyAnalyticsSnapshot')
+    seen = set()
+    duplicates = []
+    for snapshot in WeeklyAnalyticsSnapshot.objects.order_by('-created_at', '-id').iterator():
+        iso_year = snapshot_iso_year(snapshot.created_at, snapshot.week_number)
+        key = (snapshot.wedding_id, iso_year, snapshot.week_number)
+        if key in seen:
+            duplicates.append(snapshot.id)
+            continue
+        seen.add(key)
+        snapshot.iso_year = iso_year
+        snapshot.save(update_fields=['iso_year'])
+    WeeklyAnalyticsSnapshot.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0003_analytics_dirty_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weeklyanalyticssnapshot',
+            name='iso_year',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(fill_iso_year, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='weeklyanalyticssnapshot',
+            name='iso_year',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterModelOptions(
+            name='weeklyanalyticssnapshot',
+            options={'ordering': ['iso_year', 'week_number'], 'verbose_name_plural': 'Weekly Analytics Snapshots'},
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyanalyticssnapshot',
+            constraint=models.UniqueConstraint(fields=('wedding', 'iso_year', 'week_number'), name='unique_weekly_snapshot'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:40
+
+import django.db.models.deletion
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_events(apps, schema_editor):
+    # Start every series from the current state: one event per existing
+    # guest, spent budget item and payment, dated when the row was created.
+    AnalyticsEvent = apps.get_model('weddings', 'AnalyticsEvent')
+    Guest = apps.get_model('weddings', 'Guest')
+    Budget = apps.get_model('weddings', 'Budget')
+    PledgePayment = apps.get_model('weddings', 'PledgePayment')
+
+    events = [
+        AnalyticsEvent(wedding_id=wedding_id, kind='rsvp', label=status, occurred_at=created_at)
+        for wedding_id, status, created_at in Guest.objects.values_list('wedding_id', 'rsvp_status', 'created_at').iterator()
+    ]
+    events += [
+        AnalyticsEvent(wedding_id=wedding_id, kind='spend', amount=actual_cost, occurred_at=created_at)
+        for wedding_id, actual_cost, created_at in (
+            Budget.objects.exclude(actual_cost__isnull=True).exclude(actual_cost=0)
+            .values_list('wedding_id', 'actual_cost', 'created_at').iterator()
+        )
+    ]
+    events += [
+        AnalyticsEvent(
+            wedding_id=wedding_id, kind='payment', amount=amount,
+            occurred_at=timezone.make_aware(datetime.combine(payment_date, time.min)),
+        )
+        for wedding_id, amount, payment_date in (
+            PledgePayment.objects.values_list('pledge__wedding_id', 'amount', 'payment_date').iterator()
+        )
+    ]
+    AnalyticsEvent.objects.bulk_create(events, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0004_weekly_snapshot_iso_year'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('rsvp', 'RSVP Transition'), ('spend', 'Budget Spend Change'), ('payment', 'Pledge Payment')], max_length=10)),
+                ('label', models.CharField(blank=True, max_length=20)),
+                ('previous_label', models.CharField(blank=True, max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('occurred_at', models.DateTimeField()),
+                ('wedding', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='analytics_events', to='weddings.wedding')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wedding', 'kind', 'occurred_at'], name='weddings_an_wedding_aa5871_idx')],
+            },
+        ),
+        migrations.RunPython(seed_events, migrations.RunPython.noop),
+    ]
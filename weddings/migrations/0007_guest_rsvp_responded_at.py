@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0006_guest_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='rsvp_responded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
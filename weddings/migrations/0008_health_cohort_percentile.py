@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0007_guest_rsvp_responded_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthCohortPercentile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('budget_band', models.CharField(max_length=20)),
+                ('months_band', models.CharField(max_length=20)),
+                ('metric', models.CharField(max_length=30)),
+                ('sample_size', models.IntegerField()),
+                ('cutoffs', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('budget_band', 'months_band', 'metric'), name='unique_health_cohort_metric')],
+            },
+        ),
+    ]
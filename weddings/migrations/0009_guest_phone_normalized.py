@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+from weddings.phones import normalize_phone
+
+
+def fill_phone_normalized(apps, schema_editor):
+    Guest = apps.get_model('weddings', 'Guest')
+    batch = []
+    for guest in Guest.objects.only('pk', 'phone').iterator(chunk_size=2000):
+        guest.phone_normalized = normalize_phone(guest.phone)
+        if guest.phone_normalized:
+            batch.append(guest)
+        if len(batch) >= 1000:
+            Guest.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    Guest.objects.bulk_update(batch, ['phone_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0008_health_cohort_percentile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.RunPython(fill_phone_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pledgepayment',
+            name='reference_number',
+            field=models.CharField(blank=True, db_index=True, help_text='Transaction ID, Receipt No, etc', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['wedding', 'phone_normalized'], name='guest_wedding_phone_idx'),
+        ),
+    ]
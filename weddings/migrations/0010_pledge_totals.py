@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_pledge_totals(apps, schema_editor):
+    Wedding = apps.get_model('weddings', 'Wedding')
+    PledgeTotals = apps.get_model('weddings', 'PledgeTotals')
+    statuses = ['pledged', 'partial', 'paid', 'cancelled']
+    rows = Wedding.objects.order_by().values('pk').annotate(
+        total_pledged=Sum('pledges__pledged_amount'),
+        total_paid=Sum('pledges__paid_amount'),
+        total_balance=Sum('pledges__balance'),
+        pledge_count=Count('pledges'),
+        **{f'{status}_count': Count('pledges', filter=Q(pledges__payment_status=status)) for status in statuses},
+    )
+    totals = []
+    for row in rows.iterator(chunk_size=2000):
+        wedding_id = row.pop('pk')
+        totals.append(PledgeTotals(wedding_id=wedding_id, **{field: value or 0 for field, value in row.items()}))
+        if len(totals) >= 1000:
+            PledgeTotals.objects.bulk_create(totals)
+            totals = []
+    PledgeTotals.objects.bulk_create(totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0009_guest_phone_normalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PledgeTotals',
+            fields=[
+                ('wedding', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pledge_totals', serialize=False, to='weddings.wedding')),
+                ('total_pledged', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pledge_count', models.IntegerField(default=0)),
+                ('pledged_count', models.IntegerField(default=0)),
+                ('partial_count', models.IntegerField(default=0)),
+                ('paid_count', models.IntegerField(default=0)),
+                ('cancelled_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(fill_pledge_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0010_pledge_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='budget',
+            index=models.Index(fields=['wedding', 'created_at', 'id'], name='budget_wedding_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['wedding', 'created_at', 'id'], name='guest_wedding_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guestpledge',
+            index=models.Index(fields=['wedding', 'created_at', 'id'], name='pledge_wedding_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['album', 'uploaded_at', 'id'], name='photo_album_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pledgepayment',
+            index=models.Index(fields=['pledge', 'created_at', 'id'], name='payment_pledge_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['wedding', 'created_at', 'id'], name='task_wedding_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(fields=['wedding', 'created_at', 'id'], name='vendor_wedding_cursor_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weddings', '0012_sync_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['wedding', 'rsvp_status', 'relationship'], name='guest_wedding_rsvp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guestpledge',
+            index=models.Index(fields=['wedding', 'payment_status', 'balance'], name='pledge_wedding_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['wedding', 'status', 'due_date'], name='task_wedding_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['wedding', 'priority', 'due_date'], name='task_wedding_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(fields=['wedding', 'status', 'vendor_type'], name='vendor_wedding_status_idx'),
+        ),
+    ]
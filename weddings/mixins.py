@@ -0,0 +1,219 @@
+from collections import Counter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, Max
+from django.db.models.constants import LOOKUP_SEP
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .analytics_cache import AnalyticsCache
+from .conditional import not_modified, set_validators, weak_etag
+
+
+def listed_names(request, param):
+    """Names listed in ?<param>=a,b"""
+    return {name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()}
+
+
+def requested_expansions(request):
+    """Names listed in ?expand=a,b"""
+    return listed_names(request, 'expand')
+
+
+def sparse_field_names(request, names):
+    """The field names to render for ?fields=a,b and ?omit=c,d; id always stays"""
+    wanted, omitted = listed_names(request, 'fields'), listed_names(request, 'omit')
+    return [
+        name for name in names
+        if name == 'id' or ((not wanted or name in wanted) and name not in omitted)
+    ]
+
+
+def is_sparse_request(request):
+    return request.method in SAFE_METHODS and ('fields' in request.query_params or 'omit' in request.query_params)
+
+
+class AnalyticsCacheInvalidationMixin:
+    """Bump the wedding's analytics cache version after every successful write"""
+    wedding_lookup_kwarg = 'wedding_id'
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            wedding_id = self.kwargs.get(self.wedding_lookup_kwarg)
+            if wedding_id is not None:
+                AnalyticsCache.bump(wedding_id)
+        return response
+
+
+class ConditionalListMixin:
+    """Answer unchanged list requests with 304 Not Modified before serializing.
+
+    The validators come from one aggregate over the filtered queryset: the
+    row count catches deletions and max(updated_at) catches edits. Views
+    whose payload also depends on related rows add markers for them in
+    get_list_markers() for to-one relations, or in get_related_markers()
+    for to-many ones, whose join would repeat the rows being counted.
+    """
+
+    def get_list_markers(self):
+        return {'count': Count('pk'), 'last_modified': Max('updated_at')}
+
+    def get_related_markers(self, queryset):
+        return {}
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        markers = queryset.aggregate(**self.get_list_markers())
+        markers.update(self.get_related_markers(queryset))
+        etag = weak_etag(request.user.pk, request.get_full_path(), sorted(markers.items()))
+        response = not_modified(request, etag, markers['last_modified'])
+        if response is not None:
+            return response
+        response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, markers['last_modified'])
+
+
+class SparseFieldsQuerysetMixin:
+    """Load only the columns a ?fields= / ?omit= response renders.
+
+    List and detail reads narrow the queryset with .only() and drop the
+    prefetches of nested collections that are left out. A rendered field
+    whose columns cannot be told (a method field or model property that
+    the serializer does not list in field_columns) loads the whole row.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in ('list', 'retrieve') and is_sparse_request(self.request):
+            queryset = self.sparse_queryset(queryset)
+        return queryset
+
+    def sparse_queryset(self, queryset):
+        serializer = self.get_serializer()
+        field_columns = getattr(serializer, 'field_columns', {})
+        query = queryset.query
+        if query.select_related is True:
+            return queryset
+
+        columns, sources = {'pk'}, set()
+        for name, field in serializer.fields.items():
+            if name in field_columns:
+                columns.update(field_columns[name])
+                continue
+            if not field.source_attrs:
+                return queryset
+            source = field.source_attrs[0]
+            sources.add(source)
+            if source in query.annotations:
+                continue
+            try:
+                model_field = queryset.model._meta.get_field(source)
+            except FieldDoesNotExist:
+                return queryset
+            if model_field.concrete:
+                columns.add(source)
+
+        # Keep what select_related() and earlier .only() calls load from related rows
+        if query.select_related:
+            columns.update(query.select_related)
+        names, deferred = query.deferred_loading
+        if not deferred:
+            columns.update(name for name in names if LOOKUP_SEP in name)
+        if isinstance(self.paginator, CursorPagination):
+            columns.update(name.lstrip('-') for name in self.paginator.get_ordering(self.request, queryset, self))
+
+        lookups = queryset._prefetch_related_lookups
+        kept = [
+            lookup for lookup in lookups
+            if getattr(lookup, 'prefetch_to', lookup).split(LOOKUP_SEP)[0] in sources
+        ]
+        if len(kept) != len(lookups):
+            queryset = queryset.prefetch_related(None).prefetch_related(*kept)
+        return queryset.only(*columns)
+
+
+def row_errors(serializer, count):
+    """A many=True serializer's errors as one dict per row, empty for valid rows"""
+    errors = serializer.errors
+    if isinstance(errors, dict):
+        return [dict(errors.get(index, {})) for index in range(count)]
+    return [dict(error) for error in errors]
+
+
+class BulkWriteMixin:
+    """POST {"create": [...], "update": [{"id": ..., ...}], "delete": [ids]} to change many rows at once.
+
+    Every row is validated first; if any fails nothing is written and the
+    errors come back per row. Otherwise the batch is written in one
+    transaction and the created and updated rows are returned in order.
+    """
+
+    def bulk(self, request, wedding_id=None):
+        from .bulk_service import MAX_BULK_ROWS, BulkWrite
+        from .models import Wedding
+
+        wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+        payload = request.data if isinstance(request.data, dict) else {}
+        creates, updates, deletes = (payload.get(key) or [] for key in ('create', 'update', 'delete'))
+        if not all(isinstance(rows, list) for rows in (creates, updates, deletes)):
+            return Response(
+                {'error': 'Send create, update and delete as lists'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(creates) + len(updates) + len(deletes) > MAX_BULK_ROWS:
+            return Response(
+                {'error': f'At most {MAX_BULK_ROWS} rows per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        errors = {}
+        create_serializer = self.get_serializer(data=creates, many=True)
+        if creates and not create_serializer.is_valid():
+            errors['create'] = row_errors(create_serializer, len(creates))
+
+        update_ids = [row.get('id') if isinstance(row, dict) else None for row in updates]
+        known = set(
+            self.get_queryset().filter(pk__in=[pk for pk in update_ids + deletes if isinstance(pk, int)])
+            .values_list('pk', flat=True)
+        )
+        update_serializer = self.get_serializer(
+            data=[{field: value for field, value in row.items() if field != 'id'} for row in updates if isinstance(row, dict)],
+            many=True, partial=True,
+        )
+        if len(update_serializer.initial_data) != len(updates):
+            errors['update'] = 'Each update must be an object with an id'
+        else:
+            update_errors = [{} for _ in updates]
+            if updates and not update_serializer.is_valid():
+                update_errors = row_errors(update_serializer, len(updates))
+            listed = Counter(update_ids + deletes)
+            for index, pk in enumerate(update_ids):
+                if pk not in known:
+                    update_errors[index] = {**update_errors[index], 'id': ['Not found']}
+                elif listed[pk] > 1:
+                    update_errors[index] = {**update_errors[index], 'id': ['Listed more than once']}
+            if any(update_errors):
+                errors['update'] = update_errors
+        delete_errors = [{} if pk in known else {'id': ['Not found']} for pk in deletes]
+        if any(delete_errors):
+            errors['delete'] = delete_errors
+        if errors:
+            return Response(
+                {'error': 'Nothing was written; fix the rows listed in errors', 'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        created, updated, deleted = BulkWrite(wedding, self.get_queryset().model).run(
+            creates=create_serializer.validated_data if creates else [],
+            updates=dict(zip(update_ids, update_serializer.validated_data)) if updates else {},
+            deletes=list(dict.fromkeys(deletes)),
+        )
+        return Response({
+            'created': self.get_serializer(created, many=True).data,
+            'updated': self.get_serializer(updated, many=True).data,
+            'deleted': deleted,
+        })
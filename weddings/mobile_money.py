@@ -0,0 +1,277 @@
+"""Import mobile money contributions (M-Pesa, Tigo Pesa, Airtel Money) as pledge payments.
+
+Transactions come from a statement CSV export or from pasted transaction
+SMS texts. Both readers are generators, so a statement is parsed one row
+at a time. The importer matches payers to guests through
+Guest.phone_normalized, skips references that are already recorded, and
+saves each chunk with one bulk insert plus one set-based pledge update.
+"""
+import csv
+import re
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .analytics_cache import AnalyticsCache
+from .analytics_events import AnalyticsEvents
+from .change_log import ChangeLog
+from .models import Guest, GuestPledge, PledgePayment
+from .phones import find_phone
+from .pledge_service import PledgeLedger
+
+CHUNK_SIZE = 1000
+OPEN_PLEDGE_STATUSES = ('pledged', 'partial')
+
+# Lower-cased statement headers per field, in order of preference
+STATEMENT_COLUMNS = {
+    'reference': ['receipt no.', 'receipt no', 'receipt', 'transaction id', 'trans id', 'tid',
+                  'reference', 'reference number', 'ref'],
+    'amount': ['paid in', 'amount', 'credit', 'received', 'amount (tzs)'],
+    'date': ['completion time', 'transaction date', 'date', 'initiation time', 'time'],
+    'payer': ['phone', 'phone number', 'msisdn', 'sender', 'from', 'other party info',
+              'details', 'description'],
+}
+
+SMS_REFERENCE = re.compile(
+    r'\b(?:Kumbukumbu|Muamala|TID|Trans(?:action)?\s*ID|Ref(?:erence)?)(?:\s*(?:No\.?|namba))?\s*[:.]?\s*'
+    r'([A-Za-z0-9][A-Za-z0-9.]{5,29})',
+    re.IGNORECASE,
+)
+# M-Pesa messages open with the receipt: 'QK12ABC3 Confirmed. You have received ...'
+SMS_LEADING_REFERENCE = re.compile(r'^\s*([A-Z0-9]{8,12})\b(?=.*?(?:confirmed|imethibitishwa))', re.IGNORECASE)
+SMS_AMOUNT = re.compile(r'(?:TZS|Tsh|Sh)\.?\s*([\d,]+(?:\.\d{1,2})?)', re.IGNORECASE)
+DAY_FIRST_DATE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{2}|\d{4})\b')
+ISO_DATE = re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b')
+
+
+def parse_amount(value):
+    """A positive Decimal from '50,000.00' or 'TZS 50,000', else None"""
+    cleaned = re.sub(r'[^\d.\-]', '', str(value or ''))
+    try:
+        amount = Decimal(cleaned)
+    except InvalidOperation:
+        return None
+    return amount if amount > 0 else None
+
+
+def parse_date(value):
+    """A date from ISO or day-first ('12/3/24', '12-03-2024 16:15') text, else None"""
+    value = str(value or '')
+    try:
+        match = ISO_DATE.search(value)
+        if match:
+            return date(*map(int, match.groups()))
+        match = DAY_FIRST_DATE.search(value)
+        if match:
+            day, month, year = map(int, match.groups())
+            return date(year + 2000 if year < 100 else year, month, day)
+    except ValueError:
+        pass
+    return None
+
+
+def split_messages(text):
+    """Pasted SMS texts: separated by blank lines, or one per line when there are none"""
+    text = (text or '').strip()
+    parts = re.split(r'\n\s*\n', text) if re.search(r'\n\s*\n', text) else text.splitlines()
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _transaction(line, reference, amount, payment_date, payer, note):
+    """A parsed transaction, or one carrying the reason it cannot be imported"""
+    parsed = {
+        'line': line,
+        'reference': (reference or '').strip(),
+        'amount': amount,
+        'payment_date': payment_date,
+        'phone': find_phone(payer),
+        'note': note,
+        'error': None,
+    }
+    if not parsed['reference']:
+        parsed['error'] = 'No transaction reference'
+    elif amount is None:
+        parsed['error'] = 'No amount received'
+    elif payment_date is None:
+        parsed['error'] = 'Unreadable date'
+    return parsed
+
+
+def read_statement(lines):
+    """Transactions from a statement CSV given as an iterable of text lines.
+
+    Rows without an incoming amount (withdrawals, charges) yield None.
+    """
+    reader = csv.DictReader(lines)
+    headers = {(name or '').strip().lower(): name for name in reader.fieldnames or []}
+    columns = {
+        field: [headers[alias] for alias in aliases if alias in headers]
+        for field, aliases in STATEMENT_COLUMNS.items()
+    }
+    if not columns['amount'] or not columns['reference']:
+        raise ValueError('The statement needs a reference (receipt) column and an amount (paid in) column')
+
+    for row in reader:
+        amount = parse_amount(row.get(columns['amount'][0]))
+        if amount is None:
+            yield None
+            continue
+        payer = ' '.join(row.get(column) or '' for column in columns['payer'])
+        yield _transaction(
+            reader.line_num,
+            row.get(columns['reference'][0]),
+            amount,
+            parse_date(row.get(columns['date'][0])) if columns['date'] else date.today(),
+            payer,
+            payer.strip(),
+        )
+
+
+def read_messages(messages):
+    """Transactions from transaction SMS texts, one per message"""
+    for line, message in enumerate(messages, start=1):
+        match = SMS_REFERENCE.search(message) or SMS_LEADING_REFERENCE.search(message)
+        amount = SMS_AMOUNT.search(message)
+        yield _transaction(
+            line,
+            match.group(1).rstrip('.') if match else '',
+            parse_amount(amount.group(1)) if amount else None,
+            parse_date(message) or date.today(),
+            message,
+            message[:200],
+        )
+
+
+class MobileMoneyImport:
+    """Save parsed transactions as payments against the payers' pledges"""
+
+    def __init__(self, wedding, recorded_by=None, payment_method='mobile_money'):
+        self.wedding = wedding
+        self.recorded_by = recorded_by
+        self.payment_method = payment_method
+        self.result = {
+            'imported': 0,
+            'amount': Decimal('0'),
+            'skipped': 0,
+            'duplicates': [],
+            'unmatched': [],
+            'errors': [],
+        }
+
+    def run(self, transactions, chunk_size=CHUNK_SIZE):
+        seen = set()
+        chunk = []
+        for item in transactions:
+            if item is None:
+                self.result['skipped'] += 1
+            elif item['error']:
+                self.result['errors'].append({'line': item['line'], 'error': item['error']})
+            elif item['reference'] in seen:
+                self.result['duplicates'].append(item['reference'])
+            else:
+                seen.add(item['reference'])
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    self.save_chunk(chunk)
+                    chunk = []
+        if chunk:
+            self.save_chunk(chunk)
+
+        if self.result['imported']:
+            AnalyticsCache.bump(self.wedding.id)
+        self.result['amount'] = float(self.result['amount'])
+        return self.result
+
+    def pledges_by_phone(self, phones):
+        """Payer phone -> the pledge to credit: the oldest open one, else the oldest paid one"""
+        pledges = (
+            GuestPledge.objects
+            .filter(wedding=self.wedding, guest__phone_normalized__in=phones)
+            .exclude(payment_status='cancelled')
+            .order_by('created_at', 'pk')
+            .values_list('pk', 'guest__phone_normalized', 'payment_status')
+        )
+        chosen, fallback = {}, {}
+        for pledge_id, phone, payment_status in pledges:
+            if payment_status in OPEN_PLEDGE_STATUSES:
+                chosen.setdefault(phone, pledge_id)
+            else:
+                fallback.setdefault(phone, pledge_id)
+        return {**fallback, **chosen}
+
+    def save_chunk(self, chunk):
+        phones = {item['phone'] for item in chunk if item['phone']}
+        pledges = self.pledges_by_phone(phones)
+        known_phones = set(
+            Guest.objects.filter(wedding=self.wedding, phone_normalized__in=phones - set(pledges))
+            .values_list('phone_normalized', flat=True)
+        )
+
+        matched = []
+        for item in chunk:
+            pledge_id = pledges.get(item['phone'])
+            if pledge_id is None:
+                if not item['phone']:
+                    reason = 'No payer phone number'
+                elif item['phone'] in known_phones:
+                    reason = 'Guest has no open pledge'
+                else:
+                    reason = 'No guest with this phone number'
+                self.result['unmatched'].append({
+                    'line': item['line'], 'reference': item['reference'], 'phone': item['phone'],
+                    'amount': float(item['amount']), 'reason': reason,
+                })
+            else:
+                matched.append((pledge_id, item))
+        if not matched:
+            return
+
+        with transaction.atomic():
+            # Lock the pledges in a fixed order before the duplicate check so a
+            # concurrent import of the same statement waits and then sees our rows
+            list(
+                GuestPledge.objects.select_for_update()
+                .filter(pk__in={pledge_id for pledge_id, _ in matched})
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            recorded = set(
+                PledgePayment.objects.filter(
+                    pledge__wedding=self.wedding,
+                    reference_number__in=[item['reference'] for _, item in matched],
+                ).values_list('reference_number', flat=True)
+            )
+
+            payments = []
+            deltas = defaultdict(Decimal)
+            totals_by_date = defaultdict(Decimal)
+            for pledge_id, item in matched:
+                if item['reference'] in recorded:
+                    self.result['duplicates'].append(item['reference'])
+                    continue
+                payments.append(PledgePayment(
+                    pledge_id=pledge_id,
+                    amount=item['amount'],
+                    payment_date=item['payment_date'],
+                    payment_method=self.payment_method,
+                    reference_number=item['reference'],
+                    notes=item['note'],
+                    recorded_by=self.recorded_by,
+                ))
+                deltas[pledge_id] += item['amount']
+                totals_by_date[item['payment_date']] += item['amount']
+
+            PledgeLedger.apply_deltas(deltas)
+            PledgePayment.objects.bulk_create(payments, batch_size=500)
+            payment_ids = [payment.pk for payment in payments]
+            if None in payment_ids:
+                # MySQL does not return the ids of bulk inserted rows
+                payment_ids = PledgePayment.objects.filter(
+                    pledge__wedding=self.wedding, reference_number__in=[payment.reference_number for payment in payments],
+                ).values_list('pk', flat=True)
+            ChangeLog.record('pledge_payments', list(payment_ids), wedding_id=self.wedding.id)
+            AnalyticsEvents.record_payments(self.wedding.id, totals_by_date)
+
+        self.result['imported'] += len(payments)
+        self.result['amount'] += sum(deltas.values(), Decimal('0'))
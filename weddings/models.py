@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+from .phones import normalize_phone
 
 # Create your models here.
 class Wedding(models.Model):
@@ -45,12 +48,46 @@ class Guest(models.Model):
     wedding = models.ForeignKey(Wedding, on_delete=models.CASCADE, related_name='guests')
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=20)  
+    phone_normalized = models.CharField(max_length=16, blank=True, editable=False)  # E.164, for matching payers
     email = models.EmailField(blank=True, null=True)  
     relationship = models.CharField(max_length=20, choices=RELATIONSHIP_CHOICES, blank=True, null=True)  
     rsvp_status = models.CharField(max_length=20, choices=RSVP_CHOICES, default='pending')
     number_of_guests = models.IntegerField(default=1, validators=[MinValueValidator(1)])
     dietary_restrictions = models.CharField(max_length=255, blank=True, null=True)  
+    rsvp_responded_at = models.DateTimeField(null=True, blank=True)  # first move out of pending
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['wedding', 'phone_normalized'], name='guest_wedding_phone_idx'),
+            models.Index(fields=['wedding', 'created_at', 'id'], name='guest_wedding_cursor_idx'),
+            models.Index(fields=['wedding', 'rsvp_status', 'relationship'], name='guest_wedding_rsvp_idx'),
+        ]
+    
+    # Set by fill_derived_fields(), which bulk writes call in place of save()
+    DERIVED_FIELDS = ['rsvp_responded_at', 'phone_normalized']
+    
+    def fill_derived_fields(self):
+        # Record when the guest first answered; a reset to pending clears it
+        if self.rsvp_status == 'pending':
+            self.rsvp_responded_at = None
+        elif self.rsvp_responded_at is None:
+            self.rsvp_responded_at = timezone.now()
+        self.phone_normalized = normalize_phone(self.phone)
+    
+    def save(self, *args, **kwargs):
+        self.fill_derived_fields()
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if 'rsvp_status' in update_fields:
+                update_fields = {*update_fields, 'rsvp_responded_at'}
+            if 'phone' in update_fields:
+                update_fields = {*update_fields, 'phone_normalized'}
+            kwargs['update_fields'] = update_fields
+        
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.name} - {self.wedding}"
@@ -83,6 +120,11 @@ class Task(models.Model):
     
     class Meta:
         ordering = ['-priority', 'due_date']
+        indexes = [
+            models.Index(fields=['wedding', 'created_at', 'id'], name='task_wedding_cursor_idx'),
+            models.Index(fields=['wedding', 'status', 'due_date'], name='task_wedding_status_idx'),
+            models.Index(fields=['wedding', 'priority', 'due_date'], name='task_wedding_priority_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.wedding}"
@@ -109,6 +151,12 @@ class Budget(models.Model):
     actual_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['wedding', 'created_at', 'id'], name='budget_wedding_cursor_idx'),
+        ]
     
     def __str__(self):
         return f"{self.category} - {self.item_name}"
@@ -144,6 +192,9 @@ class Photo(models.Model):
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['album', 'uploaded_at', 'id'], name='photo_album_cursor_idx'),
+        ]
     
     def __str__(self):
         return f"Photo in {self.album.title}"
@@ -171,6 +222,7 @@ class Timeline(models.Model):
     location = models.CharField(max_length=255, blank=True)
     is_completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['date']
@@ -220,6 +272,10 @@ class Vendor(models.Model):
     
     class Meta:
         ordering = ['vendor_type', 'status']
+        indexes = [
+            models.Index(fields=['wedding', 'created_at', 'id'], name='vendor_wedding_cursor_idx'),
+            models.Index(fields=['wedding', 'status', 'vendor_type'], name='vendor_wedding_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.business_name} ({self.vendor_type})"
@@ -261,6 +317,7 @@ class WeddingAnalytics(models.Model):
     total_confirmed = models.IntegerField(default=0)
     total_pending = models.IntegerField(default=0)
     total_declined = models.IntegerField(default=0)
+    total_guest_count = models.IntegerField(default=0)  # seats, including +1s
     average_guests_per_invitation = models.FloatField(default=1.0)
     
     # Budget Analytics
@@ -294,6 +351,8 @@ class WeddingAnalytics(models.Model):
     guest_health_score = models.FloatField(default=0)     # 0-100
     overall_health_score = models.FloatField(default=0)   # 0-100
     
+    # Date the time-dependent fields (overdue tasks, days until) were computed for
+    computed_for = models.DateField(null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
     
     class Meta:
@@ -303,10 +362,27 @@ class WeddingAnalytics(models.Model):
         return f"Analytics - {self.wedding}"
 
 
+class AnalyticsDirtyMark(models.Model):
+    """Queue entry: this wedding's analytics need a full recompute"""
+    wedding = models.OneToOneField(Wedding, on_delete=models.CASCADE, related_name='analytics_dirty_mark')
+    first_marked_at = models.DateTimeField()
+    last_marked_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_marked_at']),
+            models.Index(fields=['first_marked_at']),
+        ]
+    
+    def __str__(self):
+        return f"Dirty analytics - wedding {self.wedding_id}"
+
+
 class WeeklyAnalyticsSnapshot(models.Model):
     """Store weekly snapshots for trend analysis"""
     wedding = models.ForeignKey(Wedding, on_delete=models.CASCADE, related_name='weekly_snapshots')
     
+    iso_year = models.IntegerField()
     week_number = models.IntegerField()
     confirmed_count = models.IntegerField()
     pending_count = models.IntegerField()
@@ -317,11 +393,72 @@ class WeeklyAnalyticsSnapshot(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['week_number']
+        ordering = ['iso_year', 'week_number']
         verbose_name_plural = "Weekly Analytics Snapshots"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wedding', 'iso_year', 'week_number'],
+                name='unique_weekly_snapshot',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Week {self.week_number}/{self.iso_year} - {self.wedding}"
+
+
+class HealthCohortPercentile(models.Model):
+    """Score distribution of one health metric among similar weddings.
+    
+    Weddings are grouped by budget band and months to the wedding; the
+    cutoffs hold the score at every percentile from 0 to 100, so a wedding
+    is ranked with a bisect instead of scanning its peers.
+    """
+    budget_band = models.CharField(max_length=20)
+    months_band = models.CharField(max_length=20)
+    metric = models.CharField(max_length=30)
+    sample_size = models.IntegerField()
+    cutoffs = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['budget_band', 'months_band', 'metric'],
+                name='unique_health_cohort_metric',
+            ),
+        ]
     
     def __str__(self):
-        return f"Week {self.week_number} - {self.wedding}"
+        return f"{self.metric} - {self.budget_band}/{self.months_band}"
+
+
+class AnalyticsEvent(models.Model):
+    """Append-only log of changes behind the RSVP, spend and payment trends.
+    
+    Rows are never updated: an edit or delete is recorded as a further
+    event with the difference.
+    """
+    KIND_CHOICES = [
+        ('rsvp', 'RSVP Transition'),
+        ('spend', 'Budget Spend Change'),
+        ('payment', 'Pledge Payment'),
+    ]
+    
+    # Covered by the (wedding, kind, occurred_at) index below
+    wedding = models.ForeignKey(Wedding, on_delete=models.CASCADE, related_name='analytics_events', db_index=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    label = models.CharField(max_length=20, blank=True)  # RSVP status entered
+    previous_label = models.CharField(max_length=20, blank=True)  # RSVP status left
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # signed change
+    occurred_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['wedding', 'kind', 'occurred_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} event - wedding {self.wedding_id}"
 
 
 class GuestEngagementMetrics(models.Model):
@@ -384,18 +521,26 @@ class GuestPledge(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['wedding', 'created_at', 'id'], name='pledge_wedding_cursor_idx'),
+            models.Index(fields=['wedding', 'payment_status', 'balance'], name='pledge_wedding_status_idx'),
+        ]
+    
+    @staticmethod
+    def status_for(paid_amount, pledged_amount):
+        """Payment status implied by the amounts (PledgeLedger applies the same rule in SQL)"""
+        if paid_amount == 0:
+            return 'pledged'
+        if paid_amount >= pledged_amount:
+            return 'paid'
+        return 'partial'
     
     def save(self, *args, **kwargs):
         # Auto-calculate balance
         self.balance = self.pledged_amount - self.paid_amount
         
         # Auto-update payment status
-        if self.paid_amount == 0:
-            self.payment_status = 'pledged'
-        elif self.paid_amount >= self.pledged_amount:
-            self.payment_status = 'paid'
-        elif self.paid_amount > 0:
-            self.payment_status = 'partial'
+        self.payment_status = GuestPledge.status_for(self.paid_amount, self.pledged_amount)
         
         super().save(*args, **kwargs)
     
@@ -403,6 +548,63 @@ class GuestPledge(models.Model):
         return f"{self.guest.name} - TZS {self.pledged_amount}"
 
 
+class PledgeTotals(models.Model):
+    """Running pledge totals of one wedding, adjusted by deltas on every pledge or payment change.
+    
+    Lets the contribution board poll the summary with a single-row read
+    instead of aggregating every pledge.
+    """
+    wedding = models.OneToOneField(Wedding, on_delete=models.CASCADE, primary_key=True, related_name='pledge_totals')
+    total_pledged = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pledge_count = models.IntegerField(default=0)
+    pledged_count = models.IntegerField(default=0)
+    partial_count = models.IntegerField(default=0)
+    paid_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Pledge totals - {self.wedding}"
+
+
+class WeddingChangeCounter(models.Model):
+    """Last sequence number handed out to a wedding's change log"""
+    wedding = models.OneToOneField(Wedding, on_delete=models.CASCADE, primary_key=True, related_name='change_counter')
+    last_seq = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Change counter - {self.wedding}"
+
+
+class WeddingChange(models.Model):
+    """Latest change to one synced row of a wedding, for the mobile delta sync.
+    
+    Each row keeps a single entry: a later change moves it to a new,
+    higher seq and a delete turns it into a tombstone, so the log grows
+    with the number of rows rather than the number of edits.
+    """
+    wedding = models.ForeignKey(Wedding, on_delete=models.CASCADE, related_name='changes')
+    resource = models.CharField(max_length=30)
+    object_id = models.PositiveBigIntegerField()
+    seq = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wedding', 'resource', 'object_id'], name='wedding_change_object_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['wedding', 'seq'], name='wedding_change_seq_idx'),
+        ]
+    
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"{self.resource} {self.object_id} {action} at {self.seq}"
+
+
 class PledgePayment(models.Model):
     """Track individual payments towards pledges"""
     pledge = models.ForeignKey(GuestPledge, on_delete=models.CASCADE, related_name='payments')
@@ -410,14 +612,18 @@ class PledgePayment(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     payment_date = models.DateField()
     payment_method = models.CharField(max_length=50, choices=GuestPledge.PAYMENT_METHOD_CHOICES)
-    reference_number = models.CharField(max_length=100, blank=True, help_text="Transaction ID, Receipt No, etc")
+    reference_number = models.CharField(max_length=100, blank=True, db_index=True, help_text="Transaction ID, Receipt No, etc")
     notes = models.TextField(blank=True)
     
     recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-payment_date']
+        indexes = [
+            models.Index(fields=['pledge', 'created_at', 'id'], name='payment_pledge_cursor_idx'),
+        ]
     
     def __str__(self):
         return f"Payment: TZS {self.amount} - {self.payment_date}"
\ No newline at end of file
@@ -0,0 +1,57 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class WeddingCursorPagination(CursorPagination):
+    """Opt-in cursor pagination for the nested wedding lists.
+
+    Lists stay plain JSON arrays unless the client sends ?page_size= or
+    ?cursor=, so existing clients are unaffected. Pages are keyed on the
+    view's cursor_ordering, an immutable timestamp plus id backed by a
+    (parent, timestamp, id) index, and only count the rows with ?count=true.
+    With ?ordering= the pages follow the requested order instead.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('created_at', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        self.check_ordering(self.get_ordering(request, queryset, view), queryset)
+        self.count = None
+        if params.get('count', '').lower() in TRUE_VALUES:
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def check_ordering(self, ordering, queryset):
+        # The cursor holds the first ordering column's value; an empty one cannot be compared
+        name = ordering[0].lstrip('-')
+        field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        if field.null:
+            raise ValidationError({'error': f'Cursor pages cannot start with {name}, which can be empty; order by another column first'})
+
+    def encode_cursor(self, cursor):
+        # The total is only counted for the first page, not on every follow-up
+        return remove_query_param(super().encode_cursor(cursor), 'count')
+
+    def get_paginated_response(self, data):
+        body = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            body['count'] = self.count
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count'] = {'type': 'integer', 'example': 123}
+        return response
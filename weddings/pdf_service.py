@@ -6,6 +6,8 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 from datetime import datetime
+from .headcount import GuestHeadcount
+from .models import Guest
 
 class WeddingPDFGenerator:
     @staticmethod
@@ -43,17 +45,20 @@ class WeddingPDFGenerator:
         elements.append(Spacer(1, 0.3*inch))
         
         # Guest Table
-        guests = wedding.guests.all()
+        relationship_labels = dict(Guest.RELATIONSHIP_CHOICES)
+        guests = wedding.guests.values_list(
+            'name', 'relationship', 'rsvp_status', 'number_of_guests', 'email', 'phone'
+        )
         data = [['No.', 'Guest Name', 'Relationship', 'RSVP Status', 'Guests', 'Contact']]
         
-        for i, guest in enumerate(guests, 1):
+        for i, (name, relationship, rsvp_status, number_of_guests, email, phone) in enumerate(guests.iterator(), 1):
             data.append([
                 str(i),
-                guest.name,
-                guest.get_relationship_display(),
-                guest.rsvp_status.upper(),
-                str(guest.number_of_guests),
-                guest.email or guest.phone or 'N/A'
+                name,
+                relationship_labels.get(relationship, relationship),
+                rsvp_status.upper(),
+                str(number_of_guests),
+                email or phone or 'N/A'
             ])
         
         table = Table(data, colWidths=[0.5*inch, 1.5*inch, 1.2*inch, 1*inch, 0.7*inch, 1.5*inch])
@@ -73,16 +78,14 @@ class WeddingPDFGenerator:
         elements.append(Spacer(1, 0.3*inch))
         
         # Summary
-        confirmed = wedding.guests.filter(rsvp_status='confirmed').count()
-        pending = wedding.guests.filter(rsvp_status='pending').count()
-        declined = wedding.guests.filter(rsvp_status='declined').count()
-        total_guests = sum([g.number_of_guests for g in wedding.guests.all()])
+        headcount = GuestHeadcount.for_wedding(wedding.id)
+        by_status = headcount['by_status']
         
         summary = f"""
         <b>Summary:</b><br/>
-        Total Invitations: {guests.count()}<br/>
-        Confirmed: {confirmed} | Pending: {pending} | Declined: {declined}<br/>
-        Total Guest Count (with +1s): {total_guests}
+        Total Invitations: {headcount['invitations']}<br/>
+        Confirmed: {by_status['confirmed']['invitations']} | Pending: {by_status['pending']['invitations']} | Declined: {by_status['declined']['invitations']}<br/>
+        Total Guest Count (with +1s): {headcount['seats']}
         """
         elements.append(Paragraph(summary, styles['Normal']))
         
@@ -0,0 +1,45 @@
+import re
+
+# Tanzania: +255 followed by a nine digit national number (07XX XXX XXX locally)
+DEFAULT_COUNTRY_CODE = '255'
+NATIONAL_NUMBER_LENGTH = 9
+
+# A phone number inside free text such as a transaction SMS
+PHONE_IN_TEXT = re.compile(r'(?<![\d])(?:\+|00)?\d[\d ]{7,16}\d(?![\d])')
+
+
+def normalize_phone(value, country_code=DEFAULT_COUNTRY_CODE):
+    """E.164 form of a phone number ('+255712345678'), or '' when it cannot be read.
+
+    Local numbers ('0712 345 678', '712345678') are assumed to belong to
+    country_code; numbers written with '+' or '00' keep their own code.
+    """
+    if not value:
+        return ''
+    value = str(value).strip()
+    digits = re.sub(r'\D', '', value)
+    if value.startswith('+'):
+        international = digits
+    elif value.startswith('00'):
+        international = digits[2:]
+    elif digits.startswith(country_code) and len(digits) == len(country_code) + NATIONAL_NUMBER_LENGTH:
+        international = digits
+    elif digits.startswith('0') and len(digits) == NATIONAL_NUMBER_LENGTH + 1:
+        international = country_code + digits[1:]
+    elif len(digits) == NATIONAL_NUMBER_LENGTH:
+        international = country_code + digits
+    else:
+        return ''
+    # E.164 allows at most 15 digits
+    if not 8 <= len(international) <= 15:
+        return ''
+    return f'+{international}'
+
+
+def find_phone(text, country_code=DEFAULT_COUNTRY_CODE):
+    """The first readable phone number in text, normalized, or ''"""
+    for match in PHONE_IN_TEXT.finditer(text or ''):
+        phone = normalize_phone(match.group(), country_code)
+        if phone:
+            return phone
+    return ''
@@ -0,0 +1,357 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.lookups import Exact, GreaterThanOrEqual
+from django.utils import timezone
+
+from .analytics_aggregates import MONEY, ZERO
+from .analytics_cache import AnalyticsCache
+from .change_log import ChangeLog
+from .db_utils import upsert_kwargs
+from .models import GuestPledge, PledgePayment, PledgeTotals, Wedding
+
+PLEDGE_STATUSES = [status for status, _ in GuestPledge.PAYMENT_STATUS_CHOICES]
+AMOUNT_FIELDS = ['total_pledged', 'total_paid', 'total_balance']
+COUNT_FIELDS = ['pledge_count'] + [f'{status}_count' for status in PLEDGE_STATUSES]
+SUMMARY_FIELDS = AMOUNT_FIELDS + COUNT_FIELDS
+PLEDGE_STATE_FIELDS = ['wedding_id', 'pledged_amount', 'paid_amount', 'balance', 'payment_status']
+# Moved only by PledgeLedger as payments come and go
+LEDGER_FIELDS = ['paid_amount', 'balance', 'payment_status']
+
+
+class PledgeSummary:
+    """Per-wedding pledge totals: one conditional aggregate, or the PledgeTotals row.
+
+    With settings.PLEDGE_TOTALS_DENORMALIZED on, every pledge and payment
+    change adjusts the wedding's PledgeTotals row by a delta and reads come
+    from that row.
+    """
+
+    @staticmethod
+    def denormalized():
+        return getattr(settings, 'PLEDGE_TOTALS_DENORMALIZED', False)
+
+    @staticmethod
+    def aggregates(prefix=''):
+        """Aggregate expressions for every summary field over pledges reached through prefix"""
+        return {
+            'total_pledged': Sum(f'{prefix}pledged_amount', default=ZERO, output_field=MONEY),
+            'total_paid': Sum(f'{prefix}paid_amount', default=ZERO, output_field=MONEY),
+            'total_balance': Sum(f'{prefix}balance', default=ZERO, output_field=MONEY),
+            'pledge_count': Count(f'{prefix}pk'),
+            **{
+                f'{status}_count': Count(f'{prefix}pk', filter=Q(**{f'{prefix}payment_status': status}))
+                for status in PLEDGE_STATUSES
+            },
+        }
+
+    @staticmethod
+    def compute(weddings):
+        """{wedding_id: summary} for a wedding queryset, in one grouped query"""
+        rows = weddings.order_by().values('pk').annotate(**PledgeSummary.aggregates('pledges__'))
+        return {row.pop('pk'): row for row in rows}
+
+    @staticmethod
+    def for_wedding(wedding_id, user=None):
+        """Summary of one wedding, or None when it does not exist (or is not the user's)"""
+        ownership = {'wedding__user': user} if user is not None else {}
+        if PledgeSummary.denormalized():
+            totals = (
+                PledgeTotals.objects.filter(wedding_id=wedding_id, **ownership)
+                .values(*SUMMARY_FIELDS).first()
+            )
+            if totals is not None:
+                return totals
+
+        weddings = Wedding.objects.filter(pk=wedding_id)
+        if user is not None:
+            weddings = weddings.filter(user=user)
+        summary = PledgeSummary.compute(weddings).get(int(wedding_id))
+        if summary is not None and PledgeSummary.denormalized():
+            # Weddings from before the totals table; later changes adjust this row
+            PledgeTotals.objects.bulk_create([PledgeTotals(wedding_id=wedding_id, **summary)], ignore_conflicts=True)
+        return summary
+
+    @staticmethod
+    def contribution(state):
+        """What one pledge in the given state adds to its wedding's totals"""
+        if state is None:
+            return {}
+        return {
+            'total_pledged': state['pledged_amount'],
+            'total_paid': state['paid_amount'],
+            'total_balance': state['balance'],
+            'pledge_count': 1,
+            f"{state['payment_status']}_count": 1,
+        }
+
+    @staticmethod
+    def changes(previous, current, into=None):
+        """{wedding_id: {field: delta}} for a pledge moving between two states (either may be None)"""
+        changes = into if into is not None else defaultdict(lambda: defaultdict(int))
+        for state, sign in ((previous, -1), (current, 1)):
+            for field, value in PledgeSummary.contribution(state).items():
+                changes[state['wedding_id']][field] += sign * value
+        return changes
+
+    @staticmethod
+    def apply_changes(changes):
+        """Add {wedding_id: {field: delta}} to the stored totals rows"""
+        if not PledgeSummary.denormalized():
+            return
+        for wedding_id, deltas in changes.items():
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+            if deltas:
+                PledgeTotals.objects.filter(wedding_id=wedding_id).update(
+                    **{field: F(field) + delta for field, delta in deltas.items()},
+                    updated_at=timezone.now(),
+                )
+
+    @staticmethod
+    def rebuild(wedding_ids=None, chunk_size=500):
+        """Recompute stored totals from the pledges; returns the number of rows written"""
+        weddings = Wedding.objects.all()
+        if wedding_ids is not None:
+            weddings = weddings.filter(pk__in=wedding_ids)
+        ids = list(weddings.order_by('pk').values_list('pk', flat=True))
+        now = timezone.now()
+        for start in range(0, len(ids), chunk_size):
+            summaries = PledgeSummary.compute(Wedding.objects.filter(pk__in=ids[start:start + chunk_size]))
+            PledgeTotals.objects.bulk_create(
+                [
+                    PledgeTotals(wedding_id=wedding_id, updated_at=now, **summary)
+                    for wedding_id, summary in summaries.items()
+                ],
+                **upsert_kwargs(PledgeTotals, ['wedding'], SUMMARY_FIELDS + ['updated_at']),
+            )
+        return len(ids)
+
+
+class PledgeLedger:
+    """Keep a pledge's paid amount, balance and status in step with its payments.
+
+    Amounts are applied in the database with F() expressions, so concurrent
+    payments against the same pledge queue on its row lock instead of
+    overwriting each other's totals.
+    """
+
+    @staticmethod
+    def status_expression(paid):
+        """GuestPledge.status_for() for a paid amount expression"""
+        return Case(
+            When(Exact(paid, 0), then=Value('pledged')),
+            When(GreaterThanOrEqual(paid, F('pledged_amount')), then=Value('paid')),
+            default=Value('partial'),
+        )
+
+    @staticmethod
+    def totals_after(delta):
+        """UPDATE values for paid_amount += delta, with balance and status derived in SQL"""
+        paid = F('paid_amount') + delta
+        # MySQL evaluates SET assignments left to right against the updated
+        # row, so everything else reads the stored paid_amount and the
+        # assignment to paid_amount itself comes last.
+        return {
+            'balance': F('pledged_amount') - paid,
+            'payment_status': PledgeLedger.status_expression(paid),
+            'updated_at': timezone.now(),
+            'paid_amount': paid,
+        }
+
+    @staticmethod
+    def update_pledges(deltas):
+        """Add {pledge_id: delta} to the pledges in one UPDATE.
+
+        Must run inside a transaction. Returns the wedding totals changes
+        for PledgeSummary.apply_changes(), empty when totals are not kept.
+        """
+        pledges_by_amount = defaultdict(list)
+        for pledge_id, delta in deltas.items():
+            if delta:
+                pledges_by_amount[delta].append(pledge_id)
+        if not pledges_by_amount:
+            return {}
+        pledge_ids = [pk for ids in pledges_by_amount.values() for pk in ids]
+
+        stored = []
+        if PledgeSummary.denormalized():
+            # Locked in pk order; the totals change needs each pledge's prior status
+            stored = list(
+                GuestPledge.objects.select_for_update().filter(pk__in=pledge_ids)
+                .order_by('pk').values('pk', *PLEDGE_STATE_FIELDS)
+            )
+
+        pledges = GuestPledge.objects.filter(pk__in=pledge_ids)
+        if len(pledge_ids) == 1:
+            pledges.update(**PledgeLedger.totals_after(deltas[pledge_ids[0]]))
+        else:
+            # Contributions cluster on round amounts, so one WHEN per distinct amount
+            # keeps the CASE short; annotating it lets Django resolve it only once.
+            delta = Case(
+                *[When(pk__in=ids, then=Value(amount)) for amount, ids in pledges_by_amount.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+            pledges.annotate(ledger_delta=delta).update(**PledgeLedger.totals_after(F('ledger_delta')))
+        ChangeLog.record('pledges', pledge_ids)
+
+        changes = defaultdict(lambda: defaultdict(int))
+        for previous in stored:
+            paid = previous['paid_amount'] + deltas[previous['pk']]
+            current = {
+                **previous,
+                'paid_amount': paid,
+                'balance': previous['pledged_amount'] - paid,
+                'payment_status': GuestPledge.status_for(paid, previous['pledged_amount']),
+            }
+            PledgeSummary.changes(previous, current, into=changes)
+        return changes
+
+    @staticmethod
+    def adjust(pledge_id, delta):
+        """Add delta (negative to reverse a payment) to one pledge and its wedding's totals"""
+        PledgeLedger.apply_deltas({pledge_id: delta})
+
+    @staticmethod
+    def apply_deltas(deltas):
+        """Add {pledge_id: delta} to many pledges and their weddings' totals"""
+        with transaction.atomic():
+            PledgeSummary.apply_changes(PledgeLedger.update_pledges(deltas))
+
+    @staticmethod
+    def record_payment(pledge, **payment_fields):
+        """Save a payment and apply it to its pledge in one transaction.
+
+        The pledge row is updated before the payment is inserted: the insert
+        takes a shared lock on the pledge through the foreign key, and two
+        transactions holding that lock would deadlock upgrading it. The
+        wedding-wide totals row is updated last so it stays locked only
+        until the commit.
+        """
+        with transaction.atomic():
+            changes = PledgeLedger.update_pledges({pledge.pk: payment_fields['amount']})
+            payment = PledgePayment.objects.create(pledge=pledge, **payment_fields)
+            PledgeSummary.apply_changes(changes)
+        PledgeLedger.refresh_totals(pledge)
+        return payment
+
+    @staticmethod
+    def update_pledge(pledge, **fields):
+        """Save edits to a pledge's own fields without writing back its ledger columns.
+
+        The row is locked and its stored paid amount read first, so an edit
+        racing a payment cannot put back a stale total; a new pledged amount
+        re-derives the balance and status in SQL.
+        """
+        with transaction.atomic():
+            stored = GuestPledge.objects.select_for_update().values(*LEDGER_FIELDS).get(pk=pledge.pk)
+            for field, value in {**fields, **stored}.items():
+                setattr(pledge, field, value)
+            pledge.save(update_fields=[field for field in fields if field not in LEDGER_FIELDS] + ['updated_at'])
+            if 'pledged_amount' in fields:
+                paid = F('paid_amount')
+                GuestPledge.objects.filter(pk=pledge.pk).update(
+                    balance=F('pledged_amount') - paid, payment_status=PledgeLedger.status_expression(paid),
+                )
+        return pledge
+
+    @staticmethod
+    def update_payment(payment, **fields):
+        """Change a payment and move any difference in amount onto its pledge"""
+        with transaction.atomic():
+            stored = PledgePayment.objects.select_for_update().values_list('amount', flat=True).get(pk=payment.pk)
+            changes = PledgeLedger.update_pledges({payment.pledge_id: fields.get('amount', stored) - stored})
+            for field, value in fields.items():
+                setattr(payment, field, value)
+            payment.save()
+            PledgeSummary.apply_changes(changes)
+        return payment
+
+    @staticmethod
+    def delete_payment(payment):
+        """Delete a payment and take its amount back off its pledge"""
+        with transaction.atomic():
+            stored = PledgePayment.objects.select_for_update().values_list('amount', flat=True).get(pk=payment.pk)
+            changes = PledgeLedger.update_pledges({payment.pledge_id: -stored})
+            payment.delete()
+            PledgeSummary.apply_changes(changes)
+
+    @staticmethod
+    def refresh_totals(pledge):
+        pledge.refresh_from_db(fields=['paid_amount', 'balance', 'payment_status', 'updated_at'])
+        return pledge
+
+
+class PledgeReconciliation:
+    """Find and repair pledges whose stored totals disagree with their payments"""
+
+    @staticmethod
+    def drifted(pledges=None):
+        """Drifted pledges of a queryset (all pledges by default), found in one grouped query.
+
+        Each row holds the stored values next to the ones implied by the
+        payments. Cancelled pledges keep their status.
+        """
+        pledges = pledges if pledges is not None else GuestPledge.objects.all()
+        true_paid = F('true_paid')
+        return (
+            pledges.order_by('pk')
+            .values('pk', *PLEDGE_STATE_FIELDS)
+            .annotate(true_paid=Sum('payments__amount', default=ZERO, output_field=MONEY))
+            .annotate(
+                expected_balance=F('pledged_amount') - true_paid,
+                expected_status=Case(
+                    When(payment_status='cancelled', then=Value('cancelled')),
+                    default=PledgeLedger.status_expression(true_paid),
+                ),
+            )
+            .filter(
+                ~Q(paid_amount=true_paid)
+                | ~Q(balance=F('expected_balance'))
+                | ~Q(payment_status=F('expected_status'))
+            )
+        )
+
+    @staticmethod
+    def repair(pledge_ids, chunk_size=500):
+        """Rewrite the given pledges from their payments; returns the number repaired.
+
+        Each chunk is locked before its payments are re-summed, so a payment
+        recorded meanwhile is either already counted or waits for the repair.
+        """
+        pledge_ids = sorted(pledge_ids)
+        repaired = 0
+        weddings = set()
+        for start in range(0, len(pledge_ids), chunk_size):
+            chunk = pledge_ids[start:start + chunk_size]
+            with transaction.atomic():
+                locked = list(
+                    GuestPledge.objects.select_for_update().filter(pk__in=chunk)
+                    .order_by('pk').only('pk', 'wedding_id', 'paid_amount', 'balance', 'payment_status')
+                )
+                expected = {
+                    row['pk']: row
+                    for row in PledgeReconciliation.drifted(GuestPledge.objects.filter(pk__in=chunk))
+                }
+                now = timezone.now()
+                fixed = []
+                for pledge in locked:
+                    row = expected.get(pledge.pk)
+                    if row is None:
+                        continue
+                    pledge.paid_amount = row['true_paid']
+                    pledge.balance = row['expected_balance']
+                    pledge.payment_status = row['expected_status']
+                    pledge.updated_at = now
+                    fixed.append(pledge)
+                    weddings.add(pledge.wedding_id)
+                GuestPledge.objects.bulk_update(fixed, ['paid_amount', 'balance', 'payment_status', 'updated_at'])
+                ChangeLog.record('pledges', [pledge.pk for pledge in fixed])
+            repaired += len(fixed)
+
+        if weddings and PledgeSummary.denormalized():
+            PledgeSummary.rebuild(weddings)
+        for wedding_id in weddings:
+            AnalyticsCache.bump(wedding_id)
+        return repaired
@@ -1,50 +1,199 @@
-from rest_framework import viewsets, status
+import csv
+import io
+from datetime import date
+
+from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum, Q
+from django.db.models import Count, Max, OuterRef, Prefetch, Subquery, Sum, Q
+from django.db.models.functions import Coalesce
 from .models import Wedding, Guest, GuestPledge, PledgePayment
-from .serializers import GuestPledgeSerializer, PledgePaymentSerializer
+from .filters import ChoiceFilter, DeclaredFiltersBackend, RangeFilter, WeddingOrderingFilter
+from .mixins import (
+    AnalyticsCacheInvalidationMixin, ConditionalListMixin, SparseFieldsQuerysetMixin, requested_expansions,
+)
+from .mobile_money import MobileMoneyImport, read_messages, read_statement, split_messages
+from .pagination import WeddingCursorPagination
+from .pledge_service import PLEDGE_STATUSES, PledgeLedger, PledgeReconciliation, PledgeSummary
+from .serializers import GuestPledgeListSerializer, GuestPledgeSerializer, PledgePaymentSerializer
+
+# Columns the pledge serializers read; created_by is never rendered
+PLEDGE_COLUMNS = [
+    'id', 'guest', 'wedding', 'pledged_amount', 'paid_amount', 'balance', 'payment_status',
+    'payment_method', 'pledge_date', 'payment_deadline', 'notes', 'created_at', 'updated_at',
+]
+PAYMENT_COLUMNS = [
+    'id', 'pledge', 'amount', 'payment_date', 'payment_method', 'reference_number', 'notes',
+    'recorded_by', 'created_at', 'updated_at',
+]
+
+
+def payment_history():
+    """Prefetch of each pledge's payments with the recorder's username in the same query"""
+    return Prefetch(
+        'payments',
+        queryset=PledgePayment.objects.select_related('recorded_by').only(*PAYMENT_COLUMNS, 'recorded_by__username'),
+    )
 
-class GuestPledgeViewSet(viewsets.ModelViewSet):
+class GuestPledgeViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, ConditionalListMixin, viewsets.ModelViewSet):
     serializer_class = GuestPledgeSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
+    cursor_ordering = ('-created_at', '-id')
+    filter_backends = [DeclaredFiltersBackend, WeddingOrderingFilter]
+    list_filters = {
+        'payment_status': ChoiceFilter('payment_status'),
+        'balance': RangeFilter('balance'),
+        'payment_deadline': RangeFilter('payment_deadline'),
+    }
+    ordering_fields = ['balance', 'pledged_amount', 'paid_amount', 'payment_deadline', 'created_at']
     
     def get_queryset(self):
         wedding_id = self.kwargs.get('wedding_id')
-        return GuestPledge.objects.filter(wedding_id=wedding_id, wedding__user=self.request.user)
+        queryset = GuestPledge.objects.filter(wedding_id=wedding_id, wedding__user=self.request.user)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        
+        queryset = queryset.select_related('guest').only(*PLEDGE_COLUMNS, 'guest__name')
+        if self.includes_payments():
+            return queryset.prefetch_related(payment_history())
+        payments = PledgePayment.objects.filter(pledge=OuterRef('pk')).order_by()
+        return queryset.annotate(
+            payment_count=Coalesce(
+                Subquery(payments.values('pledge').annotate(count=Count('pk')).values('count')), 0
+            ),
+            last_payment_date=Subquery(payments.order_by('-payment_date').values('payment_date')[:1]),
+        )
+    
+    def includes_payments(self):
+        """Full payment history on the detail route, or on the list with ?expand=payments"""
+        return self.action == 'retrieve' or 'payments' in requested_expansions(self.request)
+    
+    def get_serializer_class(self):
+        if self.action == 'list' and not self.includes_payments():
+            return GuestPledgeListSerializer
+        return GuestPledgeSerializer
+    
+    def get_list_markers(self):
+        # The list also renders guest names
+        return {**super().get_list_markers(), 'guest_modified': Max('guest__updated_at')}
+    
+    def get_related_markers(self, queryset):
+        # ...and the payments, read on their own so the pledge count is not one per payment
+        return PledgePayment.objects.filter(pledge__in=queryset.values('pk')).aggregate(
+            payment_count=Count('pk'), payment_total=Sum('amount'), payment_modified=Max('updated_at'),
+        )
     
     def perform_create(self, serializer):
         wedding_id = self.kwargs.get('wedding_id')
         wedding = get_object_or_404(Wedding, id=wedding_id, user=self.request.user)
-        serializer.save(wedding=wedding, created_by=self.request.user)
+        opening_payment = self.opening_payment()
+        with transaction.atomic():
+            pledge = serializer.save(wedding=wedding, created_by=self.request.user)
+            if opening_payment:
+                PledgeLedger.record_payment(
+                    pledge, amount=opening_payment, payment_date=date.today(),
+                    payment_method=pledge.payment_method or 'other',
+                    notes='Paid when the pledge was made', recorded_by=self.request.user,
+                )
+    
+    def opening_payment(self):
+        """A paid_amount sent with a new pledge, recorded as its first payment.
+        
+        paid_amount itself is read-only: it only moves with payments, so the
+        ledger, the wedding totals and reconciliation all see the money.
+        """
+        value = self.request.data.get('paid_amount')
+        if value in (None, ''):
+            return 0
+        field = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+        try:
+            return field.run_validation(value)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({'paid_amount': e.detail})
+    
+    def perform_update(self, serializer):
+        serializer.instance = PledgeLedger.update_pledge(serializer.instance, **serializer.validated_data)
     
     @action(detail=False, methods=['get'])
     def summary(self, request, wedding_id=None):
         """Get pledge summary for the wedding"""
-        pledges = self.get_queryset()
+        summary = PledgeSummary.for_wedding(wedding_id, user=request.user)
+        if summary is None:
+            raise Http404('No Wedding matches the given query.')
         
-        total_pledged = pledges.aggregate(Sum('pledged_amount'))['pledged_amount__sum'] or 0
-        total_paid = pledges.aggregate(Sum('paid_amount'))['paid_amount__sum'] or 0
-        total_balance = pledges.aggregate(Sum('balance'))['balance__sum'] or 0
-        
-        status_breakdown = {
-            'pledged': pledges.filter(payment_status='pledged').count(),
-            'partial': pledges.filter(payment_status='partial').count(),
-            'paid': pledges.filter(payment_status='paid').count(),
-            'cancelled': pledges.filter(payment_status='cancelled').count(),
-        }
+        total_pledged = summary['total_pledged']
+        total_paid = summary['total_paid']
         
         return Response({
             'total_pledged': total_pledged,
             'total_paid': total_paid,
-            'total_balance': total_balance,
+            'total_balance': summary['total_balance'],
             'collection_rate': (total_paid / total_pledged * 100) if total_pledged > 0 else 0,
-            'status_breakdown': status_breakdown,
-            'total_pledges': pledges.count()
+            'status_breakdown': {
+                payment_status: summary[f'{payment_status}_count'] for payment_status in PLEDGE_STATUSES
+            },
+            'total_pledges': summary['pledge_count']
         })
     
+    @action(detail=False, methods=['get', 'post'])
+    def reconcile(self, request, wedding_id=None):
+        """Pledges whose totals disagree with their payments; POST also repairs them"""
+        wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+        drifted = list(PledgeReconciliation.drifted(GuestPledge.objects.filter(wedding=wedding)))
+        
+        repaired = 0
+        if request.method == 'POST' and drifted:
+            repaired = PledgeReconciliation.repair([row['pk'] for row in drifted])
+        
+        return Response({
+            'drifted': [
+                {
+                    'pledge': row['pk'],
+                    'paid_amount': row['paid_amount'],
+                    'expected_paid_amount': row['true_paid'],
+                    'balance': row['balance'],
+                    'expected_balance': row['expected_balance'],
+                    'payment_status': row['payment_status'],
+                    'expected_payment_status': row['expected_status'],
+                }
+                for row in drifted
+            ],
+            'repaired': repaired,
+        })
+    
+    @action(detail=False, methods=['post'])
+    def import_payments(self, request, wedding_id=None):
+        """Import a mobile money statement (CSV upload as `file`) or pasted transaction SMS (`messages`)"""
+        wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+        
+        payment_method = request.data.get('payment_method', 'mobile_money')
+        if payment_method not in dict(GuestPledge.PAYMENT_METHOD_CHOICES):
+            return Response({'error': f'Unknown payment method: {payment_method}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        statement = request.FILES.get('file')
+        messages = request.data.get('messages')
+        if statement is not None:
+            transactions = read_statement(io.TextIOWrapper(statement.file, encoding='utf-8-sig', newline=''))
+        elif messages:
+            transactions = read_messages(split_messages(messages) if isinstance(messages, str) else messages)
+        else:
+            return Response(
+                {'error': 'Upload a statement file or paste the transaction messages'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            result = MobileMoneyImport(wedding, recorded_by=request.user, payment_method=payment_method).run(transactions)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': f'Could not read the statement: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(result, status=status.HTTP_201_CREATED if result['imported'] else status.HTTP_200_OK)
+    
     @action(detail=True, methods=['post'])
     def record_payment(self, request, pk=None, **kwargs):
         """Record a payment towards a pledge"""
@@ -52,33 +201,36 @@ class GuestPledgeViewSet(viewsets.ModelViewSet):
         
         serializer = PledgePaymentSerializer(data=request.data)
         if serializer.is_valid():
-            payment = serializer.save(pledge=pledge, recorded_by=request.user)
-            
-            # Update pledge paid amount
-            pledge.paid_amount += payment.amount
-            pledge.save()
-            
+            PledgeLedger.record_payment(pledge, recorded_by=request.user, **serializer.validated_data)
+            pledge = (
+                GuestPledge.objects.select_related('guest').prefetch_related(payment_history()).get(pk=pledge.pk)
+            )
             return Response(GuestPledgeSerializer(pledge).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PledgePaymentViewSet(viewsets.ModelViewSet):
+class PledgePaymentViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = PledgePaymentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
+    cursor_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
         pledge_id = self.kwargs.get('pledge_id')
         return PledgePayment.objects.filter(
             pledge_id=pledge_id,
             pledge__wedding__user=self.request.user
-        )
+        ).select_related('recorded_by')
     
     def perform_create(self, serializer):
         pledge_id = self.kwargs.get('pledge_id')
         pledge = get_object_or_404(GuestPledge, id=pledge_id, wedding__user=self.request.user)
-        
-        payment = serializer.save(pledge=pledge, recorded_by=self.request.user)
-        
-        # Update pledge total
-        pledge.paid_amount += payment.amount
-        pledge.save()
\ No newline at end of file
+        serializer.instance = PledgeLedger.record_payment(
+            pledge, recorded_by=self.request.user, **serializer.validated_data
+        )
+    
+    def perform_update(self, serializer):
+        serializer.instance = PledgeLedger.update_payment(serializer.instance, **serializer.validated_data)
+    
+    def perform_destroy(self, instance):
+        PledgeLedger.delete_payment(instance)
\ No newline at end of file
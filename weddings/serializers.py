@@ -1,39 +1,64 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .mixins import is_sparse_request, sparse_field_names
 from .models import (
     Wedding, Guest, Task, Budget, PhotoGallery, Photo,
     Timeline, Vendor, VendorNote, InvitationTemplate, GuestPledge, PledgePayment,
     WeddingAnalytics, WeeklyAnalyticsSnapshot, GuestEngagementMetrics
 )
 
-class UserSerializer(serializers.ModelSerializer):
+
+class SparseFieldsMixin:
+    """Render only the fields named in ?fields=a,b, or all but those in ?omit=c,d.
+
+    Applies to the top-level serializer of a read; nested serializers
+    render in full and unknown names are ignored. field_columns maps
+    computed fields to the columns they read, for the view's .only().
+    """
+    field_columns = {}
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        top_level = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+        if request is None or not top_level or not is_sparse_request(request):
+            return fields
+        return {name: fields[name] for name in sparse_field_names(request, fields)}
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
-class BudgetSerializer(serializers.ModelSerializer):
+class BudgetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Budget
-        fields = ['id', 'category', 'item_name', 'estimated_cost', 'actual_cost', 'notes', 'created_at', 'wedding']
-        read_only_fields = ['id', 'created_at', 'wedding']
+        fields = ['id', 'category', 'item_name', 'estimated_cost', 'actual_cost', 'notes', 'created_at', 'updated_at', 'wedding']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'wedding']
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ['id', 'title', 'description', 'priority', 'status', 'due_date', 'assigned_to', 'cost', 'created_at', 'updated_at', 'wedding']
         read_only_fields = ['id', 'created_at', 'updated_at', 'wedding']
 
 
-class GuestSerializer(serializers.ModelSerializer):
+class GuestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Guest
-        fields = ['id', 'wedding', 'name', 'email', 'phone', 'relationship', 'rsvp_status', 'number_of_guests', 'dietary_restrictions', 'created_at']
-        read_only_fields = ['id', 'wedding', 'created_at']  
+        fields = ['id', 'wedding', 'name', 'email', 'phone', 'relationship', 'rsvp_status', 'number_of_guests', 'dietary_restrictions', 'rsvp_responded_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'wedding', 'rsvp_responded_at', 'created_at', 'updated_at']  
+
+
+WEDDING_COLLECTIONS = ('guests', 'tasks', 'budget_items')
 
 
-class WeddingSerializer(serializers.ModelSerializer):
+class WeddingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     guests = GuestSerializer(many=True, read_only=True)
     tasks = TaskSerializer(many=True, read_only=True)
     budget_items = BudgetSerializer(many=True, read_only=True)
@@ -44,14 +69,38 @@ class WeddingSerializer(serializers.ModelSerializer):
                   'budget', 'status', 'description', 'guests', 'tasks', 'budget_items', 
                   'created_at', 'updated_at']
         read_only_fields = ['user', 'created_at', 'updated_at']
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # The view lists the nested collections to render; without it all of them are
+        collections = self.context.get('collections')
+        if collections is not None:
+            for name in WEDDING_COLLECTIONS:
+                if name not in collections:
+                    fields.pop(name, None)
+        return fields
+
+
+class WeddingListSerializer(WeddingSerializer):
+    """Wedding list rows: annotated guest, task and spending counts"""
+    guest_count = serializers.IntegerField(read_only=True)
+    confirmed_guest_count = serializers.IntegerField(read_only=True)
+    task_count = serializers.IntegerField(read_only=True)
+    completed_task_count = serializers.IntegerField(read_only=True)
+    total_spent = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    
+    class Meta(WeddingSerializer.Meta):
+        fields = WeddingSerializer.Meta.fields + [
+            'guest_count', 'confirmed_guest_count', 'task_count', 'completed_task_count', 'total_spent',
+        ]
 
-class PhotoSerializer(serializers.ModelSerializer):
+class PhotoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Photo
         fields = '__all__'
 
 
-class PhotoGallerySerializer(serializers.ModelSerializer):
+class PhotoGallerySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     photos = PhotoSerializer(many=True, read_only=True)
     
     class Meta:
@@ -59,8 +108,9 @@ class PhotoGallerySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class TimelineSerializer(serializers.ModelSerializer):
+class TimelineSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     days_until = serializers.SerializerMethodField()
+    field_columns = {'days_until': ['date']}
     
     def get_days_until(self, obj):
         from datetime import date
@@ -73,7 +123,7 @@ class TimelineSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class VendorNoteSerializer(serializers.ModelSerializer):
+class VendorNoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
     
     class Meta:
@@ -81,9 +131,10 @@ class VendorNoteSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class VendorSerializer(serializers.ModelSerializer):
+class VendorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     note_entries = VendorNoteSerializer(many=True, read_only=True)
     remaining_amount = serializers.SerializerMethodField()
+    field_columns = {'remaining_amount': ['final_amount', 'deposit_paid']}
     
     def get_remaining_amount(self, obj):
         if obj.final_amount and obj.deposit_paid:
@@ -95,25 +146,26 @@ class VendorSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class InvitationTemplateSerializer(serializers.ModelSerializer):
+class InvitationTemplateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = InvitationTemplate
         fields = '__all__'
 
-class PledgePaymentSerializer(serializers.ModelSerializer):
+class PledgePaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     recorded_by_username = serializers.CharField(source='recorded_by.username', read_only=True)
     
     class Meta:
         model = PledgePayment
         fields = ['id', 'pledge', 'amount', 'payment_date', 'payment_method', 
-                  'reference_number', 'notes', 'recorded_by', 'recorded_by_username', 'created_at']
-        read_only_fields = ['id', 'created_at', 'recorded_by', 'pledge']
+                  'reference_number', 'notes', 'recorded_by', 'recorded_by_username', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'recorded_by', 'pledge']
 
 
-class GuestPledgeSerializer(serializers.ModelSerializer):
+class GuestPledgeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     guest_name = serializers.CharField(source='guest.name', read_only=True)
     payments = PledgePaymentSerializer(many=True, read_only=True)
     payment_progress = serializers.SerializerMethodField()
+    field_columns = {'payment_progress': ['paid_amount', 'pledged_amount']}
     
     def get_payment_progress(self, obj):
         if obj.pledged_amount > 0:
@@ -126,9 +178,21 @@ class GuestPledgeSerializer(serializers.ModelSerializer):
                   'balance', 'payment_status', 'payment_method',
                   'pledge_date', 'payment_deadline', 'notes', 'payments', 'payment_progress',
                   'created_at', 'updated_at']
-        read_only_fields = ['id', 'balance', 'payment_status', 'created_at', 'updated_at', 'wedding']
+        read_only_fields = ['id', 'paid_amount', 'balance', 'payment_status', 'created_at', 'updated_at', 'wedding']
+
+
+class GuestPledgeListSerializer(GuestPledgeSerializer):
+    """Pledge list rows: payment count and latest payment date instead of the payment history"""
+    payments = None
+    payment_count = serializers.IntegerField(read_only=True)
+    last_payment_date = serializers.DateField(read_only=True)
+    
+    class Meta(GuestPledgeSerializer.Meta):
+        fields = [field for field in GuestPledgeSerializer.Meta.fields if field != 'payments'] + [
+            'payment_count', 'last_payment_date',
+        ]
 
-class WeddingAnalyticsSerializer(serializers.ModelSerializer):
+class WeddingAnalyticsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = WeddingAnalytics
         fields = [
@@ -159,12 +223,12 @@ class WeddingAnalyticsSerializer(serializers.ModelSerializer):
             'overall_health_score',
         ]
 
-class WeeklyAnalyticsSnapshotSerializer(serializers.ModelSerializer):
+class WeeklyAnalyticsSnapshotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = WeeklyAnalyticsSnapshot
         fields = '__all__'
 
-class GuestEngagementMetricsSerializer(serializers.ModelSerializer):
+class GuestEngagementMetricsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = GuestEngagementMetrics
         fields = '__all__'
\ No newline at end of file
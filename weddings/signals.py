@@ -0,0 +1,187 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .analytics_cache import AnalyticsCache
+from .analytics_counters import AnalyticsCounters
+from .analytics_events import AnalyticsEvents
+from .analytics_queue import AnalyticsQueue
+from .analytics_service import WeddingAnalyticsService
+from .change_log import SYNC_RESOURCES, ChangeLog
+from .models import Budget, Guest, GuestPledge, PledgePayment, PledgeTotals, Wedding
+from .pledge_service import PLEDGE_STATE_FIELDS, PledgeSummary
+
+
+def remember_stored_values(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._analytics_previous = AnalyticsCounters.stored_values(instance)
+
+
+def apply_saved_row(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_analytics_previous', None)
+    if AnalyticsCounters.record_save(instance, previous):
+        record_events(instance, previous, AnalyticsCounters.values_of(instance))
+        if AnalyticsCounters.needs_recompute(sender):
+            AnalyticsQueue.mark_dirty(instance.wedding_id)
+        AnalyticsCache.bump(instance.wedding_id)
+    instance._analytics_previous = AnalyticsCounters.values_of(instance)
+
+
+def unless_wedding_deleted(wedding_id, callback):
+    """Run `callback` once the transaction commits, unless the wedding went with it.
+
+    Deleting a user or a queryset of weddings reaches the child rows first,
+    with the user or the queryset as origin, so a handler cannot tell from
+    the origin alone that the wedding is going too.
+    """
+    transaction.on_commit(
+        lambda: Wedding.objects.filter(pk=wedding_id).exists() and callback(), robust=True,
+    )
+
+
+def apply_deleted_row(sender, instance, origin=None, **kwargs):
+    # The analytics row goes away with the wedding, nothing to adjust
+    if isinstance(origin, Wedding):
+        return
+    values = AnalyticsCounters.values_of(instance)
+
+    def apply():
+        AnalyticsCounters.record_delete(instance)
+        record_events(instance, values, None)
+        if AnalyticsCounters.needs_recompute(sender):
+            AnalyticsQueue.mark_dirty(values['wedding_id'])
+        AnalyticsCache.bump(values['wedding_id'])
+
+    unless_wedding_deleted(values['wedding_id'], apply)
+
+
+def record_events(instance, previous, current):
+    """Log RSVP transitions and spend changes; either side may be None"""
+    if isinstance(instance, Guest):
+        old = previous['rsvp_status'] if previous else ''
+        new = current['rsvp_status'] if current else ''
+        if previous and current and previous['wedding_id'] != current['wedding_id']:
+            AnalyticsEvents.record_rsvp(previous['wedding_id'], '', old)
+            old = ''
+        AnalyticsEvents.record_rsvp((current or previous)['wedding_id'], new, old)
+    elif isinstance(instance, Budget):
+        old = (previous['actual_cost'] or 0) if previous else 0
+        new = (current['actual_cost'] or 0) if current else 0
+        if previous and current and previous['wedding_id'] != current['wedding_id']:
+            AnalyticsEvents.record_spend(previous['wedding_id'], -old)
+            old = 0
+        AnalyticsEvents.record_spend((current or previous)['wedding_id'], new - old)
+
+
+for model in AnalyticsCounters.tracked_models():
+    pre_save.connect(remember_stored_values, sender=model, dispatch_uid=f'analytics_pre_save_{model.__name__}')
+    post_save.connect(apply_saved_row, sender=model, dispatch_uid=f'analytics_post_save_{model.__name__}')
+    post_delete.connect(apply_deleted_row, sender=model, dispatch_uid=f'analytics_post_delete_{model.__name__}')
+
+
+@receiver(post_save, sender=Wedding, dispatch_uid='analytics_wedding_saved')
+def wedding_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        WeddingAnalyticsService.calculate_analytics(instance)
+        if PledgeSummary.denormalized():
+            PledgeTotals.objects.create(wedding=instance)
+    else:
+        # The wedding date may have moved; let the worker refresh days-until
+        AnalyticsQueue.mark_dirty(instance.id)
+        AnalyticsCache.bump(instance.id)
+
+
+@receiver(pre_save, sender=PledgePayment, dispatch_uid='analytics_event_payment_pre_save')
+def remember_stored_payment(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        instance._stored_payment = None
+        return
+    instance._stored_payment = (
+        PledgePayment.objects.filter(pk=instance.pk)
+        .values('amount', 'payment_date', 'pledge__wedding_id')
+        .first()
+    )
+
+
+@receiver(post_save, sender=PledgePayment, dispatch_uid='analytics_event_payment_saved')
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stored = getattr(instance, '_stored_payment', None)
+    wedding_id = instance.pledge.wedding_id
+    if stored and (stored['payment_date'], stored['pledge__wedding_id']) != (instance.payment_date, wedding_id):
+        # Moved to another day or wedding: reverse it there, record it in full here
+        AnalyticsEvents.record_payment(stored['pledge__wedding_id'], -stored['amount'], stored['payment_date'])
+        stored = None
+    previous_amount = stored['amount'] if stored else 0
+    AnalyticsEvents.record_payment(wedding_id, instance.amount - previous_amount, instance.payment_date)
+
+
+@receiver(post_delete, sender=PledgePayment, dispatch_uid='analytics_event_payment_deleted')
+def payment_deleted(sender, instance, origin=None, **kwargs):
+    # The events go away with the wedding
+    if isinstance(origin, Wedding):
+        return
+    wedding_id = instance.pledge.wedding_id
+    unless_wedding_deleted(
+        wedding_id, lambda: AnalyticsEvents.record_payment(wedding_id, -instance.amount, instance.payment_date),
+    )
+
+
+@receiver(pre_save, sender=GuestPledge, dispatch_uid='pledge_totals_pre_save')
+def remember_stored_pledge(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None or not PledgeSummary.denormalized():
+        instance._stored_pledge = None
+        return
+    instance._stored_pledge = GuestPledge.objects.filter(pk=instance.pk).values(*PLEDGE_STATE_FIELDS).first()
+
+
+@receiver(post_save, sender=GuestPledge, dispatch_uid='pledge_totals_saved')
+def pledge_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    current = {field: getattr(instance, field) for field in PLEDGE_STATE_FIELDS}
+    PledgeSummary.apply_changes(PledgeSummary.changes(getattr(instance, '_stored_pledge', None), current))
+    instance._stored_pledge = current
+
+
+@receiver(pre_delete, sender=GuestPledge, dispatch_uid='pledge_totals_pre_delete')
+def remember_deleted_pledge(sender, instance, origin=None, **kwargs):
+    # The instance may predate ledger updates, so subtract what is stored
+    if isinstance(origin, Wedding) or not PledgeSummary.denormalized():
+        instance._stored_pledge = None
+        return
+    instance._stored_pledge = GuestPledge.objects.filter(pk=instance.pk).values(*PLEDGE_STATE_FIELDS).first()
+
+
+@receiver(post_delete, sender=GuestPledge, dispatch_uid='pledge_totals_deleted')
+def pledge_deleted(sender, instance, origin=None, **kwargs):
+    # The totals row goes away with the wedding
+    if isinstance(origin, Wedding):
+        return
+    changes = PledgeSummary.changes(getattr(instance, '_stored_pledge', None), None)
+    unless_wedding_deleted(instance.wedding_id, lambda: PledgeSummary.apply_changes(changes))
+
+
+def record_saved_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ChangeLog.record_instance(instance)
+
+
+def record_deleted_change(sender, instance, origin=None, **kwargs):
+    # The change log goes away with the wedding
+    if isinstance(origin, Wedding):
+        return
+    ChangeLog.record_instance(instance, deleted=True)
+
+
+for resource in SYNC_RESOURCES.values():
+    model = resource.model
+    post_save.connect(record_saved_change, sender=model, dispatch_uid=f'sync_post_save_{model.__name__}')
+    post_delete.connect(record_deleted_change, sender=model, dispatch_uid=f'sync_post_delete_{model.__name__}')
@@ -1,3 +1,1436 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .analytics_aggregates import WeddingAggregates
+from .analytics_cache import AnalyticsCache
+from .analytics_events import AnalyticsEvents
+from .analytics_queue import AnalyticsQueue
+from .analytics_service import WeddingAnalyticsService
+from .analytics_views import _fill_missing_weeks
+from .bulk_service import BulkWrite
+from .exports import export_rows
+from .guest_import import GuestImport, read_csv, read_vcards
+from .headcount import GuestHeadcount
+from .health_cohorts import MIN_COHORT_SIZE, HealthCohorts
+from .models import (
+    AnalyticsDirtyMark, AnalyticsEvent, Budget, Guest, GuestEngagementMetrics, GuestPledge, HealthCohortPercentile,
+    PledgePayment, PledgeTotals, Task, Timeline, Vendor, Wedding, WeddingAnalytics, WeddingChange,
+    WeddingChangeCounter, WeeklyAnalyticsSnapshot,
+)
+from .mobile_money import MobileMoneyImport, read_messages, read_statement, split_messages
+from .pledge_service import PledgeLedger, PledgeReconciliation, PledgeSummary
+from .pledge_views import GuestPledgeViewSet
+from .serializers import WEDDING_COLLECTIONS
+from .views import GuestViewSet, TaskViewSet, VendorViewSet
+
+try:
+    from .health_engine import HealthScoreEngine
+except ImportError:
+    HealthScoreEngine = None
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_wedding(username, days_ahead=120):
+    user = User.objects.create_user(username, password='secret')
+    return Wedding.objects.create(
+        user=user, bride_name='Amina', groom_name='Baraka',
+        wedding_date=date.today() + timedelta(days=days_ahead), venue='Dar es Salaam', budget=10000000,
+    )
+
+
+def add_vendor(wedding, **fields):
+    return Vendor.objects.create(
+        wedding=wedding, vendor_type='catering', business_name='Caterer', contact_person='Juma',
+        phone='0711000000', **fields,
+    )
+
+
+class WeddingAggregatesTests(TestCase):
+
+    def setUp(self):
+        self.wedding = make_wedding('aggregator')
+        Budget.objects.create(wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=500, actual_cost=450)
+        Budget.objects.create(wedding=self.wedding, category='venue', item_name='Chairs', estimated_cost=200)
+        Budget.objects.create(wedding=self.wedding, category='catering', item_name='Food', estimated_cost=300, actual_cost=350)
+        yesterday = date.today() - timedelta(days=1)
+        Task.objects.create(wedding=self.wedding, title='Book venue', status='done', due_date=yesterday)
+        Task.objects.create(wedding=self.wedding, title='Send cards', due_date=yesterday)
+        Task.objects.create(wedding=self.wedding, title='Fit dress', status='in_progress', due_date=date.today())
+        Task.objects.create(wedding=self.wedding, title='Pick songs')
+        add_vendor(self.wedding, status='booked', quote=300, final_amount=280)
+        add_vendor(self.wedding, quote=0)
+        add_vendor(self.wedding, quote=100)
+
+    def test_values_match_the_fixture(self):
+        self.assertEqual(WeddingAggregates.budget(self.wedding.id), {
+            'estimated': Decimal('1000.00'),
+            'actual': Decimal('800.00'),
+            'categories': {
+                'catering': {'estimated': Decimal('300.00'), 'actual': Decimal('350.00'), 'count': 1},
+                'venue': {'estimated': Decimal('700.00'), 'actual': Decimal('450.00'), 'count': 2},
+            },
+        })
+        self.assertEqual(
+            WeddingAggregates.tasks(self.wedding.id),
+            {'total': 4, 'completed': 1, 'pending': 3, 'overdue': 1},
+        )
+        # The zero quote is "no quote yet"; the final amount wins over the quote
+        self.assertEqual(
+            WeddingAggregates.vendors(self.wedding.id),
+            {'total': 3, 'booked': 1, 'average_quote': Decimal('200.00'), 'total_cost': Decimal('380.00')},
+        )
+
+    def test_query_count_does_not_grow_with_the_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            WeddingAnalyticsService.calculate_analytics(self.wedding)
+        for index in range(20):
+            Guest.objects.create(wedding=self.wedding, name=f'Guest {index}', phone=f'07{index:08d}')
+            Task.objects.create(wedding=self.wedding, title=f'Task {index}')
+            add_vendor(self.wedding, quote=index)
+        with self.assertNumQueries(len(queries)):
+            analytics = WeddingAnalyticsService.calculate_analytics(self.wedding)
+        self.assertEqual((analytics.total_invitations_sent, analytics.total_tasks, analytics.total_vendors), (20, 24, 23))
+
+
+class AnalyticsCountersTests(TestCase):
+
+    def setUp(self):
+        self.wedding = make_wedding('counter')
+
+    def assertMatchesRecompute(self):
+        self.assertEqual(WeddingAnalyticsService.verify_analytics(self.wedding), {})
+
+    def test_row_writes_keep_the_counters_equal_to_a_recompute(self):
+        guests = [
+            Guest.objects.create(wedding=self.wedding, name=f'Guest {index}', phone=f'07{index:08d}', number_of_guests=index + 1)
+            for index in range(3)
+        ]
+        guests[0].rsvp_status = 'confirmed'
+        guests[0].save()
+        guests[1].rsvp_status, guests[1].number_of_guests = 'declined', 1
+        guests[1].save()
+        with self.captureOnCommitCallbacks(execute=True):
+            guests[2].delete()
+
+        task = Task.objects.create(wedding=self.wedding, title='Book venue', due_date=date.today() - timedelta(days=3))
+        Task.objects.create(wedding=self.wedding, title='Send cards')
+        task.status = 'done'
+        task.save()
+
+        hall = Budget.objects.create(wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=500)
+        food = Budget.objects.create(wedding=self.wedding, category='catering', item_name='Food', estimated_cost=300)
+        hall.actual_cost, hall.category = Decimal('450'), 'decoration'
+        hall.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            food.delete()
+
+        vendor = add_vendor(self.wedding, quote=300)
+        add_vendor(self.wedding, quote=100, status='booked')
+        vendor.final_amount, vendor.status = Decimal('250'), 'booked'
+        vendor.save()
+
+        event = Timeline.objects.create(wedding=self.wedding, event_type='ceremony', title='Ceremony', date=self.wedding.wedding_date)
+        event.is_completed = True
+        event.save()
+
+        self.assertMatchesRecompute()
+        self.assertEqual(self.wedding.analytics.total_confirmed, 1)
+
+    def test_bulk_writes_keep_the_counters_equal_to_a_recompute(self):
+        doomed = Task.objects.create(wedding=self.wedding, title='Old task')
+        kept = Budget.objects.create(wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=500)
+        BulkWrite(self.wedding, Guest).run(creates=[
+            {'name': 'Bibi', 'phone': '0711000001', 'rsvp_status': 'confirmed', 'number_of_guests': 2},
+            {'name': 'Babu', 'phone': '0711000002'},
+        ])
+        BulkWrite(self.wedding, Task).run(
+            creates=[{'title': 'Overdue', 'due_date': date.today() - timedelta(days=1)}],
+            deletes=[doomed.pk],
+        )
+        BulkWrite(self.wedding, Budget).run(
+            creates=[{'category': 'catering', 'item_name': 'Food', 'estimated_cost': Decimal('300')}],
+            updates={kept.pk: {'actual_cost': Decimal('520')}},
+        )
+        self.assertMatchesRecompute()
+
+    def test_counted_writes_do_not_queue_a_recompute(self):
+        AnalyticsDirtyMark.objects.all().delete()
+        task = Task.objects.create(wedding=self.wedding, title='Book venue')
+        task.status = 'done'
+        task.save()
+        self.assertFalse(AnalyticsDirtyMark.objects.exists())
+
+        # Guests also feed the engagement metrics, which have no counters
+        Guest.objects.create(wedding=self.wedding, name='Bibi', phone='0711000001')
+        self.assertTrue(AnalyticsDirtyMark.objects.filter(wedding=self.wedding).exists())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AnalyticsCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.wedding = make_wedding('cached')
+        self.client = APIClient()
+        self.client.force_authenticate(self.wedding.user)
+        self.url = f'/api/weddings/{self.wedding.id}/analytics/'
+
+    def test_second_read_is_a_hit_without_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        stats = AnalyticsCache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_entries_are_per_user(self):
+        self.client.get(self.url)
+        stranger = APIClient()
+        stranger.force_authenticate(User.objects.create_user('stranger', password='secret'))
+        self.assertEqual(stranger.get(self.url).status_code, 404)
+
+    def test_a_write_invalidates_the_wedding(self):
+        self.assertEqual(self.client.get(self.url).data['total_invitations_sent'], 0)
+        response = self.client.post(f'/api/weddings/{self.wedding.id}/guests/', {'name': 'Bibi', 'phone': '0711000001'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(self.client.get(self.url).content)['total_invitations_sent'], 1)
+        self.assertEqual(AnalyticsCache.stats()['hits'], 0)
+
+
+class AnalyticsQueueTests(TestCase):
+
+    def setUp(self):
+        self.wedding = make_wedding('queued')
+        AnalyticsDirtyMark.objects.all().delete()
+
+    def age_marks(self, seconds, field='last_marked_at'):
+        AnalyticsDirtyMark.objects.update(**{field: timezone.now() - timedelta(seconds=seconds)})
+
+    def test_repeated_marks_coalesce_into_one_recompute(self):
+        for _ in range(3):
+            AnalyticsQueue.mark_dirty(self.wedding.id)
+        self.assertEqual(AnalyticsDirtyMark.objects.count(), 1)
+        WeddingAnalytics.objects.filter(wedding=self.wedding).update(total_confirmed=7)
+
+        self.age_marks(60)
+        self.assertEqual(AnalyticsQueue.process_ready(debounce=30), [self.wedding.id])
+        self.assertFalse(AnalyticsDirtyMark.objects.exists())
+        self.assertEqual(WeddingAnalytics.objects.get(wedding=self.wedding).total_confirmed, 0)
+        self.assertEqual(AnalyticsQueue.process_ready(debounce=30), [])
+
+    def test_marks_inside_the_debounce_window_wait(self):
+        AnalyticsQueue.mark_dirty(self.wedding.id)
+        self.assertEqual(AnalyticsQueue.process_ready(debounce=30, max_wait=300), [])
+        self.assertTrue(AnalyticsDirtyMark.objects.filter(wedding=self.wedding).exists())
+
+        # A wedding that keeps being edited is still recomputed after max_wait
+        self.age_marks(400, 'first_marked_at')
+        self.assertEqual(AnalyticsQueue.process_ready(debounce=30, max_wait=300), [self.wedding.id])
+
+
+class RecomputeAnalyticsCommandTests(TestCase):
+
+    def test_every_wedding_is_refreshed(self):
+        weddings = [make_wedding(f'batch{index}') for index in range(3)]
+        for index, wedding in enumerate(weddings):
+            for number in range(index + 1):
+                Guest.objects.create(wedding=wedding, name=f'Guest {number}', phone=f'07{number:08d}', rsvp_status='confirmed')
+        WeddingAnalytics.objects.filter(wedding=weddings[0]).update(total_confirmed=99)
+        WeddingAnalytics.objects.filter(wedding=weddings[1]).delete()
+
+        # Spawned workers could not see this test's transaction, so compute in-process
+        call_command('recompute_analytics', '--workers=0', '--chunk-size=2', stdout=io.StringIO())
+        rows = WeddingAnalytics.objects.in_bulk([wedding.id for wedding in weddings], field_name='wedding_id')
+        self.assertEqual([rows[wedding.id].total_confirmed for wedding in weddings], [1, 2, 3])
+        self.assertEqual(GuestEngagementMetrics.objects.filter(wedding__in=weddings).count(), 3)
+        self.assertFalse(AnalyticsDirtyMark.objects.filter(wedding__in=weddings).exists())
+
+
+class WeeklySnapshotTests(TestCase):
+
+    def test_rerunning_the_command_updates_this_weeks_row(self):
+        wedding = make_wedding('snapshots')
+        Guest.objects.create(wedding=wedding, name='Amina', phone='0700000001', rsvp_status='confirmed')
+        call_command('create_weekly_snapshots', stdout=io.StringIO())
+        Guest.objects.create(wedding=wedding, name='Baraka', phone='0700000002', rsvp_status='confirmed')
+        call_command('create_weekly_snapshots', stdout=io.StringIO())
+
+        iso_year, week_number, _ = date.today().isocalendar()
+        snapshot = WeeklyAnalyticsSnapshot.objects.get(wedding=wedding)
+        self.assertEqual((snapshot.iso_year, snapshot.week_number), (iso_year, week_number))
+        self.assertEqual(snapshot.confirmed_count, 2)
+
+    def test_missing_weeks_carry_the_previous_week_across_new_year(self):
+        snapshots = [
+            {'id': 1, 'iso_year': 2026, 'week_number': 52, 'confirmed_count': 4},
+            {'id': 2, 'iso_year': 2027, 'week_number': 2, 'confirmed_count': 7},
+        ]
+        series = _fill_missing_weeks(snapshots)
+        self.assertEqual(
+            [(week['iso_year'], week['week_number'], week['confirmed_count'], week['carried_forward']) for week in series],
+            [(2026, 52, 4, False), (2026, 53, 4, True), (2027, 1, 4, True), (2027, 2, 7, False)],
+        )
+        self.assertIsNone(series[1]['id'])
+
+    def test_migration_takes_the_iso_year_from_the_snapshot_week(self):
+        snapshot_iso_year = import_module('weddings.migrations.0004_weekly_snapshot_iso_year').snapshot_iso_year
+        cases = [
+            (datetime(2026, 6, 10, 9, 0), 24, 2026),
+            # 1 January 2027 is still in week 53 of 2026
+            (datetime(2027, 1, 1, 9, 0), 53, 2026),
+            # 30 December 2024 is already in week 1 of 2025
+            (datetime(2024, 12, 30, 9, 0), 1, 2025),
+            # Written just after New Year for the last week of the old year
+            (datetime(2025, 1, 1, 0, 30), 52, 2024),
+            (datetime(2024, 12, 31, 23, 30), 2, 2025),
+        ]
+        for created_at, week_number, iso_year in cases:
+            with self.subTest(created_at=created_at, week_number=week_number):
+                self.assertEqual(snapshot_iso_year(created_at, week_number), iso_year)
+
+
+class AnalyticsEventSeriesTests(TestCase):
+
+    def setUp(self):
+        self.wedding = make_wedding('series')
+        AnalyticsEvent.objects.filter(wedding=self.wedding).delete()
+
+    def event(self, when, kind, label='', previous_label='', amount=0):
+        AnalyticsEvent.objects.create(
+            wedding=self.wedding, kind=kind, label=label, previous_label=previous_label,
+            amount=amount, occurred_at=timezone.make_aware(when),
+        )
+
+    def test_weekly_series_starts_from_the_earlier_events(self):
+        self.event(datetime(2026, 2, 20, 12, 0), 'rsvp', 'pending')
+        self.event(datetime(2026, 2, 21, 12, 0), 'rsvp', 'pending')
+        # The last second before the first bucket, and the first second of it
+        self.event(datetime(2026, 3, 1, 23, 59, 59), 'payment', amount=100)
+        self.event(datetime(2026, 3, 2, 0, 0), 'payment', amount=50)
+        self.event(datetime(2026, 3, 8, 23, 59, 59), 'rsvp', 'confirmed', 'pending')
+        self.event(datetime(2026, 3, 9, 0, 0), 'spend', amount=30)
+        # After the last bucket
+        self.event(datetime(2026, 3, 16, 0, 0), 'payment', amount=999)
+
+        series = AnalyticsEvents.series(self.wedding.id, date(2026, 3, 4), date(2026, 3, 15))
+        self.assertEqual([point['period'] for point in series], ['2026-03-02', '2026-03-09'])
+        first, second = series
+        self.assertEqual(first['rsvp'], {'pending': 1, 'confirmed': 1, 'declined': 0})
+        self.assertEqual(first['rsvp_changes'], {'pending': -1, 'confirmed': 1, 'declined': 0})
+        self.assertEqual((first['payments'], first['payments_to_date']), (50, 150))
+        self.assertEqual((second['spend'], second['spend_to_date'], second['payments_to_date']), (30, 30, 150))
+        self.assertEqual(second['rsvp'], first['rsvp'])
+
+    def test_monthly_buckets_split_at_midnight_on_the_first(self):
+        self.event(datetime(2026, 2, 28, 23, 59, 59), 'spend', amount=5)
+        self.event(datetime(2026, 3, 31, 23, 59, 59), 'spend', amount=10)
+        self.event(datetime(2026, 4, 1, 0, 0), 'spend', amount=20)
+
+        series = AnalyticsEvents.series(self.wedding.id, date(2026, 3, 15), date(2026, 4, 30), granularity='month')
+        self.assertEqual(
+            [(point['period'], point['spend'], point['spend_to_date']) for point in series],
+            [('2026-03-01', 10, 15), ('2026-04-01', 20, 35)],
+        )
+
+
+class WeddingDeletionTests(TestCase):
+    """Deleting a wedding's owner or a queryset of weddings writes nothing for them on the way out"""
+
+    def setUp(self):
+        self.wedding = make_wedding('leaving')
+        # Write the change log for these rows, so there is one to take away
+        with self.captureOnCommitCallbacks(execute=True):
+            Guest.objects.create(wedding=self.wedding, name='Bibi', phone='0711000001', rsvp_status='confirmed')
+            Task.objects.create(wedding=self.wedding, title='Book venue')
+            Budget.objects.create(
+                wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=500, actual_cost=450,
+            )
+            pledge = GuestPledge.objects.create(guest=self.wedding.guests.get(), wedding=self.wedding, pledged_amount=100)
+            PledgePayment.objects.create(pledge=pledge, amount=40, payment_date=date.today(), payment_method='cash')
+        self.assertTrue(WeddingChange.objects.filter(wedding=self.wedding).exists())
+        AnalyticsDirtyMark.objects.all().delete()
+
+    def assertNothingLeft(self):
+        connection.check_constraints()
+        self.assertFalse(Wedding.objects.filter(pk=self.wedding.pk).exists())
+        self.assertFalse(AnalyticsDirtyMark.objects.exists())
+        self.assertFalse(WeddingChange.objects.exists())
+        self.assertFalse(WeddingChangeCounter.objects.exists())
+
+    def test_deleting_the_owner(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wedding.user.delete()
+        self.assertNothingLeft()
+
+    def test_deleting_a_queryset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Wedding.objects.filter(pk=self.wedding.pk).delete()
+        self.assertNothingLeft()
+
+    def test_deleting_a_row_still_adjusts_the_wedding(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Guest.objects.filter(wedding=self.wedding).delete()
+        self.assertEqual(WeddingAnalyticsService.verify_analytics(self.wedding), {})
+        self.assertTrue(AnalyticsDirtyMark.objects.filter(wedding=self.wedding).exists())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ConditionalRequestTests(TestCase):
+    """Unchanged reads answer 304 and any change the payload shows gets a fresh ETag"""
+
+    def setUp(self):
+        cache.clear()
+        self.wedding = make_wedding('conditional')
+        self.guest = Guest.objects.create(wedding=self.wedding, name='Amina', phone='0700000001')
+        self.pledge = GuestPledge.objects.create(guest=self.guest, wedding=self.wedding, pledged_amount=1000)
+        self.payment = PledgePayment.objects.create(
+            pledge=self.pledge, amount=200, payment_date=date.today() - timedelta(days=3), payment_method='cash',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.wedding.user)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        return response['ETag']
+
+    def assertChanged(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_analytics_summary(self):
+        url = f'/api/weddings/{self.wedding.id}/analytics/'
+        etag = self.etag(url)
+        self.etag(url)
+        Budget.objects.create(wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=500, actual_cost=450)
+        self.assertChanged(url, etag)
+
+    def test_pledge_list_after_a_payment_is_edited(self):
+        url = f'/api/weddings/{self.wedding.id}/pledges/'
+        etag = self.etag(url)
+        response = self.client.put(
+            f'{url}{self.pledge.id}/payments/{self.payment.id}/',
+            {'amount': '200.00', 'payment_date': date.today().isoformat(), 'payment_method': 'cash'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertChanged(url, etag)
+
+    def test_pledge_list_markers_count_pledges_not_payments(self):
+        PledgePayment.objects.create(pledge=self.pledge, amount=300, payment_date=date.today(), payment_method='cash')
+        url = f'/api/weddings/{self.wedding.id}/pledges/'
+        etag = self.etag(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse([query for query in queries if 'JOIN "weddings_pledgepayment"' in query['sql']])
+
+        other = Guest.objects.create(wedding=self.wedding, name='Baraka', phone='0700000002')
+        GuestPledge.objects.create(guest=other, wedding=self.wedding, pledged_amount=500)
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            GuestPledge.objects.filter(guest=other).delete()
+        self.assertChanged(url, etag)
+
+    def test_pledge_list_after_a_guest_is_renamed(self):
+        url = f'/api/weddings/{self.wedding.id}/pledges/'
+        etag = self.etag(url)
+        self.guest.name = 'Amina Juma'
+        self.guest.save()
+        self.assertChanged(url, etag)
+
+    def test_guest_list_after_a_delete(self):
+        url = f'/api/weddings/{self.wedding.id}/guests/'
+        Guest.objects.create(wedding=self.wedding, name='Baraka', phone='0700000002')
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Guest.objects.filter(name='Baraka').delete()
+        self.assertChanged(url, etag)
+
+
+class GuestHeadcountTests(TestCase):
+
+    def test_seats_count_every_guest_on_an_invitation(self):
+        wedding = make_wedding('headcount')
+        guests = [
+            ('confirmed', 'family', 3, 'Vegetarian'),
+            ('confirmed', 'family', 3, ''),
+            ('confirmed', 'friend', 1, ''),
+            ('pending', 'friend', 2, 'Halal'),
+            ('pending', 'colleague', 4, ''),
+            ('declined', 'family', 2, ''),
+            ('declined', '', 1, ''),
+        ]
+        for index, (rsvp_status, relationship, number_of_guests, dietary) in enumerate(guests):
+            Guest.objects.create(
+                wedding=wedding, name=f'Guest {index}', phone=f'07{index:08d}', rsvp_status=rsvp_status,
+                relationship=relationship, number_of_guests=number_of_guests, dietary_restrictions=dietary,
+            )
+
+        with self.assertNumQueries(1):
+            headcount = GuestHeadcount.for_wedding(wedding.id)
+        self.assertEqual((headcount['invitations'], headcount['seats']), (7, 16))
+        self.assertEqual(headcount['by_status'], {
+            'confirmed': {'invitations': 3, 'seats': 7},
+            'pending': {'invitations': 2, 'seats': 6},
+            'declined': {'invitations': 2, 'seats': 3},
+        })
+        self.assertEqual(headcount['by_relationship']['family'], {'invitations': 3, 'seats': 8})
+        self.assertEqual(headcount['by_relationship']['friend'], {'invitations': 2, 'seats': 3})
+        self.assertEqual(headcount['by_relationship']['other'], {'invitations': 0, 'seats': 0})
+        self.assertEqual(headcount['dietary'], {'invitations': 2, 'seats': 5})
+        self.assertEqual(headcount['group_sizes'], {1: 2, 2: 2, 3: 2, 4: 1})
+
+
+class RsvpResponseTimeTests(TestCase):
+
+    def setUp(self):
+        self.wedding = make_wedding('responses')
+
+    def invite(self, name, days_ago, rsvp_status='pending'):
+        guest = Guest.objects.create(wedding=self.wedding, name=name, phone='0700000001', rsvp_status=rsvp_status)
+        Guest.objects.filter(pk=guest.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        guest.refresh_from_db()
+        return guest
+
+    def test_first_answer_is_kept_through_later_edits(self):
+        guest = self.invite('Amina', days_ago=5)
+        self.assertIsNone(guest.rsvp_responded_at)
+        guest.rsvp_status = 'confirmed'
+        guest.save(update_fields=['rsvp_status'])
+        answered = Guest.objects.get(pk=guest.pk).rsvp_responded_at
+        self.assertIsNotNone(answered)
+
+        guest.rsvp_status = 'declined'
+        guest.save()
+        guest.name = 'Amina Juma'
+        guest.save()
+        self.assertEqual(Guest.objects.get(pk=guest.pk).rsvp_responded_at, answered)
+
+        guest.rsvp_status = 'pending'
+        guest.save()
+        self.assertIsNone(Guest.objects.get(pk=guest.pk).rsvp_responded_at)
+
+    def test_average_counts_only_guests_who_answered(self):
+        for name, days_ago in (('Baraka', 10), ('Neema', 4)):
+            guest = self.invite(name, days_ago)
+            guest.rsvp_status = 'confirmed'
+            guest.save()
+        self.invite('Daudi', days_ago=30)
+        Guest.objects.create(wedding=self.wedding, name='Zawadi', phone='0700000002', rsvp_status='declined')
+
+        # (10 + 4 + 0) / 3 days
+        self.assertEqual(WeddingAggregates.average_response_days(self.wedding.id), 5)
+        metrics = WeddingAnalyticsService.calculate_engagement_metrics(self.wedding)
+        self.assertEqual(metrics.average_response_time, 5)
+
+
+@skipIf(HealthScoreEngine is None, 'The health engine needs NumPy')
+class HealthScoreEngineTests(TestCase):
+
+    def setUp(self):
+        busy = make_wedding('busy', days_ahead=60)
+        Budget.objects.create(wedding=busy, category='venue', item_name='Hall', estimated_cost=500, actual_cost=650)
+        Budget.objects.create(wedding=busy, category='food', item_name='Catering', estimated_cost=300, actual_cost=100)
+        Task.objects.create(wedding=busy, title='Book venue', status='done')
+        Task.objects.create(wedding=busy, title='Send cards', due_date=date.today() - timedelta(days=2))
+        Task.objects.create(wedding=busy, title='Buy rings')
+        for index, rsvp_status in enumerate(['confirmed', 'declined', 'pending', 'pending']):
+            Guest.objects.create(wedding=busy, name=f'Guest {index}', phone=f'07{index:08d}', rsvp_status=rsvp_status)
+        Timeline.objects.create(wedding=busy, event_type='save_date', title='Save the date', date=date.today(), is_completed=True)
+        Timeline.objects.create(wedding=busy, event_type='invitation', title='Invitations', date=date.today())
+        past = make_wedding('past', days_ahead=-10)
+        Task.objects.create(wedding=past, title='Pay caterer', status='done')
+        empty = make_wedding('empty', days_ahead=400)
+        self.weddings = [busy, past, empty]
+        self.analytics = {
+            wedding.id: WeddingAnalyticsService.calculate_analytics(wedding) for wedding in self.weddings
+        }
+
+    def test_vectorized_scores_match_the_scalar_ones(self):
+        columns = HealthScoreEngine.load()
+        scores = HealthScoreEngine.scores(columns)
+        by_pk = {analytics.pk: analytics for analytics in self.analytics.values()}
+        for index, pk in enumerate(columns['pk'].tolist()):
+            analytics = by_pk[pk]
+            for metric in ('budget_health', 'task_health', 'guest_health', 'planning_health', 'overall_health'):
+                with self.subTest(wedding=analytics.wedding_id, metric=metric):
+                    self.assertAlmostEqual(scores[metric][index], getattr(analytics, f'{metric}_score'))
+        self.assertEqual(HealthScoreEngine.write_scores(columns, scores), 0)
+
+    def test_cohorts_span_the_scores_and_rank_past_weddings_as_past(self):
+        call_command('compute_health_cohorts', stdout=io.StringIO())
+        overall = HealthCohortPercentile.objects.get(budget_band='all', months_band='all', metric='overall_health')
+        scores = sorted(round(analytics.overall_health_score, 2) for analytics in self.analytics.values())
+        self.assertEqual(overall.sample_size, 3)
+        self.assertEqual((overall.cutoffs[0], overall.cutoffs[50], overall.cutoffs[100]), tuple(scores))
+        self.assertEqual(HealthCohortPercentile.objects.get(months_band='past', metric='overall_health').sample_size, 1)
+
+        past = self.weddings[1]
+        ranks = HealthCohorts.rank(past, self.analytics[past.id])
+        # One wedding is too small a cohort, so the overall one is used
+        self.assertEqual(ranks['cohort'], {'budget_band': 'all', 'months_band': 'all', 'size': 3})
+        # Two of the three weddings score 100, so they share the top half of the cutoffs
+        self.assertEqual(ranks['percentiles']['overall_health'], 76)
+        self.assertIsNone(ranks['percentiles']['rsvp_response'])
+
+        HealthCohortPercentile.objects.update(sample_size=MIN_COHORT_SIZE)
+        ranks = HealthCohorts.rank(past, self.analytics[past.id])
+        self.assertEqual(ranks['cohort']['months_band'], 'past')
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_rebuilding_the_cohorts_clears_cached_ranks(self):
+        cache.clear()
+        busy = self.weddings[0]
+        client = APIClient()
+        client.force_authenticate(busy.user)
+        url = f'/api/weddings/{busy.id}/analytics/health/'
+        self.assertIsNone(client.get(url).data['overall_health']['percentile'])
+
+        # The stored scores are already right, so no wedding is rescored
+        call_command('compute_health_cohorts', stdout=io.StringIO())
+        self.assertEqual(json.loads(client.get(url).content)['overall_health']['percentile'], 0)
+
+    def test_percentile_rank(self):
+        cutoffs = list(range(0, 101))
+        self.assertEqual(HealthCohorts.percentile_rank(cutoffs, 36.5), 37)
+        self.assertEqual(HealthCohorts.percentile_rank(cutoffs, 150), 100)
+        self.assertEqual(HealthCohorts.percentile_rank(cutoffs, -5), 0)
+        # A score every wedding shares ranks in the middle, not last
+        self.assertEqual(HealthCohorts.percentile_rank([80] * 101, 80), 50)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AnalyticsQueryCountTests(TestCase):
+    """The detailed analytics endpoint reads everything from one shared pipeline"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('planner', password='secret')
+        self.wedding = Wedding.objects.create(
+            user=self.user, bride_name='Amina', groom_name='Baraka',
+            wedding_date=date.today() + timedelta(days=120), venue='Dar es Salaam', budget=10000000,
+        )
+        for index in range(5):
+            Guest.objects.create(
+                wedding=self.wedding, name=f'Guest {index}', phone='0700000000',
+                rsvp_status=['pending', 'confirmed', 'declined'][index % 3], number_of_guests=1 + index % 2,
+            )
+        Task.objects.create(wedding=self.wedding, title='Book venue', status='done')
+        Task.objects.create(wedding=self.wedding, title='Send cards', due_date=date.today() - timedelta(days=1))
+        Budget.objects.create(wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=500, actual_cost=450)
+        Vendor.objects.create(
+            wedding=self.wedding, vendor_type='catering', business_name='Caterer',
+            contact_person='Juma', phone='0711000000', quote=300,
+        )
+        Timeline.objects.create(wedding=self.wedding, event_type='ceremony', title='Ceremony', date=self.wedding.wedding_date)
+        WeddingAnalyticsService.calculate_analytics(self.wedding)
+        WeddingAnalyticsService.calculate_engagement_metrics(self.wedding)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_detailed_costs_no_more_than_basic(self):
+        basic = self.count_queries(f'/api/weddings/{self.wedding.id}/analytics/')
+        detailed = self.count_queries(f'/api/weddings/{self.wedding.id}/analytics/detailed/')
+        self.assertLessEqual(detailed, basic)
+
+    def test_detailed_is_a_single_query(self):
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/weddings/{self.wedding.id}/analytics/detailed/')
+        self.assertEqual(response.data['comparison']['guests']['invited'], 5)
+        self.assertEqual(response.data['engagement']['relationship_breakdown']['family'], 0)
+
+
+def make_pledge(username, pledged_amount):
+    user = User.objects.create_user(username, password='secret')
+    wedding = Wedding.objects.create(
+        user=user, bride_name='Neema', groom_name='Daudi',
+        wedding_date=date.today() + timedelta(days=30), venue='Arusha', budget=5000000,
+    )
+    guest = Guest.objects.create(wedding=wedding, name='Uncle Hamisi', phone='0700000001')
+    pledge = GuestPledge.objects.create(guest=guest, wedding=wedding, pledged_amount=pledged_amount)
+    return user, pledge
+
+
+class PledgeLedgerTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('treasurer', Decimal('100000'))
+
+    def record(self, amount):
+        return PledgeLedger.record_payment(
+            self.pledge, amount=Decimal(amount), payment_date=date.today(),
+            payment_method='cash', recorded_by=self.user,
+        )
+
+    def test_status_and_balance_follow_payments(self):
+        self.record('40000')
+        self.assertEqual(self.pledge.paid_amount, Decimal('40000'))
+        self.assertEqual(self.pledge.balance, Decimal('60000'))
+        self.assertEqual(self.pledge.payment_status, 'partial')
+
+        self.record('60000')
+        self.assertEqual(self.pledge.balance, 0)
+        self.assertEqual(self.pledge.payment_status, 'paid')
+
+        PledgeLedger.adjust(self.pledge.pk, Decimal('-100000'))
+        PledgeLedger.refresh_totals(self.pledge)
+        self.assertEqual(self.pledge.payment_status, 'pledged')
+
+    def test_record_payment_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            f'/api/weddings/{self.pledge.wedding_id}/pledges/{self.pledge.id}/record_payment/',
+            {'amount': '25000', 'payment_date': date.today().isoformat(), 'payment_method': 'mobile_money'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['paid_amount']), Decimal('25000'))
+        self.assertEqual(response.data['payment_status'], 'partial')
+
+    def test_paid_amount_on_create_is_recorded_as_a_payment(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/weddings/{self.pledge.wedding_id}/pledges/'
+        guest = Guest.objects.create(wedding=self.pledge.wedding, name='Shangazi Rehema', phone='0754111222')
+        response = client.post(
+            url, {'guest': guest.id, 'pledged_amount': '10000', 'paid_amount': '4000', 'payment_method': 'cash'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['paid_amount']), Decimal('4000'))
+        self.assertEqual(response.data['payment_status'], 'partial')
+        payment = PledgePayment.objects.get(pledge_id=response.data['id'])
+        self.assertEqual((payment.amount, payment.payment_method, payment.recorded_by), (Decimal('4000'), 'cash', self.user))
+        self.assertFalse(PledgeReconciliation.drifted(GuestPledge.objects.filter(wedding=self.pledge.wedding)).exists())
+
+        response = client.post(url, {'guest': guest.id, 'pledged_amount': '10000', 'paid_amount': '-5'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('paid_amount', response.data)
+        self.assertEqual(GuestPledge.objects.filter(guest=guest).count(), 1)
+
+    def test_editing_a_pledge_keeps_the_payments_recorded_meanwhile(self):
+        stale = GuestPledge.objects.get(pk=self.pledge.pk)
+        self.record('40000')
+        PledgeLedger.update_pledge(stale, notes='Will pay the rest in June')
+        self.pledge.refresh_from_db()
+        self.assertEqual((self.pledge.paid_amount, self.pledge.balance), (Decimal('40000'), Decimal('60000')))
+        self.assertEqual(self.pledge.notes, 'Will pay the rest in June')
+
+    def test_pledge_put_cannot_set_the_ledger_columns(self):
+        self.record('40000')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.put(
+            f'/api/weddings/{self.pledge.wedding_id}/pledges/{self.pledge.id}/',
+            {
+                'guest': self.pledge.guest_id, 'pledged_amount': '50000', 'paid_amount': '0',
+                'balance': '50000', 'payment_status': 'pledged',
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(response.data['paid_amount']), Decimal('40000'))
+        self.assertEqual(Decimal(response.data['balance']), Decimal('10000'))
+        self.assertEqual(response.data['payment_status'], 'partial')
+        self.pledge.refresh_from_db()
+        self.assertEqual((self.pledge.paid_amount, self.pledge.balance), (Decimal('40000'), Decimal('10000')))
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serializes every writer, so there is no race to test')
+class PledgeLedgerConcurrencyTests(TransactionTestCase):
+    """Many committee members recording payments against one pledge at once"""
+    threads = 16
+    payments_per_thread = 25
+
+    def test_concurrent_payments_are_not_lost(self):
+        user, pledge = make_pledge('committee', Decimal('1000000'))
+        start = threading.Barrier(self.threads)
+        errors = []
+
+        def record_payments():
+            try:
+                start.wait()
+                for _ in range(self.payments_per_thread):
+                    PledgeLedger.record_payment(
+                        pledge, amount=Decimal('1000'), payment_date=date.today(),
+                        payment_method='mobile_money', recorded_by=user,
+                    )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=record_payments) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        total = Decimal('1000') * self.threads * self.payments_per_thread
+        pledge.refresh_from_db()
+        self.assertEqual(PledgePayment.objects.filter(pledge=pledge).count(), self.threads * self.payments_per_thread)
+        self.assertEqual(pledge.paid_amount, total)
+        self.assertEqual(pledge.balance, pledge.pledged_amount - total)
+        self.assertEqual(pledge.payment_status, 'partial')
+
+
+class MobileMoneyImportTests(TestCase):
+    statement = (
+        'Receipt No.,Completion Time,Details,Paid In,Withdrawn\n'
+        'QK1AAA111,2024-03-12 16:15:00,Funds received from 255700000001 - HAMISI,"50,000.00",\n'
+        'QK1AAA222,2024-03-12 17:00:00,Pay bill charge,,500.00\n'
+        'QK1AAA333,2024-03-13 09:30:00,Funds received from 0799999999 - STRANGER,10000,\n'
+        'QK1AAA111,2024-03-12 16:15:00,Funds received from 255700000001 - HAMISI,"50,000.00",\n'
+    )
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('collector', Decimal('80000'))
+        self.wedding = self.pledge.wedding
+
+    def test_statement_import(self):
+        result = MobileMoneyImport(self.wedding).run(read_statement(io.StringIO(self.statement)))
+        self.assertEqual(result['imported'], 1)
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual(result['duplicates'], ['QK1AAA111'])
+        self.assertEqual(result['unmatched'][0]['reason'], 'No guest with this phone number')
+
+        self.pledge.refresh_from_db()
+        self.assertEqual(self.pledge.paid_amount, Decimal('50000'))
+        self.assertEqual(self.pledge.payment_status, 'partial')
+        self.assertEqual(self.pledge.payments.get().payment_date, date(2024, 3, 12))
+
+        again = MobileMoneyImport(self.wedding).run(read_statement(io.StringIO(self.statement)))
+        self.assertEqual(again['imported'], 0)
+        self.assertEqual(sorted(again['duplicates']), ['QK1AAA111', 'QK1AAA111'])
+
+    def test_sms_import(self):
+        messages = split_messages(
+            'QK2BBB111 Confirmed. You have received Tsh30,000.00 from 255700000001 - HAMISI '
+            'on 14/3/24 at 4:15 PM New M-Pesa balance is Tsh130,000.00.\n\n'
+            'Umepokea TSh 10,000 kutoka 0700 000 001 HAMISI. Kumbukumbu: 7012345678. Salio TSh 5,000'
+        )
+        transactions = list(read_messages(messages))
+        self.assertEqual([t['reference'] for t in transactions], ['QK2BBB111', '7012345678'])
+        self.assertEqual([t['amount'] for t in transactions], [Decimal('30000.00'), Decimal('10000')])
+
+        result = MobileMoneyImport(self.wedding).run(transactions)
+        self.assertEqual(result['imported'], 2)
+        self.pledge.refresh_from_db()
+        self.assertEqual(self.pledge.paid_amount, Decimal('40000'))
+        self.assertEqual(self.pledge.balance, Decimal('40000'))
+
+
+@override_settings(PLEDGE_TOTALS_DENORMALIZED=True)
+class PledgeSummaryTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('board', Decimal('100000'))
+        self.wedding = self.pledge.wedding
+
+    def assertTotalsMatchPledges(self):
+        stored = PledgeSummary.for_wedding(self.wedding.id)
+        computed = PledgeSummary.compute(Wedding.objects.filter(pk=self.wedding.id))[self.wedding.id]
+        self.assertEqual(stored, computed)
+        return stored
+
+    def test_totals_follow_every_change(self):
+        other = GuestPledge.objects.create(guest=self.pledge.guest, wedding=self.wedding, pledged_amount=20000)
+        PledgeLedger.record_payment(
+            self.pledge, amount=Decimal('30000'), payment_date=date.today(), payment_method='cash',
+        )
+        PledgeLedger.apply_deltas({self.pledge.pk: Decimal('70000'), other.pk: Decimal('5000')})
+        other.refresh_from_db()
+        other.pledged_amount = Decimal('5000')
+        other.save()
+        totals = self.assertTotalsMatchPledges()
+        self.assertEqual(totals['paid_count'], 2)
+        self.assertEqual(totals['total_paid'], Decimal('105000'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pledge.delete()
+        totals = self.assertTotalsMatchPledges()
+        self.assertEqual(totals['pledge_count'], 1)
+
+    def test_deleting_the_owner_leaves_no_totals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(PledgeTotals.objects.filter(wedding_id=self.wedding.id).exists())
+
+    def test_summary_endpoints_read_one_row(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/weddings/{self.wedding.id}/pledges/summary/')
+        self.assertEqual(response.data['total_pledged'], '100000.00')
+        self.assertEqual(response.data['unpaid_count'], 1)
+
+        stranger = User.objects.create_user('stranger', password='secret')
+        client.force_authenticate(stranger)
+        self.assertEqual(client.get(f'/api/weddings/{self.wedding.id}/pledges/summary/').status_code, 404)
+
+
+class PledgeListQueryTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('lister', Decimal('50000'))
+        self.wedding = self.pledge.wedding
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/weddings/{self.wedding.id}/pledges/'
+
+    def add_pledges(self, count):
+        for index in range(count):
+            guest = Guest.objects.create(wedding=self.wedding, name=f'Pledger {index}', phone=f'07100000{index:02d}')
+            pledge = GuestPledge.objects.create(guest=guest, wedding=self.wedding, pledged_amount=10000)
+            for day in (1, 2):
+                PledgeLedger.record_payment(
+                    pledge, amount=Decimal('1000'), payment_date=date.today() - timedelta(days=day),
+                    payment_method='cash', recorded_by=self.user,
+                )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_list_queries_do_not_grow_with_pledges(self):
+        self.add_pledges(2)
+        few, _ = self.count_queries(self.url)
+        expanded_few, _ = self.count_queries(f'{self.url}?expand=payments')
+        self.add_pledges(20)
+        many, response = self.count_queries(self.url)
+        expanded_many, expanded = self.count_queries(f'{self.url}?expand=payments')
+        self.assertEqual(few, many)
+        self.assertEqual(expanded_few, expanded_many)
+
+        row = next(row for row in response.data if row['guest_name'] == 'Pledger 0')
+        self.assertNotIn('payments', row)
+        self.assertEqual(row['payment_count'], 2)
+        self.assertEqual(row['last_payment_date'], (date.today() - timedelta(days=1)).isoformat())
+        row = next(row for row in expanded.data if row['guest_name'] == 'Pledger 0')
+        self.assertEqual(row['payments'][0]['recorded_by_username'], 'lister')
+
+    def test_detail_has_payment_history(self):
+        self.add_pledges(1)
+        pledge = GuestPledge.objects.get(guest__name='Pledger 0')
+        response = self.client.get(f'{self.url}{pledge.id}/')
+        self.assertEqual(len(response.data['payments']), 2)
+
+
+@override_settings(PLEDGE_TOTALS_DENORMALIZED=True)
+class PledgeReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('auditor', Decimal('60000'))
+        self.wedding = self.pledge.wedding
+        self.payment = PledgeLedger.record_payment(
+            self.pledge, amount=Decimal('20000'), payment_date=date.today(),
+            payment_method='cash', recorded_by=self.user,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payment_url = f'/api/weddings/{self.wedding.id}/pledges/{self.pledge.id}/payments/{self.payment.id}/'
+
+    def test_payment_edit_and_delete_adjust_the_pledge(self):
+        response = self.client.put(self.payment_url, {
+            'amount': '60000', 'payment_date': date.today().isoformat(), 'payment_method': 'cash',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.pledge.refresh_from_db()
+        self.assertEqual((self.pledge.paid_amount, self.pledge.payment_status), (Decimal('60000'), 'paid'))
+
+        self.assertEqual(self.client.delete(self.payment_url).status_code, 204)
+        self.pledge.refresh_from_db()
+        self.assertEqual((self.pledge.paid_amount, self.pledge.payment_status), (Decimal('0'), 'pledged'))
+        self.assertFalse(PledgeReconciliation.drifted().exists())
+        self.assertEqual(PledgeSummary.for_wedding(self.wedding.id)['total_paid'], 0)
+
+    def test_drift_is_found_and_repaired(self):
+        # A write that bypassed the ledger
+        PledgePayment.objects.filter(pk=self.payment.pk).update(amount=Decimal('25000'))
+        cancelled = GuestPledge.objects.create(
+            guest=self.pledge.guest, wedding=self.wedding, pledged_amount=1000, payment_status='cancelled',
+        )
+        GuestPledge.objects.filter(pk=cancelled.pk).update(payment_status='cancelled')
+
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/pledges/reconcile/')
+        self.assertEqual([row['pledge'] for row in response.data['drifted']], [self.pledge.id])
+        self.assertEqual(response.data['drifted'][0]['expected_paid_amount'], Decimal('25000'))
+
+        response = self.client.post(f'/api/weddings/{self.wedding.id}/pledges/reconcile/')
+        self.assertEqual(response.data['repaired'], 1)
+        self.pledge.refresh_from_db()
+        self.assertEqual((self.pledge.paid_amount, self.pledge.balance), (Decimal('25000'), Decimal('35000')))
+        self.assertFalse(PledgeReconciliation.drifted().exists())
+        self.assertEqual(PledgeSummary.for_wedding(self.wedding.id)['total_paid'], Decimal('25000'))
+
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user, pledge = make_pledge('pager', Decimal('1000'))
+        self.wedding = pledge.wedding
+        for index in range(6):
+            Guest.objects.create(wedding=self.wedding, name=f'Paged {index}', phone='0700000002')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/weddings/{self.wedding.id}/guests/'
+
+    def test_lists_stay_plain_without_paging_parameters(self):
+        response = self.client.get(self.url)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual(len(response.data), 7)
+
+    def test_pages_cover_every_row_once(self):
+        response = self.client.get(self.url, {'page_size': 3, 'count': 'true'})
+        self.assertEqual(response.data['count'], 7)
+        names = [row['name'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertNotIn('count', response.data)
+            names += [row['name'] for row in response.data['results']]
+        self.assertEqual(names, ['Uncle Hamisi'] + [f'Paged {index}' for index in range(6)])
+
+
+class WeddingListTests(TestCase):
+
+    def setUp(self):
+        self.user, pledge = make_pledge('planner', Decimal('1000'))
+        self.wedding = pledge.wedding
+        Guest.objects.create(wedding=self.wedding, name='Shangazi', rsvp_status='confirmed')
+        Task.objects.create(wedding=self.wedding, title='Book the hall', status='done')
+        Task.objects.create(wedding=self.wedding, title='Print cards')
+        Budget.objects.create(
+            wedding=self.wedding, category='venue', item_name='Hall', estimated_cost=800000, actual_cost=750000,
+        )
+        Wedding.objects.create(
+            user=self.user, bride_name='Rehema', groom_name='Juma',
+            wedding_date=date.today() + timedelta(days=90), venue='Moshi', budget=1000000,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_counts_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/weddings/')
+        self.assertEqual(len(queries), 1)
+        row = next(row for row in response.data if row['id'] == self.wedding.id)
+        self.assertNotIn('guests', row)
+        self.assertEqual(
+            (row['guest_count'], row['confirmed_guest_count'], row['task_count'], row['completed_task_count']),
+            (2, 1, 2, 1),
+        )
+        self.assertEqual(Decimal(row['total_spent']), Decimal('750000'))
+        empty = next(row for row in response.data if row['id'] != self.wedding.id)
+        self.assertEqual((empty['guest_count'], Decimal(empty['total_spent'])), (0, Decimal('0')))
+
+    def test_expanded_collections_are_prefetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/weddings/', {'expand': 'guests,tasks'})
+        self.assertEqual(len(queries), 3)
+        row = next(row for row in response.data if row['id'] == self.wedding.id)
+        self.assertEqual((len(row['guests']), len(row['tasks'])), (2, 2))
+        self.assertNotIn('budget_items', row)
+
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/')
+        self.assertEqual(len(response.data['budget_items']), 1)
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/', {'expand': 'tasks'})
+        self.assertEqual(set(WEDDING_COLLECTIONS) & set(response.data), {'tasks'})
+
+
+class SparseFieldsTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('sparse', Decimal('40000'))
+        self.wedding = self.pledge.wedding
+        vendor = Vendor.objects.create(
+            wedding=self.wedding, vendor_type='catering', business_name='Mama Lishe', contact_person='Mama',
+            phone='0700000003',
+        )
+        vendor.note_entries.create(content='Tasting on Friday', created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_guest_list_selects_only_rendered_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/weddings/{self.wedding.id}/guests/', {'fields': 'name,rsvp_status'})
+        self.assertEqual(response.data, [{'id': self.pledge.guest_id, 'name': 'Uncle Hamisi', 'rsvp_status': 'pending'}])
+        select = queries.captured_queries[-1]['sql']
+        self.assertIn('"name"', select)
+        self.assertNotIn('"dietary_restrictions"', select)
+
+    def test_omitted_nested_collection_is_not_prefetched(self):
+        url = f'/api/weddings/{self.wedding.id}/vendors/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data[0]['note_entries']), 1)
+        full = len(queries)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'omit': 'note_entries'})
+        self.assertNotIn('note_entries', response.data[0])
+        self.assertEqual(response.data[0]['remaining_amount'], None)
+        self.assertEqual(len(queries), full - 1)
+
+    def test_pledge_list_keeps_related_columns(self):
+        response = self.client.get(
+            f'/api/weddings/{self.wedding.id}/pledges/', {'fields': 'guest_name,payment_progress', 'page_size': 10},
+        )
+        self.assertEqual(response.data['results'], [{'id': self.pledge.id, 'guest_name': 'Uncle Hamisi', 'payment_progress': 0}])
+
+    def test_writes_ignore_sparse_parameters(self):
+        response = self.client.post(
+            f'/api/weddings/{self.wedding.id}/tasks/?fields=title', {'title': 'Hire a DJ', 'status': 'todo'},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('status', response.data)
+
+
+class DeltaSyncTests(TestCase):
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user, self.pledge = make_pledge('syncer', Decimal('30000'))
+            self.wedding = self.pledge.wedding
+            self.task = Task.objects.create(wedding=self.wedding, title='Order the cake')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/weddings/{self.wedding.id}/sync/'
+
+    def test_first_sync_sends_every_row(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['full'])
+        self.assertEqual([row['id'] for row in response.data['changes']['tasks']], [self.task.id])
+        self.assertEqual(response.data['changes']['pledges'][0]['guest_name'], 'Uncle Hamisi')
+        self.assertNotIn('guests', response.data['changes']['weddings'][0])
+
+    def test_sync_returns_changes_and_tombstones_after_the_cursor(self):
+        cursor = self.client.get(self.url).data['cursor']
+        task_id = self.task.id
+        with self.captureOnCommitCallbacks(execute=True):
+            guest = Guest.objects.create(wedding=self.wedding, name='Bi Mwanaisha')
+            payment = PledgeLedger.record_payment(
+                self.pledge, amount=Decimal('10000'), payment_date=date.today(), payment_method='cash',
+            )
+            self.task.delete()
+
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertFalse(response.data['full'])
+        changes = response.data['changes']
+        self.assertEqual([row['id'] for row in changes['guests']], [guest.id])
+        self.assertEqual([row['id'] for row in changes['pledge_payments']], [payment.id])
+        self.assertEqual(Decimal(changes['pledges'][0]['paid_amount']), Decimal('10000'))
+        self.assertEqual(response.data['deleted'], {'tasks': [task_id]})
+        self.assertGreater(response.data['cursor'], cursor)
+
+        again = self.client.get(self.url, {'since': response.data['cursor']})
+        self.assertEqual((again.data['changes'], again.data['deleted']), ({}, {}))
+
+    def test_rejects_unreadable_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+
+class BulkWriteTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('bulker', Decimal('20000'))
+        self.wedding = self.pledge.wedding
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/weddings/{self.wedding.id}/guests/bulk/'
+
+    def post(self, payload):
+        return self.client.post(self.url, payload, format='json')
+
+    def queries_for(self, count):
+        guests = [{'name': f'Guest {index}', 'phone': f'07{index:08d}'} for index in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'create': guests})
+        self.assertEqual(len(response.data['created']), count)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.assertEqual(self.queries_for(5), self.queries_for(60))
+
+    def test_creates_updates_and_deletes_in_one_request(self):
+        doomed = Guest.objects.create(wedding=self.wedding, name='Binamu', phone='0711000000')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post({
+                'create': [{'name': 'Mjomba', 'phone': '0712 345 678', 'rsvp_status': 'confirmed'}],
+                'update': [{'id': self.pledge.guest_id, 'rsvp_status': 'declined'}],
+                'delete': [doomed.id],
+            })
+        self.assertEqual(response.status_code, 200)
+        created = Guest.objects.get(pk=response.data['created'][0]['id'])
+        self.assertEqual(created.phone_normalized, '+255712345678')
+        self.assertIsNotNone(created.rsvp_responded_at)
+        self.assertEqual(response.data['updated'][0]['rsvp_status'], 'declined')
+        self.assertEqual(response.data['deleted'], [doomed.id])
+
+        analytics = self.wedding.analytics
+        analytics.refresh_from_db()
+        self.assertEqual(
+            (analytics.total_invitations_sent, analytics.total_confirmed, analytics.total_declined),
+            (2, 1, 1),
+        )
+        logged = set(self.wedding.changes.values_list('object_id', 'deleted'))
+        self.assertTrue({(created.id, False), (self.pledge.guest_id, False), (doomed.id, True)} <= logged)
+
+    def test_deleting_a_guest_takes_its_pledge_out_of_the_totals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post({'delete': [self.pledge.guest_id]})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(GuestPledge.objects.filter(pk=self.pledge.pk).exists())
+        self.assertEqual(PledgeSummary.for_wedding(self.wedding.id)['total_pledged'], 0)
+
+    def test_an_invalid_row_writes_nothing(self):
+        response = self.post({
+            'create': [{'name': 'Valid', 'phone': '0712000000'}, {'phone': '0712000001'}],
+            'delete': [999999],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors']['create'][0], {})
+        self.assertIn('name', response.data['errors']['create'][1])
+        self.assertEqual(response.data['errors']['delete'], [{'id': ['Not found']}])
+        self.assertEqual(Guest.objects.filter(wedding=self.wedding).count(), 1)
+
+
+class GuestImportTests(TestCase):
+    guest_list = (
+        'Jina,Simu,Uhusiano,RSVP,Idadi\n'
+        'Mama Neema,0712 345 678,Family,Confirmed,2\n'
+        'Uncle Hamisi,+255 700 000 001,family,,1\n'
+        'Rafiki,0712345678,friend,,1\n'
+        ',0713000000,friend,,1\n'
+        '\n'
+        'Jirani,0755 000 000,,,\n'
+        'Bila Simu,,,,\n'
+    )
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('importer', Decimal('10000'))
+        self.wedding = self.pledge.wedding
+
+    def test_csv_import_skips_duplicates_and_reports_invalid_rows(self):
+        result = GuestImport(self.wedding).run(read_csv(io.StringIO(self.guest_list)), chunk_size=2)
+        self.assertEqual((result['rows'], result['imported']), (6, 2))
+        self.assertEqual([entry['line'] for entry in result['duplicates']], [3, 4])
+        self.assertEqual([entry['line'] for entry in result['errors']], [5, 8])
+        self.assertIn('name', result['errors'][0]['errors'])
+        self.assertIn('phone', result['errors'][1]['errors'])
+
+        mama = Guest.objects.get(wedding=self.wedding, name='Mama Neema')
+        self.assertEqual((mama.phone, mama.relationship, mama.rsvp_status), ('+255712345678', 'family', 'confirmed'))
+        self.assertEqual(mama.number_of_guests, 2)
+        self.assertIsNotNone(mama.rsvp_responded_at)
+        analytics = self.wedding.analytics
+        analytics.refresh_from_db()
+        self.assertEqual((analytics.total_invitations_sent, analytics.total_confirmed), (3, 1))
+
+    def test_dry_run_upload_previews_without_saving(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('guests.csv', self.guest_list.encode('utf-8-sig'), content_type='text/csv')
+        response = client.post(
+            f'/api/weddings/{self.wedding.id}/guests/import/', {'file': upload, 'dry_run': 'true'}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['valid'], response.data['imported']), (2, 0))
+        self.assertEqual([row['name'] for row in response.data['preview']], ['Mama Neema', 'Jirani'])
+        self.assertEqual(Guest.objects.filter(wedding=self.wedding).count(), 1)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_command_import_clears_cached_analytics(self):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/weddings/{self.wedding.id}/analytics/'
+        self.assertEqual(client.get(url).data['total_invitations_sent'], 1)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as handle:
+            handle.write(self.guest_list)
+        self.addCleanup(os.remove, handle.name)
+        call_command('import_guests', str(self.wedding.id), handle.name, stdout=io.StringIO())
+        self.assertEqual(json.loads(client.get(url).content)['total_invitations_sent'], 3)
+
+    @skipIf(Workbook is None, 'XLSX import needs openpyxl')
+    def test_xlsx_upload(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(['Name', 'Phone', 'Relationship', 'RSVP', 'Guests'])
+        sheet.append(['Shangazi Rehema', '0754 111 222', 'Family', 'Confirmed', 3])
+        sheet.append([None, None, None, None, None])
+        sheet.append(['Rafiki', '0712345678', 'friend', None, 1])
+        sheet.append(['Jirani', None, None, None, None])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = SimpleUploadedFile('guests.xlsx', content.getvalue())
+        response = client.post(f'/api/weddings/{self.wedding.id}/guests/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['rows'], response.data['imported']), (3, 2))
+        self.assertEqual([entry['line'] for entry in response.data['errors']], [5])
+        rehema = Guest.objects.get(wedding=self.wedding, name='Shangazi Rehema')
+        self.assertEqual((rehema.phone, rehema.rsvp_status, rehema.number_of_guests), ('+255754111222', 'confirmed', 3))
+
+    def test_vcard_contacts(self):
+        cards = (
+            'BEGIN:VCARD\r\nVERSION:3.0\r\nN:Mushi;Baraka;;;\r\n'
+            'TEL;TYPE=HOME:022 211 0000\r\nTEL;TYPE=CELL:0754 \r\n 111 222\r\nEND:VCARD\r\n'
+            'BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Shangazi Rehema\r\nEMAIL:rehema@example.com\r\nEND:VCARD\r\n'
+        )
+        self.assertEqual(list(read_vcards(io.StringIO(cards))), [
+            (1, {'name': 'Baraka Mushi', 'phone': '0754 111 222'}),
+            (8, {'name': 'Shangazi Rehema', 'email': 'rehema@example.com'}),
+        ])
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('exporter', Decimal('60000'))
+        self.wedding = self.pledge.wedding
+        PledgeLedger.record_payment(
+            self.pledge, amount=Decimal('15000'), payment_date=date(2024, 3, 1), payment_method='mobile_money',
+        )
+        Guest.objects.create(wedding=self.wedding, name='Shangazi, Rehema', phone='0754111222')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, name):
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/export/{name}')
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_guest_csv(self):
+        lines = self.download('guests.csv').lstrip('\ufeff').splitlines()
+        self.assertTrue(lines[0].startswith('id,name,phone,'))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('"Shangazi, Rehema",0754111222', lines[2])
+
+    def test_pledge_and_payment_json_lines(self):
+        pledge, = [json.loads(line) for line in self.download('pledges.jsonl').splitlines()]
+        self.assertEqual(
+            (pledge['guest_name'], pledge['paid_amount'], pledge['balance'], pledge['payment_status']),
+            ('Uncle Hamisi', '15000.00', '45000.00', 'partial'),
+        )
+        payment, = [json.loads(line) for line in self.download('payments.jsonl').splitlines()]
+        self.assertEqual(
+            (payment['pledge_id'], payment['amount'], payment['payment_date'], payment['payment_method']),
+            (self.pledge.id, '15000.00', '2024-03-01', 'mobile_money'),
+        )
+
+    def test_rows_are_read_a_page_at_a_time(self):
+        for index in range(4):
+            Guest.objects.create(wedding=self.wedding, name=f'Guest {index}', phone=f'07{index:08d}')
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(export_rows('guests', self.wedding.id, chunk_size=2))
+        self.assertEqual([row[0] for row in rows], sorted(self.wedding.guests.values_list('id', flat=True)))
+        self.assertEqual(len(queries), 4)
+
+    def test_unknown_export(self):
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/export/photos.csv')
+        self.assertEqual(response.status_code, 404)
+
+
+class ListFilterTests(TestCase):
+
+    def setUp(self):
+        self.user, self.pledge = make_pledge('filterer', Decimal('30000'))
+        self.wedding = self.pledge.wedding
+        Guest.objects.create(wedding=self.wedding, name='Bibi', phone='0711000001', relationship='family', email='bibi@example.com')
+        Guest.objects.create(wedding=self.wedding, name='Rafiki', phone='0711000002', relationship='friend', number_of_guests=3)
+        Guest.objects.create(wedding=self.wedding, name='Mjomba', phone='0711000003', relationship='family', rsvp_status='confirmed')
+        today = date.today()
+        Task.objects.create(wedding=self.wedding, title='Book venue', priority='high', due_date=today - timedelta(days=2))
+        Task.objects.create(wedding=self.wedding, title='Print cards', priority='high', due_date=today + timedelta(days=5))
+        Task.objects.create(wedding=self.wedding, title='Taste cake', priority='low', due_date=today - timedelta(days=1), assigned_to='Neema')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, url, key='name'):
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/{url}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row[key] for row in response.data]
+
+    def plan(self, view, params):
+        queryset = view.serializer_class.Meta.model.objects.filter(wedding_id=self.wedding.id)
+        for param, declared in view.list_filters.items():
+            queryset = declared.filter(queryset, param, params)
+        return queryset.explain()
+
+    def test_guest_filters_and_ordering(self):
+        self.assertEqual(self.names('guests/?rsvp_status=pending&relationship=family'), ['Bibi'])
+        self.assertEqual(self.names('guests/?has_email=true'), ['Bibi'])
+        self.assertEqual(self.names('guests/?number_of_guests__gte=2'), ['Rafiki'])
+        self.assertEqual(self.names('guests/?ordering=-name'), ['Uncle Hamisi', 'Rafiki', 'Mjomba', 'Bibi'])
+
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/guests/?rsvp_status=maybe')
+        self.assertEqual(response.status_code, 400)
+
+    def test_overdue_high_priority_tasks(self):
+        yesterday = date.today() - timedelta(days=1)
+        url = f'tasks/?status=todo,in_progress&priority=high&due_date__lte={yesterday}'
+        self.assertEqual(self.names(url, 'title'), ['Book venue'])
+        self.assertEqual(self.names('tasks/?assigned_to=Neema', 'title'), ['Taste cake'])
+        self.assertEqual(self.names('tasks/?ordering=-due_date', 'title'), ['Print cards', 'Taste cake', 'Book venue'])
+
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/tasks/?due_date__lt=someday')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/tasks/?ordering=due_date&page_size=2')
+        self.assertEqual(response.status_code, 400)
+
+    def test_pledges_with_a_balance_page_in_the_requested_order(self):
+        other = Guest.objects.get(name='Bibi')
+        GuestPledge.objects.create(guest=other, wedding=self.wedding, pledged_amount=Decimal('50000'))
+        PledgeLedger.record_payment(self.pledge, amount=Decimal('30000'), payment_date=date.today(), payment_method='cash')
+
+        response = self.client.get(f'/api/weddings/{self.wedding.id}/pledges/?balance__gt=0&ordering=-balance&page_size=1')
+        self.assertEqual([row['id'] for row in response.data['results']], [other.pledges.get().id])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(self.names('pledges/?payment_status=paid', 'id'), [self.pledge.id])
+
+    def test_filters_use_the_composite_indexes(self):
+        self.assertIn('guest_wedding_rsvp_idx', self.plan(GuestViewSet, {'rsvp_status': 'pending', 'relationship': 'family'}))
+        self.assertIn('task_wedding_status_idx', self.plan(TaskViewSet, {'status': 'todo', 'due_date__lt': str(date.today())}))
+        self.assertIn('task_wedding_priority_idx', self.plan(TaskViewSet, {'priority': 'high', 'due_date__lt': str(date.today())}))
+        self.assertIn('vendor_wedding_status_idx', self.plan(VendorViewSet, {'status': 'booked'}))
+        self.assertIn('pledge_wedding_status_idx', self.plan(GuestPledgeViewSet, {'payment_status': 'partial', 'balance__gt': '0'}))
@@ -6,6 +6,7 @@ from rest_framework.response import Response
 from rest_framework.routers import DefaultRouter
 
 from .email_service import WeddingEmailService
+from .headcount import GuestHeadcount
 from .models import Guest, InvitationTemplate, Vendor, Wedding
 from . import analytics_views
 from .views import (
@@ -20,34 +21,38 @@ from .pdf_views import (
     download_vendor_list_pdf,
     download_invitation_pdf,
 )
+from .export_views import download_export
 from .pledge_views import GuestPledgeViewSet, PledgePaymentViewSet
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def send_rsvp_reminders(request, wedding_id):
     wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
-    guests = wedding.guests.filter(rsvp_status='pending')
+    # Only guests with an email address can be reached; the headcount gives the total
+    guests = wedding.guests.filter(rsvp_status='pending').exclude(email__isnull=True).exclude(email='')
     
     count = 0
     for guest in guests:
         if WeddingEmailService.send_rsvp_reminder(guest):
             count += 1
     
-    return Response({'sent': count, 'total': guests.count()})
+    headcount = GuestHeadcount.for_wedding(wedding.id)
+    return Response({'sent': count, 'total': headcount['by_status']['pending']['invitations']})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def send_invitations(request, wedding_id):
     wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
     invitation = get_object_or_404(InvitationTemplate, wedding=wedding)
-    guests = wedding.guests.all()
+    guests = wedding.guests.exclude(email__isnull=True).exclude(email='')
     
     count = 0
     for guest in guests:
         if WeddingEmailService.send_invitation_email(guest, invitation):
             count += 1
     
-    return Response({'sent': count, 'total': guests.count()})
+    headcount = GuestHeadcount.for_wedding(wedding.id)
+    return Response({'sent': count, 'total': headcount['invitations']})
 
 router = DefaultRouter()
 router.register(r'weddings', WeddingViewSet, basename='wedding')
@@ -57,14 +62,18 @@ urlpatterns = [
     
     # Guests
     path('weddings/<int:wedding_id>/guests/', GuestViewSet.as_view({'get': 'list', 'post': 'create'}), name='guest-list'),
+    path('weddings/<int:wedding_id>/guests/bulk/', GuestViewSet.as_view({'post': 'bulk'}), name='guest-bulk'),
+    path('weddings/<int:wedding_id>/guests/import/', GuestViewSet.as_view({'post': 'import_guests'}), name='guest-import'),
     path('weddings/<int:wedding_id>/guests/<int:pk>/', GuestViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='guest-detail'),
     
     # Tasks
     path('weddings/<int:wedding_id>/tasks/', TaskViewSet.as_view({'get': 'list', 'post': 'create'}), name='task-list'),
+    path('weddings/<int:wedding_id>/tasks/bulk/', TaskViewSet.as_view({'post': 'bulk'}), name='task-bulk'),
     path('weddings/<int:wedding_id>/tasks/<int:pk>/', TaskViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='task-detail'),
     
     # Budget
     path('weddings/<int:wedding_id>/budget/', BudgetViewSet.as_view({'get': 'list', 'post': 'create'}), name='budget-list'),
+    path('weddings/<int:wedding_id>/budget/bulk/', BudgetViewSet.as_view({'post': 'bulk'}), name='budget-bulk'),
     path('weddings/<int:wedding_id>/budget/<int:pk>/', BudgetViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='budget-detail'),
     
     # Galleries
@@ -93,6 +102,9 @@ urlpatterns = [
     path('weddings/<int:wedding_id>/pdf/timeline/', download_timeline_pdf, name='pdf-timeline'),
     path('weddings/<int:wedding_id>/pdf/vendors/', download_vendor_list_pdf, name='pdf-vendors'),
     path('weddings/<int:wedding_id>/pdf/invitation/', download_invitation_pdf, name='pdf-invitation'),
+    
+    # Streaming CSV / JSON Lines exports
+    path('weddings/<int:wedding_id>/export/<slug:name>.<slug:file_format>', download_export, name='export'),
 
     # Email
     path('weddings/<int:wedding_id>/email/rsvp-reminders/', send_rsvp_reminders, name='send-rsvp'),
@@ -105,6 +117,7 @@ urlpatterns = [
     # Additional analytics endpoints
     path('weddings/<int:wedding_id>/analytics/detailed/', analytics_views.get_analytics, name='get-analytics'),
     path('weddings/<int:wedding_id>/analytics/trends/', analytics_views.get_trend_data, name='trend-data'),
+    path('weddings/<int:wedding_id>/analytics/trends/series/', analytics_views.get_event_trends, name='event-trends'),
     path('weddings/<int:wedding_id>/analytics/snapshot/', analytics_views.create_snapshot, name='create-snapshot'),
     path('weddings/<int:wedding_id>/analytics/budget-breakdown/', analytics_views.get_category_breakdown, name='category-breakdown'),
     path('weddings/<int:wedding_id>/analytics/timeline/', analytics_views.get_timeline_status, name='timeline-status'),
@@ -114,6 +127,8 @@ urlpatterns = [
     # Pledge tracking
     path('weddings/<int:wedding_id>/pledges/', GuestPledgeViewSet.as_view({'get': 'list', 'post': 'create'}), name='pledge-list'),
     path('weddings/<int:wedding_id>/pledges/<int:pk>/', GuestPledgeViewSet.as_view({'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='pledge-detail'),
+    path('weddings/<int:wedding_id>/pledges/reconcile/', GuestPledgeViewSet.as_view({'get': 'reconcile', 'post': 'reconcile'}), name='pledge-reconcile'),
+    path('weddings/<int:wedding_id>/pledges/import_payments/', GuestPledgeViewSet.as_view({'post': 'import_payments'}), name='pledge-import-payments'),
     path('weddings/<int:wedding_id>/pledges/<int:pk>/record_payment/', GuestPledgeViewSet.as_view({'post': 'record_payment'}), name='pledge-record-payment'),
     
     # Payments
@@ -1,4 +1,11 @@
+import csv
+import io
+import zipfile
+from decimal import Decimal
+
 from django.shortcuts import render, get_object_or_404
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -7,18 +14,67 @@ from .models import (
     Wedding, Guest, Task, Budget, PhotoGallery, Photo,
     Timeline, Vendor, VendorNote, InvitationTemplate
 )
+from .change_log import ChangeLog
+from .filters import ChoiceFilter, DeclaredFiltersBackend, ExactFilter, PresenceFilter, RangeFilter, WeddingOrderingFilter
+from .guest_import import FORMATS as GUEST_IMPORT_FORMATS, GuestImport, guess_format, read_guests
+from .mixins import (
+    AnalyticsCacheInvalidationMixin, BulkWriteMixin, ConditionalListMixin, SparseFieldsQuerysetMixin,
+    requested_expansions,
+)
+from .pagination import WeddingCursorPagination
 from .serializers import (
-    WeddingSerializer, GuestSerializer, TaskSerializer, BudgetSerializer,
+    WEDDING_COLLECTIONS, WeddingListSerializer, WeddingSerializer, GuestSerializer, TaskSerializer, BudgetSerializer,
     PhotoGallerySerializer, PhotoSerializer, TimelineSerializer,
     VendorSerializer, VendorNoteSerializer, InvitationTemplateSerializer
 )
+
+
+def wedding_counts():
+    """Per-wedding guest, task and spending totals as correlated subqueries of one SELECT"""
+    def total(model, aggregate, default=0, **filters):
+        rows = model.objects.filter(wedding=OuterRef('pk'), **filters).order_by().values('wedding')
+        return Coalesce(Subquery(rows.annotate(total=aggregate).values('total')), default)
+    
+    return {
+        'guest_count': total(Guest, Count('pk')),
+        'confirmed_guest_count': total(Guest, Count('pk'), rsvp_status='confirmed'),
+        'task_count': total(Task, Count('pk')),
+        'completed_task_count': total(Task, Count('pk'), status='done'),
+        'total_spent': total(Budget, Sum('actual_cost'), Decimal('0')),
+    }
+
+
 # Create your views here.
-class WeddingViewSet(viewsets.ModelViewSet):
+class WeddingViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
+    wedding_lookup_kwarg = 'pk'
     serializer_class = WeddingSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Wedding.objects.filter(user=self.request.user)
+        queryset = Wedding.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            queryset = queryset.annotate(**wedding_counts())
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related(*self.rendered_collections())
+        return queryset
+    
+    def rendered_collections(self):
+        """Nested collections to return: those named in ?expand, or all of them on the detail route by default"""
+        if self.action != 'list' and 'expand' not in self.request.query_params:
+            return list(WEDDING_COLLECTIONS)
+        expanded = requested_expansions(self.request)
+        return [name for name in WEDDING_COLLECTIONS if name in expanded]
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return WeddingListSerializer
+        return WeddingSerializer
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve'):
+            context['collections'] = self.rendered_collections()
+        return context
     
     def create(self, request, *args, **kwargs):
         print("=" * 50)
@@ -37,6 +93,19 @@ class WeddingViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
     
+    @action(detail=True, methods=['get'])
+    def sync(self, request, pk=None):
+        """Rows changed or deleted since ?since=<cursor>; every row without one"""
+        wedding = self.get_object()
+        try:
+            since = int(request.query_params.get('since') or 0)
+        except ValueError:
+            return Response(
+                {'error': 'since must be a cursor returned by an earlier sync'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(ChangeLog.changes_since(wedding.id, since, context=self.get_serializer_context()))
+    
     @action(detail=True, methods=['get'])
     def summary(self, request, pk=None):
         wedding = self.get_object()
@@ -54,9 +123,19 @@ class WeddingViewSet(viewsets.ModelViewSet):
         })
 
 
-class GuestViewSet(viewsets.ModelViewSet):
+class GuestViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, BulkWriteMixin, ConditionalListMixin,
+                   viewsets.ModelViewSet):
     serializer_class = GuestSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
+    filter_backends = [DeclaredFiltersBackend, WeddingOrderingFilter]
+    list_filters = {
+        'rsvp_status': ChoiceFilter('rsvp_status'),
+        'relationship': ChoiceFilter('relationship'),
+        'has_email': PresenceFilter('email'),
+        'number_of_guests': RangeFilter('number_of_guests'),
+    }
+    ordering_fields = ['name', 'rsvp_status', 'number_of_guests', 'created_at']
     
     def get_queryset(self):
         wedding_id = self.kwargs.get('wedding_id')
@@ -80,11 +159,48 @@ class GuestViewSet(viewsets.ModelViewSet):
         wedding_id = self.kwargs.get('wedding_id')
         wedding = Wedding.objects.get(id=wedding_id, user=self.request.user)
         serializer.save(wedding=wedding) 
+    
+    def import_guests(self, request, wedding_id=None):
+        """Import a guest list upload (`file`: CSV, XLSX or vCard); `dry_run` only previews it"""
+        wedding = get_object_or_404(Wedding, id=wedding_id, user=request.user)
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload the guest list as file'}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('format') or guess_format(upload.name)
+        if file_format not in GUEST_IMPORT_FORMATS:
+            return Response(
+                {'error': f"Unsupported file type; use one of {', '.join(GUEST_IMPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        
+        file = upload.file
+        if file_format != 'xlsx':
+            file = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            result = GuestImport(wedding, dry_run=dry_run, context=self.get_serializer_context()).run(
+                read_guests(file_format, file)
+            )
+        except (ValueError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+            return Response({'error': f'Could not read the guest list: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(result, status=status.HTTP_201_CREATED if result['imported'] else status.HTTP_200_OK)
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, BulkWriteMixin, ConditionalListMixin,
+                  viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
+    filter_backends = [DeclaredFiltersBackend, WeddingOrderingFilter]
+    list_filters = {
+        'status': ChoiceFilter('status'),
+        'priority': ChoiceFilter('priority'),
+        'due_date': RangeFilter('due_date'),
+        'assigned_to': ExactFilter('assigned_to'),
+    }
+    ordering_fields = ['due_date', 'priority', 'status', 'title', 'created_at']
     
     def get_queryset(self):
         wedding_id = self.kwargs.get('wedding_id')
@@ -96,9 +212,10 @@ class TaskViewSet(viewsets.ModelViewSet):
         serializer.save(wedding=wedding)
 
 
-class BudgetViewSet(viewsets.ModelViewSet):
+class BudgetViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, BulkWriteMixin, viewsets.ModelViewSet):
     serializer_class = BudgetSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
     
     def get_queryset(self):
         wedding_id = self.kwargs.get('wedding_id')
@@ -109,13 +226,16 @@ class BudgetViewSet(viewsets.ModelViewSet):
         wedding = get_object_or_404(Wedding, id=wedding_id, user=self.request.user)
         serializer.save(wedding=wedding)
 
-class PhotoGalleryViewSet(viewsets.ModelViewSet):
+class PhotoGalleryViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = PhotoGallerySerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         wedding_id = self.kwargs.get('wedding_id')
-        return PhotoGallery.objects.filter(wedding_id=wedding_id, wedding__user=self.request.user)
+        queryset = PhotoGallery.objects.filter(wedding_id=wedding_id, wedding__user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related('photos')
+        return queryset
     
     def perform_create(self, serializer):
         wedding_id = self.kwargs.get('wedding_id')
@@ -123,9 +243,11 @@ class PhotoGalleryViewSet(viewsets.ModelViewSet):
         serializer.save(wedding=wedding)
 
 
-class PhotoViewSet(viewsets.ModelViewSet):
+class PhotoViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = PhotoSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
+    cursor_ordering = ('-uploaded_at', '-id')
     
     def get_queryset(self):
         album_id = self.kwargs.get('album_id')
@@ -137,7 +259,7 @@ class PhotoViewSet(viewsets.ModelViewSet):
         serializer.save(album=album, uploaded_by=self.request.user)
 
 
-class TimelineViewSet(viewsets.ModelViewSet):
+class TimelineViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = TimelineSerializer
     permission_classes = [IsAuthenticated]
     
@@ -158,13 +280,25 @@ class TimelineViewSet(viewsets.ModelViewSet):
         return Response({'status': 'completed' if event.is_completed else 'pending'})
 
 
-class VendorViewSet(viewsets.ModelViewSet):
+class VendorViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = VendorSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WeddingCursorPagination
+    filter_backends = [DeclaredFiltersBackend, WeddingOrderingFilter]
+    list_filters = {
+        'status': ChoiceFilter('status'),
+        'vendor_type': ChoiceFilter('vendor_type'),
+    }
+    ordering_fields = ['business_name', 'vendor_type', 'status', 'quote', 'created_at']
     
     def get_queryset(self):
         wedding_id = self.kwargs.get('wedding_id')
-        return Vendor.objects.filter(wedding_id=wedding_id, wedding__user=self.request.user)
+        queryset = Vendor.objects.filter(wedding_id=wedding_id, wedding__user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.prefetch_related(
+                Prefetch('note_entries', queryset=VendorNote.objects.select_related('created_by'))
+            )
+        return queryset
     
     def perform_create(self, serializer):
         wedding_id = self.kwargs.get('wedding_id')
@@ -181,7 +315,7 @@ class VendorViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class InvitationTemplateViewSet(viewsets.ModelViewSet):
+class InvitationTemplateViewSet(AnalyticsCacheInvalidationMixin, SparseFieldsQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = InvitationTemplateSerializer
     permission_classes = [IsAuthenticated]
     